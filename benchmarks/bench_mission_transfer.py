@@ -0,0 +1,70 @@
+import os, sys, threading, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymavlink import mavutil
+from mission_transfer import MissionTransferEngine
+from waypoint_store import make_waypoints, MISSION_TYPE_COMMANDS
+from sim_vehicle import SimulatedVehicle
+
+PORT = 14590
+ITEM_COUNTS = [100, 500]
+LOSS_RATES = [0.0, 0.02, 0.1]
+
+def make_items(count):
+    steps = np.arange(count) * 1e-5
+    items = make_waypoints(45.0 + steps, -75.0 + steps, 50.0)
+    items["command"][0] = MISSION_TYPE_COMMANDS["Takeoff"]
+    items["command"][-1] = MISSION_TYPE_COMMANDS["Land"]
+    return items
+
+def pump(connection, engine, stop):
+    # Stands in for the telemetry hub's receive thread
+    while not stop.is_set():
+        msg = connection.recv_match(blocking=True, timeout=0.1)
+        if msg is not None:
+            engine.handle_message(msg)
+
+def run_case(count, loss):
+    vehicle = SimulatedVehicle(f"udpout:127.0.0.1:{PORT}", loss=loss, seed=count)
+    gcs = mavutil.mavlink_connection(f"udpin:127.0.0.1:{PORT}", source_system=255)
+    vehicle.start()
+    try:
+        gcs.wait_heartbeat(timeout=5)
+        engine = MissionTransferEngine(gcs.mav, gcs.target_system, gcs.target_component,
+                                       timeout=0.2, max_retries=20)
+        stop = threading.Event()
+        reader = threading.Thread(target=pump, args=(gcs, engine, stop), daemon=True)
+        reader.start()
+
+        items = make_items(count)
+        start = time.perf_counter()
+        engine.upload(items)
+        upload_s = time.perf_counter() - start
+        upload_retx = engine.retransmissions
+
+        engine.retransmissions = 0
+        start = time.perf_counter()
+        downloaded = engine.download()
+        download_s = time.perf_counter() - start
+
+        stop.set()
+        reader.join()
+        assert len(downloaded) == count
+        assert np.allclose(items["latitude"], downloaded["latitude"], atol=1e-6)
+        assert np.array_equal(items["command"], downloaded["command"])
+        return upload_s, upload_retx, download_s, engine.retransmissions
+    finally:
+        vehicle.stop()
+        gcs.close()
+
+def main():
+    print(f"{'items':>6}{'loss':>7}{'up items/s':>12}{'up retx':>9}{'down items/s':>14}{'down retx':>11}")
+    for count in ITEM_COUNTS:
+        for loss in LOSS_RATES:
+            upload_s, upload_retx, download_s, download_retx = run_case(count, loss)
+            print(f"{count:>6}{loss:>7.2f}{count / upload_s:>12.0f}{upload_retx:>9}"
+                  f"{count / download_s:>14.0f}{download_retx:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse, os, subprocess, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymavlink import mavutil
+from connection_manager import LinkIOThread, MavlinkLink
+from mavlink_frames import FastDecoder, FrameParser, mavlink2_dialect
+from sim_vehicle import DEFAULT_STREAMS, STREAM_ENCODERS, SimulatedVehicle
+
+# What the pages consume; everything else the vehicles send is overhead for the receive path
+WANTED = ("ATTITUDE", "GLOBAL_POSITION_INT", "RC_CHANNELS")
+# Streamed at the test rate by every simulated vehicle, wanted or not
+HIGH_RATE_STREAMS = ["ATTITUDE", "GLOBAL_POSITION_INT", "RC_CHANNELS", "VFR_HUD", "GPS_RAW_INT"]
+VEHICLES = 3
+RATE = 1000
+DURATION = 5.0
+PORT = 14640
+CAPTURE_SECONDS = 20.0
+
+def capture(vehicles, rate, seconds):
+    # The byte stream several vehicles would send, recorded offline so every decoder sees the same bytes
+    streams = dict(DEFAULT_STREAMS, **{name: rate for name in HIGH_RATE_STREAMS})
+    dialect = mavlink2_dialect()
+    packets = []
+    for system_id in range(1, vehicles + 1):
+        vehicle = SimulatedVehicle(None, system_id=system_id, streams=streams, boot_time=0.0)
+        vehicle.mav = dialect.MAVLink(None, srcSystem=system_id, srcComponent=1)
+        step = 1.0 / rate
+        for index in range(int(seconds * rate)):
+            now = index * step
+            for name in streams:
+                if index % max(1, round(rate / streams[name])) == 0:
+                    packets.append((now, system_id, vehicle.pack(STREAM_ENCODERS[name](vehicle, now))))
+    packets.sort(key=lambda packet: packet[:2])
+    return [packet for _, _, packet in packets]
+
+def decode_costs(packets):
+    # CPU per packet of each receive stage on identical bytes, fed one datagram (packet) at a time
+    dialect = mavlink2_dialect()
+    wanted_ids = {getattr(dialect, f"MAVLINK_MSG_ID_{name}") for name in WANTED}
+    results = []
+
+    mav = dialect.MAVLink(None)
+    mav.robust_parsing = True
+    started = time.process_time()
+    wanted = 0
+    for packet in packets:
+        for msg in mav.parse_buffer(packet) or []:
+            if msg.get_type() in WANTED:
+                wanted += 1
+    results.append(("pymavlink parse_buffer, filter after", time.process_time() - started))
+
+    parser = FrameParser(dialect)
+    started = time.process_time()
+    for packet in packets:
+        parser.feed(packet)
+    results.append(("frame split + checksum only", time.process_time() - started))
+
+    parser, decoder = FrameParser(dialect), FastDecoder(dialect)
+    started = time.process_time()
+    for packet in packets:
+        for frame in parser.feed(packet):
+            decoder.decode(frame[0], frame[4])
+    results.append(("frames + fast decode of every packet", time.process_time() - started))
+
+    parser, decoder = FrameParser(dialect), FastDecoder(dialect)
+    started = time.process_time()
+    for packet in packets:
+        for frame in parser.feed(packet):
+            if frame[0] in wanted_ids:
+                decoder.decode(frame[0], frame[4])
+    results.append(("frames + fast decode of wanted only", time.process_time() - started))
+    return results
+
+def start_vehicles(vehicles, rate, port, duration):
+    streams = dict(DEFAULT_STREAMS, **{name: rate for name in HIGH_RATE_STREAMS})
+    processes = []
+    for system_id in range(1, vehicles + 1):
+        command = [sys.executable, "sim_vehicle.py", f"udpout:127.0.0.1:{port}", "--system-id", str(system_id),
+                   "--duration", str(duration)]
+        command += [argument for name, hz in streams.items() for argument in ("--stream", f"{name}={hz}")]
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    return processes
+
+def stop_vehicles(processes):
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+def live_recv_match(vehicles, rate, port, duration):
+    # The classic pymavlink loop: every packet decoded, then matched against the wanted types
+    connection = mavutil.mavlink_connection(f"udpin:127.0.0.1:{port}", source_system=255)
+    processes = start_vehicles(vehicles, rate, port, duration + 3)
+    try:
+        connection.recv_match(type="HEARTBEAT", blocking=True, timeout=5)
+        time.sleep(0.5)
+        while connection.recv_msg() is not None:
+            pass
+        wanted = 0
+        packets_before = connection.mav.total_packets_received
+        started, cpu_before = time.monotonic(), time.process_time()
+        while time.monotonic() - started < duration:
+            if connection.recv_match(type=list(WANTED), blocking=True, timeout=0.1) is not None:
+                wanted += 1
+        elapsed, cpu = time.monotonic() - started, time.process_time() - cpu_before
+        packets = connection.mav.total_packets_received - packets_before
+    finally:
+        stop_vehicles(processes)
+        connection.close()
+    return packets / elapsed, wanted / elapsed, cpu / elapsed
+
+def live_frames(vehicles, rate, port, duration):
+    # The hub's I/O thread with a thread listener for the wanted types and no pages
+    counts = [0]
+    def on_message(msg):
+        counts[0] += 1
+    io_thread = LinkIOThread()
+    io_thread.set_thread_listeners([(on_message, frozenset(WANTED))])
+    link = MavlinkLink(f"udpin:127.0.0.1:{port}")
+    io_thread.add_link(link)
+    io_thread.start()
+    processes = start_vehicles(vehicles, rate, port, duration + 3)
+    try:
+        deadline = time.monotonic() + 5
+        while len(io_thread.vehicles) < vehicles and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        wanted_before, packets_before = counts[0], link.message_count
+        started, cpu_before = time.monotonic(), time.process_time()
+        time.sleep(duration)
+        elapsed, cpu = time.monotonic() - started, time.process_time() - cpu_before
+        wanted, packets = counts[0] - wanted_before, link.message_count - packets_before
+    finally:
+        io_thread.stop()
+        io_thread.wait()
+        stop_vehicles(processes)
+    return packets / elapsed, wanted / elapsed, cpu / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive path CPU: pre-decode filtering vs plain recv_match")
+    parser.add_argument("--vehicles", type=int, default=VEHICLES)
+    parser.add_argument("--rate", type=int, default=RATE, help=f"Hz for {', '.join(HIGH_RATE_STREAMS)}")
+    parser.add_argument("--duration", type=float, default=DURATION, help="measured seconds per live run")
+    args = parser.parse_args()
+
+    packets = capture(args.vehicles, args.rate, CAPTURE_SECONDS / args.vehicles)
+    print(f"Offline: {len(packets)} packets from {args.vehicles} vehicles, {', '.join(WANTED)} wanted")
+    print(f"{'stage':<40}{'us/packet':>10}{'packets/s':>12}")
+    for name, seconds in decode_costs(packets):
+        print(f"{name:<40}{seconds / len(packets) * 1e6:>10.2f}{len(packets) / seconds:>12.0f}")
+
+    print(f"\nLive: {args.vehicles} simulated vehicles over UDP, {', '.join(HIGH_RATE_STREAMS)} at {args.rate} Hz")
+    print(f"{'receiver':<40}{'recv/s':>10}{'wanted/s':>10}{'CPU %':>7}{'us/packet':>11}")
+    runs = [("recv_match", live_recv_match, PORT), ("I/O thread, pre-decode filter", live_frames, PORT + 1)]
+    for name, run, port in runs:
+        received, wanted, cpu = run(args.vehicles, args.rate, port, args.duration)
+        print(f"{name:<40}{received:>10.0f}{wanted:>10.0f}{cpu * 100:>7.0f}"
+              f"{cpu / received * 1e6 if received else 0:>11.1f}")
+    print("\nOn a saturated CPU the vehicles and the receiver share cores; recv/s below the offered rate means loss")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse, os, sys, tempfile, time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyQt6.QtCore import Qt, QCoreApplication
+from PyQt6.QtWidgets import QApplication
+import perf_metrics
+from bench_telemetry_load import build_pages, cpu_seconds, rss_mb, wait, ms
+from sim_vehicle import DEFAULT_STREAMS, SimulatedVehicle
+from telemetry_hub import TelemetryHub
+from telemetry_log import TelemetryLogReader
+from telemetry_replay import AS_FAST_AS_POSSIBLE, REPLAY_PREFIX
+
+# A two-hour sortie at the default stream rates, recorded once and reused
+SORTIE_SECONDS = 2 * 60 * 60
+SORTIE_PATH = os.path.join(tempfile.gettempdir(), "bench_replay_sortie.tlog")
+STAGES = ["mavlink.receive_to_dispatch", "mavlink.subscribers", "plot.refresh", "dashboard.position_to_map"]
+
+def record_sortie(path):
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        SimulatedVehicle(None, streams=DEFAULT_STREAMS).record(path, SORTIE_SECONDS)
+        print(f"recorded {path} in {time.perf_counter() - started:.1f} s")
+    return path
+
+def decode_only(path):
+    # The floor: parsing every packet with nothing else going on
+    reader = TelemetryLogReader(path)
+    started, cpu_before = time.perf_counter(), cpu_seconds()
+    count = sum(1 for _ in reader.messages())
+    result = (count, time.perf_counter() - started, cpu_seconds() - cpu_before)
+    reader.close()
+    return result
+
+def replay(hub, path):
+    # Every message through the link, the I/O thread and whatever the hub feeds, as fast as they keep up
+    connection_string = REPLAY_PREFIX + path
+    hub.connect_to_vehicle(connection_string)
+    link = hub.links[connection_string]
+    link.set_speed(AS_FAST_AS_POSSIBLE)
+    done = []
+    link.finished.connect(lambda: done.append(True))
+    started, cpu_before = time.perf_counter(), cpu_seconds()
+    while not done:
+        wait(20)
+    result = (link.message_count, time.perf_counter() - started, cpu_seconds() - cpu_before)
+    hub.disconnect_from_vehicle()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded sortie as fast as possible through every consumer")
+    parser.add_argument("log", nargs="?", help=f"tlog to replay, a simulated {SORTIE_SECONDS // 3600} h sortie if omitted")
+    args = parser.parse_args()
+    path = args.log or record_sortie(SORTIE_PATH)
+
+    QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv)
+    reader = TelemetryLogReader(path)
+    flight_seconds = reader.end_time - reader.start_time
+    print(f"{path}: {len(reader)} packets, {flight_seconds / 60:.0f} min of flight")
+    reader.close()
+
+    results = [("decode only",) + decode_only(path)]
+
+    # The hub alone: link, I/O thread and vehicle tracking, no pages subscribed
+    hub = TelemetryHub()
+    results.append(("hub, no pages",) + replay(hub, path))
+
+    pages, skipped = build_pages(hub)
+    for reason in skipped:
+        print(f"skipped {reason}")
+    perf_metrics.reset()
+    perf_metrics.set_enabled(True)
+    results.append((f"hub + {', '.join(type(page).__name__ for page in pages)}",) + replay(hub, path))
+    perf_metrics.set_enabled(False)
+    snapshot = perf_metrics.snapshot()
+
+    print(f"\n{'consumer':<48}{'msgs/s':>9}{'wall s':>8}{'x real':>8}{'CPU %':>7}")
+    for name, count, wall, cpu in results:
+        print(f"{name:<48}{count / wall:>9.0f}{wall:>8.1f}{flight_seconds / wall:>8.0f}{cpu / wall * 100:>7.0f}")
+    print(f"RSS {rss_mb():.0f} MB")
+
+    print(f"\n{'stage ms':<32}{'count':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage in STAGES:
+        stats = snapshot["latency"].get(stage)
+        if stats is None or not stats["count"]:
+            continue
+        print(f"{stage:<32}{stats['count']:>9}{ms(stats['p50']):>9}{ms(stats['p95']):>9}{ms(stats['p99']):>9}"
+              f"{ms(stats['max']):>9}")
+    for page in pages:
+        page.close()
+    app.processEvents()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import math, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mission_geometry import MissionGeometry, local_projection
+from route_optimizer import PathSolver, optimize_mission, DEFAULT_TIME_BUDGET
+from waypoint_store import WaypointStore, make_waypoints, MISSION_TYPE_COMMANDS
+
+POINT_COUNTS = [100, 1000, 5000]
+AREA_M = 5000.0   # side of the square inspection area
+SEED = 0
+
+def make_mission(count, rng):
+    # Takeoff, scattered Flight waypoints in typing (random) order, Land back near the start
+    north = np.concatenate(([0.0], rng.random(count) * AREA_M, [10.0]))
+    east = np.concatenate(([0.0], rng.random(count) * AREA_M, [10.0]))
+    latitudes = 45.0 + np.degrees(north / 6371008.8)
+    longitudes = -75.0 + np.degrees(east / (6371008.8 * math.cos(math.radians(45.0))))
+    records = make_waypoints(latitudes, longitudes, 50.0)
+    records["command"][0] = MISSION_TYPE_COMMANDS["Takeoff"]
+    records["command"][-1] = MISSION_TYPE_COMMANDS["Land"]
+    return records
+
+def mission_distance(records):
+    geometry = MissionGeometry()
+    geometry.compute(WaypointStore(records))
+    return geometry.summary()["distance"]
+
+def main():
+    rng = np.random.default_rng(SEED)
+    workers = os.cpu_count() or 1
+    print(f"Time budget {DEFAULT_TIME_BUDGET:.1f} s, {workers} CPU(s) for the process pool")
+    # The Beardwood-Halton-Hammersley estimate 0.7124 * sqrt(n * A) approximates the optimum on random points
+    print(f"{'points':>7}{'typed km':>10}{'NN km':>9}{'opt km':>9}{'saved':>8}{'vs est':>8}{'NN s':>7}{'total s':>9}"
+          f"{'pool km':>9}{'pool s':>8}")
+    for count in POINT_COUNTS:
+        records = make_mission(count, rng)
+        typed = mission_distance(records)
+
+        # Nearest-neighbour construction alone, on the same projection the optimiser uses
+        x, y = local_projection(records["latitude"], records["longitude"], 45.0, -75.0)
+        start = time.perf_counter()
+        solver = PathSolver(x[1:-1], y[1:-1], (x[0], y[0]), (x[-1], y[-1]))
+        path = solver.nearest_neighbour_tour()[1:-1]
+        construction_s = time.perf_counter() - start
+        construction = mission_distance(records[np.concatenate(([0], np.asarray(path) + 1, [count + 1]))])
+
+        start = time.perf_counter()
+        order = optimize_mission(records, workers=1)
+        total_s = time.perf_counter() - start
+        optimized = mission_distance(records[order])
+        assert sorted(order.tolist()) == list(range(len(records)))
+        assert order[0] == 0 and order[-1] == len(records) - 1
+
+        if workers > 1:
+            start = time.perf_counter()
+            pool_order = optimize_mission(records, workers=workers)
+            pool_s = f"{time.perf_counter() - start:8.2f}"
+            pool_km = f"{mission_distance(records[pool_order]) / 1000:9.1f}"
+        else:
+            pool_s, pool_km = f"{'-':>8}", f"{'-':>9}"
+
+        estimate = 0.7124 * math.sqrt(count * AREA_M * AREA_M)
+        print(f"{count:>7}{typed / 1000:>10.1f}{construction / 1000:>9.1f}{optimized / 1000:>9.1f}"
+              f"{(typed - optimized) / typed * 100:>7.1f}%{optimized / estimate:>8.3f}{construction_s:>7.2f}"
+              f"{total_s:>9.2f}{pool_km}{pool_s}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json, os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 3
+
+# Each measurement runs in a fresh interpreter so imports are cold
+TIME_TO_WINDOW = """
+import json, time
+start = time.perf_counter()
+import sys
+from PyQt6.QtCore import Qt, QCoreApplication
+from PyQt6.QtWidgets import QApplication
+QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
+app = QApplication(sys.argv)
+import main
+imported = time.perf_counter()
+window = main.GroundStationApp()
+window.show()
+shown = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "window_s": shown - start}), flush=True)
+# The dashboard is built by the first pass of the event loop
+app.processEvents()
+print(json.dumps({"import_s": imported - start, "window_s": shown - start, "dashboard_s": time.perf_counter() - start}))
+"""
+
+PAGE_BREAKDOWN = """
+import importlib, json, sys, time
+from PyQt6.QtCore import Qt, QCoreApplication
+from PyQt6.QtWidgets import QApplication
+QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
+app = QApplication(sys.argv)
+import main
+results = []
+for label, module_name, class_name, takes_hub in main.PAGES:
+    try:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        imported = time.perf_counter()
+        page_class = getattr(module, class_name)
+        page = page_class(main.TelemetryHub()) if takes_hub else page_class()
+        built = time.perf_counter()
+        results.append((label, imported - start, built - imported, None))
+    except Exception as e:
+        results.append((label, None, None, f"{type(e).__name__}: {e}"))
+print(json.dumps(results))
+"""
+
+def run_snippet(snippet):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, env=env, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    errors = result.stderr.strip().splitlines()
+    # The result is the last line printed as JSON, Qt may print warnings before it
+    try:
+        data = json.loads(lines[-1]) if lines else None
+    except ValueError:
+        data = None
+    return data, errors[-1] if result.returncode and errors else None
+
+def main():
+    runs = [run_snippet(TIME_TO_WINDOW) for _ in range(RUNS)]
+    windows = [result for result, _ in runs if result is not None]
+    if not windows:
+        print(f"startup failed: {runs[0][1]}")
+        return
+    best = min(windows, key=lambda result: result["window_s"])
+    print(f"time to window (best of {RUNS}): {best['window_s'] * 1e3:.0f} ms "
+          f"(of which importing main: {best['import_s'] * 1e3:.0f} ms)")
+    if "dashboard_s" in best:
+        print(f"dashboard ready: {best['dashboard_s'] * 1e3:.0f} ms")
+    else:
+        print(f"dashboard failed: {runs[0][1]}")
+
+    pages, error = run_snippet(PAGE_BREAKDOWN)
+    if pages is None:
+        print(f"page breakdown failed: {error}")
+        return
+    print(f"\n{'page':<24}{'import ms':>12}{'construct ms':>14}")
+    for label, import_s, construct_s, error in pages:
+        if error is not None:
+            print(f"{label:<24}  failed: {error}")
+        else:
+            print(f"{label:<24}{import_s * 1e3:>12.0f}{construct_s * 1e3:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse, os, resource, subprocess, sys, time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from PyQt6.QtCore import Qt, QCoreApplication, QEventLoop, QTimer
+from PyQt6.QtWidgets import QApplication
+import perf_metrics
+from sim_vehicle import DEFAULT_STREAMS
+from telemetry_hub import TelemetryHub
+
+# Rates applied to the high-rate streams at each load level; the rest keep their default rates
+RATES = [10, 100, 1000]
+HIGH_RATE_STREAMS = ["ATTITUDE", "GLOBAL_POSITION_INT", "RC_CHANNELS"]
+DURATION = 10.0
+WARM_UP = 1.0
+FIRST_PORT = 14620
+# Stream rate registry owner of the rates each level asks for
+RATE_OWNER = "benchmark"
+# Stages reported from perf_metrics, besides the vehicle-to-UI latency measured here
+STAGES = ["mavlink.receive_to_dispatch", "plot.message_to_draw", "plot.refresh", "dashboard.position_to_map"]
+
+def wait(milliseconds):
+    loop = QEventLoop()
+    QTimer.singleShot(int(milliseconds), loop.quit)
+    loop.exec()
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def rss_mb():
+    # Current resident set on Linux, peak elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def build_pages(hub):
+    # The pages a flight shows; the dashboard needs QtWebEngine and is skipped where it cannot load
+    pages, skipped = [], []
+    for module_name, class_name in [("data_visualization_page", "DataVisualizationPage"),
+                                    ("dashboard_page", "DashboardPage")]:
+        try:
+            module = __import__(module_name)
+            page = getattr(module, class_name)(hub)
+        except Exception as e:
+            skipped.append(f"{class_name}: {type(e).__name__}: {e}")
+            continue
+        page.resize(1024, 768)
+        page.show()
+        pages.append(page)
+    return pages, skipped
+
+def run_level(hub, rate, port, duration):
+    streams = dict(DEFAULT_STREAMS, **{name: rate for name in HIGH_RATE_STREAMS})
+    command = [sys.executable, os.path.join(ROOT, "sim_vehicle.py"), f"udpout:127.0.0.1:{port}",
+               "--monotonic-clock", "--duration", str(duration + WARM_UP + 5)]
+    command += [argument for name, hz in streams.items() for argument in ("--stream", f"{name}={hz}")]
+    vehicle = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    # time_boot_ms is the vehicle's monotonic clock in ms, the same clock as ours
+    def on_attitude(msg):
+        if perf_metrics.enabled:
+            age = (time.monotonic() * 1000 - msg.time_boot_ms) / 1000
+            perf_metrics.record("bench.vehicle_to_ui", max(age, 0.0))
+
+    # Shown pages ask the vehicle for their own rates; the level's rates replace them, so the vehicle keeps
+    # sending what the level offers
+    for owner in list(hub.stream_rates.requests):
+        hub.stream_rates.clear_rates(owner)
+    hub.stream_rates.set_rates(RATE_OWNER, {name: rate for name in HIGH_RATE_STREAMS})
+
+    hub.subscribe("ATTITUDE", on_attitude)
+    hub.connect_to_vehicle(f"udpin:127.0.0.1:{port}")
+    try:
+        deadline = time.monotonic() + 5
+        while hub.vehicle() is None and time.monotonic() < deadline:
+            wait(50)
+        if hub.vehicle() is None:
+            return None
+        wait(WARM_UP * 1000)
+
+        perf_metrics.reset()
+        perf_metrics.set_enabled(True)
+        vehicle_state = hub.vehicle()
+        received_before = vehicle_state.message_count
+        cpu_before = cpu_seconds()
+        started = time.monotonic()
+        wait(duration * 1000)
+        elapsed = time.monotonic() - started
+        cpu = cpu_seconds() - cpu_before
+        received = vehicle_state.message_count - received_before
+        perf_metrics.set_enabled(False)
+        snapshot = perf_metrics.snapshot()
+    finally:
+        hub.unsubscribe("ATTITUDE", on_attitude)
+        hub.disconnect_from_vehicle()
+        vehicle.terminate()
+        vehicle.wait()
+
+    offered = sum(streams.values())
+    return {
+        "rate": rate,
+        "offered": offered,
+        "received": received / elapsed,
+        "dispatched": snapshot["counters"].get("mavlink.dispatched", {}).get("count", 0) / elapsed,
+        "cpu": cpu / elapsed * 100,
+        "rss": rss_mb(),
+        "latency": snapshot["latency"],
+    }
+
+def ms(value):
+    return "-" if value is None else f"{value * 1e3:.2f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry throughput and latency under load, offscreen")
+    parser.add_argument("--duration", type=float, default=DURATION, help="measured seconds per level")
+    parser.add_argument("--rates", type=int, nargs="+", default=RATES,
+                        help=f"Hz for {', '.join(HIGH_RATE_STREAMS)} at each level")
+    args = parser.parse_args()
+
+    QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv)
+    hub = TelemetryHub()
+    pages, skipped = build_pages(hub)
+    for reason in skipped:
+        print(f"skipped {reason}")
+    print(f"pages: {', '.join(type(page).__name__ for page in pages)}; idle RSS {rss_mb():.0f} MB\n")
+
+    results = []
+    for index, rate in enumerate(args.rates):
+        result = run_level(hub, rate, FIRST_PORT + index, args.duration)
+        if result is None:
+            print(f"{rate} Hz: the simulated vehicle never appeared")
+            continue
+        results.append(result)
+
+    print(f"{'level Hz':>9}{'offered/s':>11}{'recv/s':>9}{'to UI/s':>9}{'CPU %':>7}{'RSS MB':>8}")
+    for result in results:
+        print(f"{result['rate']:>9}{result['offered']:>11.0f}{result['received']:>9.0f}{result['dispatched']:>9.0f}"
+              f"{result['cpu']:>7.0f}{result['rss']:>8.0f}")
+    print(f"\n{'latency ms':<32}{'level Hz':>9}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage in ["bench.vehicle_to_ui"] + STAGES:
+        for result in results:
+            stats = result["latency"].get(stage)
+            if stats is None or not stats["count"]:
+                continue
+            print(f"{stage:<32}{result['rate']:>9}{stats['count']:>8}{ms(stats['p50']):>9}{ms(stats['p95']):>9}"
+                  f"{ms(stats['p99']):>9}{ms(stats['max']):>9}")
+    print("\nvehicle_to_ui has 1 ms resolution: time_boot_ms is whole milliseconds")
+    for page in pages:
+        page.close()
+    app.processEvents()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import threading, time
+from collections import deque
+import cv2
+from PyQt6.QtCore import QThread, pyqtSignal
+
+class RateCounter:
+    def __init__(self, window_seconds=2.0):
+        self.window_seconds = window_seconds
+        self.ticks = deque()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.ticks.append(now)
+        while self.ticks and now - self.ticks[0] > self.window_seconds:
+            self.ticks.popleft()
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self.ticks and now - self.ticks[0] > self.window_seconds:
+            self.ticks.popleft()
+        if len(self.ticks) < 2:
+            return 0.0
+        return (len(self.ticks) - 1) / max(self.ticks[-1] - self.ticks[0], 1e-9)
+
+
+class CameraCaptureThread(QThread):
+    opened = pyqtSignal(int, int, float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+
+        self.source = source
+        self.capture = None
+        self.running = False
+
+        # Only the newest decoded frame is kept; the lock guards the slot below
+        self.lock = threading.Lock()
+        self.latest_frame = None
+        self.latest_timestamp = 0.0
+        self.frame_sequence = 0
+        self.consumed_sequence = 0
+
+        # Optional callable(frame, timestamp) fed every captured frame from this thread
+        self.frame_sink = None
+
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self.capture_rate = RateCounter()
+
+    def start(self, *args):
+        # Set before the thread runs, so a stop() while the camera is still opening is not overwritten
+        self.running = True
+        super().start(*args)
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        # Opening a network stream can block for seconds, so it happens here too
+        capture = cv2.VideoCapture(self.source)
+        if not self.running:
+            # Stopped while opening
+            capture.release()
+            return
+        self.capture = capture
+        if not self.capture.isOpened():
+            self.capture.release()
+            self.capture = None
+            self.failed.emit("Failed to connect to the camera")
+            return
+
+        # Ask the backend not to queue decoded frames behind our back
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        declared_fps = self.capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.opened.emit(width, height, declared_fps)
+
+        while self.running:
+            ret, frame = self.capture.read()
+            if not ret:
+                self.failed.emit("Camera stream ended")
+                break
+
+            now = time.monotonic()
+            with self.lock:
+                self.capture_rate.tick(now)
+                # A frame the display never picked up is a dropped frame
+                if self.frame_sequence != self.consumed_sequence:
+                    self.dropped_frames += 1
+                self.latest_frame = frame
+                self.latest_timestamp = now
+                self.frame_sequence += 1
+                self.captured_frames += 1
+
+            frame_sink = self.frame_sink
+            if frame_sink is not None:
+                frame_sink(frame, now)
+
+        self.capture.release()
+        self.capture = None
+
+    def take_latest_frame(self):
+        # Returns (frame, timestamp) if a frame arrived since the last call, else None
+        with self.lock:
+            if self.frame_sequence == self.consumed_sequence:
+                return None
+            self.consumed_sequence = self.frame_sequence
+            return self.latest_frame, self.latest_timestamp
+
+    def capture_fps(self):
+        with self.lock:
+            return self.capture_rate.rate()
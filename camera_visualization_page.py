@@ -1,17 +1,68 @@
-import os, cv2
+import os
 from logger import logger
-from PyQt6.QtCore import Qt, QTimer, QTime
+import perf_metrics
+from camera_capture import CameraCaptureThread, RateCounter
+from frame_processing import build_brightness_contrast_lut, is_identity_lut, apply_lut
+from video_recorder import VideoRecorder, RECORDING_CODECS, DEFAULT_CODEC, choose_recording_fps
+from PyQt6.QtCore import Qt, QDeadlineTimer, QTimer, QTime
 from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtWidgets import QLabel, QVBoxLayout, QWidget, QSlider, QFileDialog, QHBoxLayout, QLineEdit, QPushButton
+from PyQt6.QtWidgets import QLabel, QVBoxLayout, QWidget, QSlider, QFileDialog, QHBoxLayout, QLineEdit, QPushButton, \
+    QComboBox, QMessageBox
+
+# Interval at which the display pulls the newest captured frame (~60 Hz)
+DISPLAY_INTERVAL_MS = 16
+# Slider changes are logged once the slider has been still this long, not on every tick
+SLIDER_LOG_DELAY_MS = 500
+# Longest the GUI waits for the capture thread to stop
+CAPTURE_STOP_TIMEOUT_MS = 2000
+
+# Capture threads that did not stop in time, referenced here until they finish so a running QThread is
+# never destroyed along with its page
+detached_captures = []
+
+def detach_capture(capture):
+    detached_captures.append(capture)
+
+    def on_finished():
+        detached_captures.remove(capture)
+        capture.deleteLater()
+    capture.finished.connect(on_finished)
+
+def wait_for_detached_captures(timeout_ms=CAPTURE_STOP_TIMEOUT_MS):
+    # Bounded wait on application exit; returns whether every detached capture finished
+    deadline = QDeadlineTimer(timeout_ms)
+    for capture in list(detached_captures):
+        if not capture.wait(deadline):
+            logger.warning("Camera capture still blocked on exit.")
+            return False
+    return True
 
 class CameraVisualizationPage(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.capture = None  # OpenCV capture object to access the camera feed
+        self.capture = None  # Capture thread reading and decoding the camera feed
+        self.frame_size = None  # (width, height) reported by the camera
+        self.declared_fps = 0.0  # Frame rate reported by the stream, 0 if unknown
         self.brightness = 50  # Default brightness value
         self.contrast = 50  # Default contrast value
         self.is_recording = False  # Flag to indicate if video recording is in progress
+        self.video_recorder = None  # Encoder thread fed straight from the capture thread
+        self.display_buffer = None  # Reused output buffer for the adjusted display frame
+        self.display_rate = RateCounter()
+        # Brightness/contrast lookup table, rebuilt only when a slider moves
+        self.rebuild_lut()
+
+        # Pull frames at display rate, independent of the capture rate
+        self.display_timer = QTimer(self)
+        self.display_timer.setInterval(DISPLAY_INTERVAL_MS)
+        self.display_timer.timeout.connect(self.update_camera_feed)
+
+        # Coalesces a slider drag into a single log line with the final values
+        self.slider_log_timer = QTimer(self)
+        self.slider_log_timer.setSingleShot(True)
+        self.slider_log_timer.setInterval(SLIDER_LOG_DELAY_MS)
+        self.slider_log_timer.timeout.connect(self.log_slider_values)
 
         self.init_ui()
 
@@ -21,6 +72,8 @@ class CameraVisualizationPage(QWidget):
 
         self.camera_label = QLabel("Camera Feed")
         layout.addWidget(self.camera_label)
+        self.stats_label = QLabel("Capture: 0.0 FPS | Display: 0.0 FPS | Dropped: 0")
+        layout.addWidget(self.stats_label)
         self.video_path_input = QLineEdit()
         layout.addWidget(self.video_path_input)
 
@@ -61,12 +114,16 @@ class CameraVisualizationPage(QWidget):
         self.start_record_button.clicked.connect(self.start_recording)
         self.stop_record_button.clicked.connect(self.stop_recording)
         self.configure_save_path_button.clicked.connect(self.configure_save_path)
+        self.codec_dropdown = QComboBox()
+        self.codec_dropdown.addItems(RECORDING_CODECS.keys())
+        self.codec_dropdown.setCurrentText(DEFAULT_CODEC)
 
         # Create a horizontal layout for the recording buttons
         record_buttons_layout = QHBoxLayout()
         record_buttons_layout.addWidget(self.start_record_button)
         record_buttons_layout.addWidget(self.stop_record_button)
         record_buttons_layout.addWidget(self.configure_save_path_button)
+        record_buttons_layout.addWidget(self.codec_dropdown)
         layout.addLayout(record_buttons_layout)
 
         self.setLayout(layout)
@@ -92,19 +149,27 @@ class CameraVisualizationPage(QWidget):
             # Create the directory if it doesn't exist
             os.makedirs(video_path, exist_ok=True)
 
-            # Get the current time and set it as the default filename
+            # Get the current time and set it as the default filename, the codec picks the extension
             current_time = QTime.currentTime().toString("hh-mm-ss")
-            video_filename = f"{current_time}.avi"
-
-            # Get the resolution of the camera feed
-            width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            size = (width, height)
-
-            # Create a VideoWriter object to save the video
-            video_format = cv2.VideoWriter_fourcc(*"MJPG")
-            self.video_writer = cv2.VideoWriter(os.path.join(video_path, video_filename), video_format, 10, size)
+            base_path = os.path.join(video_path, current_time)
+
+            # Record at the rate the stream declares, or the one we measure
+            fps = choose_recording_fps(self.declared_fps, self.capture.capture_fps())
+            recorder = VideoRecorder(base_path, self.frame_size, fps, self.codec_dropdown.currentText())
+            recorder.frame_filter = self.adjust_recorded_frame
+            try:
+                recorder.start()
+            except RuntimeError as e:
+                logger.error(str(e))
+                QMessageBox.warning(self, "Error", str(e))
+                return
+
+            # Every captured frame goes to the encoder queue from the capture thread,
+            # so encoding never runs in the display loop
+            self.video_recorder = recorder
+            self.capture.frame_sink = recorder.submit
             self.is_recording = True
+            self.codec_dropdown.setEnabled(False)
 
             # Disable the start button and enable the stop button during recording
             self.start_record_button.setEnabled(False)
@@ -115,84 +180,133 @@ class CameraVisualizationPage(QWidget):
         if self.capture is not None and self.is_recording:
             self.is_recording = False
 
-            # Release the VideoWriter object
-            self.video_writer.release()
-            self.video_writer = None
+            # Detach from the capture thread, then drain and close the encoder
+            self.capture.frame_sink = None
+            self.video_recorder.stop()
+            self.video_recorder = None
 
             # Enable the start button and disable the stop button after recording
             self.start_record_button.setEnabled(True)
             self.stop_record_button.setEnabled(False)
+            self.codec_dropdown.setEnabled(True)
 
     def connect_to_camera(self):
         logger.info("Connect to camera button clicked.")
         # Get the camera URL from the input field
         camera_url = self.camera_url_input.text()
 
-        # Release any existing camera capture
-        if self.capture is not None:
-            self.capture.release()
+        # Stop any existing camera capture
+        self.release_camera()
 
         # Check if the input an integer
         if camera_url.isdigit():
             camera_url = int(camera_url)
 
-        try:
-            # Try to open the camera using the URL
-            self.capture = cv2.VideoCapture(camera_url)
-
-            if self.capture.isOpened():
-                # If the camera is opened successfully, start the camera feed update loop
-                self.update_camera_feed()
-                # Enable the start button after connecting to the camera
-                self.start_record_button.setEnabled(True)
-            else:
-                # If the camera couldn't be opened, display an error message
-                self.camera_label.setText("Error: Failed to connect to the camera")
-        except Exception as e:
-            # Display the error message if there's an exception
-            self.camera_label.setText(f"Error: {str(e)}")
+        # Open and read the camera on a worker thread so a slow stream never blocks the UI
+        self.camera_label.setText("Connecting to camera...")
+        self.capture = CameraCaptureThread(camera_url)
+        self.capture.opened.connect(self.on_camera_opened)
+        self.capture.failed.connect(self.on_camera_failed)
+        self.capture.start()
+
+    def on_camera_opened(self, width, height, declared_fps):
+        logger.info(f"Camera opened at {width}x{height}, {declared_fps:.1f} FPS declared.")
+        self.frame_size = (width, height)
+        self.declared_fps = declared_fps
+        # Start the camera feed update loop and enable recording
+        self.display_timer.start()
+        self.start_record_button.setEnabled(True)
+
+    def on_camera_failed(self, reason):
+        logger.error(f"Camera error: {reason}")
+        # Display the error message
+        self.camera_label.setText(f"Error: {reason}")
+        if self.is_recording:
+            self.stop_recording()
+        self.display_timer.stop()
+        self.start_record_button.setEnabled(False)
+
+    def release_camera(self):
+        if self.is_recording:
+            self.stop_recording()
+        self.display_timer.stop()
+        if self.capture is not None:
+            self.capture.stop()
+            # A camera still opening or stuck in a read cannot be interrupted; leave it to finish on its
+            # own rather than freezing the GUI, it releases the device once the call returns
+            if not self.capture.wait(CAPTURE_STOP_TIMEOUT_MS):
+                logger.warning("Camera capture did not stop in time, leaving it to finish in the background.")
+                self.capture.opened.disconnect(self.on_camera_opened)
+                self.capture.failed.disconnect(self.on_camera_failed)
+                self.capture.frame_sink = None
+                detach_capture(self.capture)
+            self.capture = None
 
     def update_camera_feed(self):
-        if self.capture is not None:
-            ret, frame = self.capture.read()
-            if ret:
-                # Apply brightness and contrast adjustments to the camera frame
-                adjusted_frame = self.adjust_brightness_contrast(frame)
-
-                # Convert the frame to RGB color space and show it on the QLabel
-                rgb_frame = cv2.cvtColor(adjusted_frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_frame.shape
-                q_img = QImage(rgb_frame.data, w, h, ch * w, QImage.Format.Format_RGB888)
-                self.camera_label.setPixmap(QPixmap.fromImage(q_img))
-
-                # If recording is in progress, save the frame to the video file
-                if self.is_recording and self.video_writer is not None:
-                    self.video_writer.write(adjusted_frame)
-        # Schedule the next frame update after a delay (e.g., 30ms)
-        QTimer.singleShot(30, self.update_camera_feed)
+        if self.capture is None:
+            return
+
+        # Latest frame wins; stale frames were already overwritten by the capture thread
+        latest = self.capture.take_latest_frame()
+        if latest is not None:
+            frame, captured = latest
+            started = perf_metrics.now()
+            self.display_rate.tick()
+
+            # Apply brightness and contrast adjustments to the camera frame
+            adjusted_frame = self.adjust_brightness_contrast(frame)
+
+            # Wrap the BGR buffer directly instead of converting to a second RGB copy
+            h, w = adjusted_frame.shape[:2]
+            q_img = QImage(adjusted_frame.data, w, h, adjusted_frame.strides[0], QImage.Format.Format_BGR888)
+            self.camera_label.setPixmap(QPixmap.fromImage(q_img))
+            perf_metrics.record_since("camera.display_frame", started)
+            # The capture thread stamps frames with time.monotonic(), the same clock
+            perf_metrics.record_since("camera.capture_to_display", captured)
+            perf_metrics.count("camera.frames_displayed")
+
+        stats = (f"Capture: {self.capture.capture_fps():.1f} FPS | "
+                 f"Display: {self.display_rate.rate():.1f} FPS | "
+                 f"Dropped: {self.capture.dropped_frames}")
+        if self.video_recorder is not None:
+            stats += (f" | Recorded: {self.video_recorder.written_frames} "
+                      f"(dropped {self.video_recorder.dropped_frames})")
+        self.stats_label.setText(stats)
+
+    def rebuild_lut(self):
+        self.brightness_contrast_lut = build_brightness_contrast_lut(self.brightness, self.contrast)
+        self.lut_is_identity = is_identity_lut(self.brightness_contrast_lut)
 
     def adjust_brightness_contrast(self, frame):
-        alpha = (self.contrast + 100) / 100.0
-        beta = self.brightness - 50
-
-        return cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
+        if self.lut_is_identity:
+            return frame
+        # The frame may also be queued for recording, so write into a reused display buffer
+        if self.display_buffer is None or self.display_buffer.shape != frame.shape:
+            self.display_buffer = frame.copy()
+        return apply_lut(frame, self.brightness_contrast_lut, dst=self.display_buffer)
+
+    def adjust_recorded_frame(self, frame):
+        # Runs on the encoder thread: recordings keep the brightness and contrast shown on screen
+        lut = self.brightness_contrast_lut
+        return frame if is_identity_lut(lut) else apply_lut(frame, lut)
 
     def update_brightness(self, value):
-        logger.info(f"Updated brightness value: {value}")
         self.brightness = value
+        self.rebuild_lut()
+        self.slider_log_timer.start()
 
     def update_contrast(self, value):
-        logger.info(f"Updated contrast value: {value}")
         self.contrast = value
+        self.rebuild_lut()
+        self.slider_log_timer.start()
+
+    def log_slider_values(self):
+        logger.info(f"Updated brightness value: {self.brightness}, contrast value: {self.contrast}")
 
     def closeEvent(self, event):
         logger.info("Closing CameraVisualizationPage.")
-        # Release the OpenCV capture object and the video writer if they are active
-        if self.capture is not None:
-            self.capture.release()
-
-        if self.video_writer is not None:
-            self.video_writer.release()
+        # Stop the capture thread and the recorder if they are active
+        self.release_camera()
 
         # Call the base class closeEvent to properly close the widget
         super().closeEvent(event)
@@ -0,0 +1,342 @@
+import logging, selectors, socket, threading, time
+from PyQt6.QtCore import QThread, pyqtSignal
+from pymavlink import mavutil
+import perf_metrics
+from link_quality import LinkStatistics
+from logger import logger, log_rate_limited
+from mavlink_frames import FastDecoder, FrameParser, mavlink2_dialect
+
+mavlink = mavutil.mavlink
+
+# Messages parsed from one link per wakeup before the other links get a turn
+MAX_MESSAGES_PER_WAKEUP = 256
+SELECT_TIMEOUT = 0.5
+# Bytes asked for per read; a UDP read returns one datagram whatever the size
+RECEIVE_SIZE = 65536
+# Decoded whoever subscribes: vehicles are discovered and tracked from their heartbeats
+ALWAYS_DECODED = ("HEARTBEAT",)
+
+def mav_type_name(mav_type):
+    entry = mavlink.enums["MAV_TYPE"].get(mav_type)
+    return entry.name.replace("MAV_TYPE_", "").replace("_", " ").title() if entry else f"Type {mav_type}"
+
+def is_vehicle_heartbeat(msg):
+    # Same test pymavlink uses: ground stations, gimbals and companions are not vehicles
+    if msg.get_srcComponent() == mavlink.MAV_COMP_ID_GIMBAL:
+        return False
+    if msg.type in (mavlink.MAV_TYPE_GCS, mavlink.MAV_TYPE_GIMBAL, mavlink.MAV_TYPE_ADSB,
+                    mavlink.MAV_TYPE_ONBOARD_CONTROLLER):
+        return False
+    return msg.autopilot != mavlink.MAV_AUTOPILOT_INVALID
+
+
+class VehicleState:
+    # One airframe, keyed by MAVLink system id. Written on the I/O thread, read from the GUI thread.
+    def __init__(self, system_id, link):
+        self.system_id = system_id
+        self.link = link
+        # Autopilot component, the target for commands and mission transfers
+        self.component_id = mavlink.MAV_COMP_ID_AUTOPILOT1
+        self.components = set()
+        self.mav_type = None
+        self.autopilot = None
+        self.armed = False
+        self.last_heartbeat = None
+        self.last_seen = None
+        self.message_count = 0
+        # Latest message of every type, like pymavlink's per-sysid messages dict
+        self.messages = {}
+
+    @property
+    def name(self):
+        kind = mav_type_name(self.mav_type) if self.mav_type is not None else "Vehicle"
+        return f"{kind} {self.system_id}"
+
+    def saw(self, component_id, timestamp):
+        # Any packet, decoded or not
+        self.components.add(component_id)
+        self.last_seen = timestamp
+        self.message_count += 1
+
+    def update(self, msg):
+        self.saw(msg.get_srcComponent(), msg._timestamp)
+        msg_type = msg.get_type()
+        self.messages[msg_type] = msg
+        if msg_type == "HEARTBEAT" and is_vehicle_heartbeat(msg):
+            self.component_id = msg.get_srcComponent()
+            self.mav_type = msg.type
+            self.autopilot = msg.autopilot
+            self.armed = bool(msg.base_mode & mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+            self.last_heartbeat = msg._timestamp
+
+    def send(self, msg):
+        self.link.send(msg)
+
+
+class MavlinkLink:
+    # One UDP/TCP/serial (or pty) pymavlink connection, read by the shared I/O thread
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+        # May raise, callers report the error to the user
+        self.connection = mavutil.mavlink_connection(connection_string, autoreconnect=False)
+        self.eof = False
+        # pymavlink only prints on a closed TCP peer; flag it so the loop drops the link
+        self.connection.handle_eof = self.mark_eof
+        self.send_lock = threading.Lock()
+        self.message_count = 0
+        # The I/O thread reads raw bytes and only decodes what somebody subscribed to
+        dialect = mavlink2_dialect()
+        self.parser = FrameParser(dialect)
+        self.decoder = FastDecoder(dialect)
+        # Loss, rates and heartbeat timing, from every packet including the ones never decoded
+        self.statistics = LinkStatistics()
+
+    def mark_eof(self):
+        self.eof = True
+
+    def fileno(self):
+        return self.connection.port.fileno()
+
+    def read_frames(self, limit):
+        # Every packet of what the port holds, parsed a datagram or read at a time, up to about limit
+        frames = []
+        while len(frames) < limit:
+            data = self.connection.recv(RECEIVE_SIZE)
+            if not data:
+                break
+            if self.connection.first_byte:
+                # pymavlink answers in MAVLink 2 once the vehicle speaks it
+                self.connection.auto_mavlink_version(data)
+            frames += self.parser.feed(data)
+        return frames
+
+    def send(self, msg):
+        # Several pages and workers may send over the same link
+        with self.send_lock:
+            self.connection.mav.send(msg)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing connection {self.connection_string}: {e}")
+
+
+class LinkIOThread(QThread):
+    # Single thread multiplexing every link through one selector, however many vehicles are flying
+    message_received = pyqtSignal(object)
+    link_lost = pyqtSignal(str, str)
+    vehicle_discovered = pyqtSignal(int)
+    vehicle_lost = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.selector = selectors.DefaultSelector()
+        # Link changes are queued from the GUI thread and applied by the loop, woken through this pair
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+        self.pending_changes = []
+        self.pending_lock = threading.Lock()
+        self.links = set()
+
+        # system id -> VehicleState, only added to on this thread
+        self.vehicles = {}
+        # Message types somebody subscribed to, for the selected vehicle or for all of them;
+        # replaced atomically from the GUI thread
+        self.message_types = frozenset()
+        self.all_vehicle_types = frozenset()
+        self.selected_system = None
+        # (callable, message types or None for all) run on this thread for decoded messages, e.g. protocol
+        # engines, and callables run for every raw packet, e.g. the telemetry log
+        self.thread_listeners = ()
+        self.packet_listeners = ()
+        # Message ids worth decoding, None for all of them
+        self.decoded_ids = frozenset(self.message_ids(ALWAYS_DECODED))
+        self.running = False
+
+    def set_message_types(self, message_types, all_vehicle_types):
+        self.message_types = frozenset(message_types)
+        self.all_vehicle_types = frozenset(all_vehicle_types)
+        self.update_decoded_ids()
+
+    def set_selected_system(self, system_id):
+        self.selected_system = system_id
+
+    def set_thread_listeners(self, listeners):
+        self.thread_listeners = tuple(listeners)
+        self.update_decoded_ids()
+
+    def set_packet_listeners(self, listeners):
+        self.packet_listeners = tuple(listeners)
+
+    def message_ids(self, message_types):
+        return {getattr(mavlink, f"MAVLINK_MSG_ID_{message_type}") for message_type in message_types
+                if hasattr(mavlink, f"MAVLINK_MSG_ID_{message_type}")}
+
+    def update_decoded_ids(self):
+        # Everything else is counted and recorded but never unpacked
+        if any(message_types is None for _, message_types in self.thread_listeners):
+            self.decoded_ids = None
+            return
+        message_types = set(ALWAYS_DECODED) | self.message_types | self.all_vehicle_types
+        for _, listener_types in self.thread_listeners:
+            message_types |= listener_types
+        self.decoded_ids = frozenset(self.message_ids(message_types))
+
+    def add_link(self, link):
+        self.queue_change(("add", link))
+
+    def remove_link(self, link):
+        self.queue_change(("remove", link))
+
+    def queue_change(self, change):
+        with self.pending_lock:
+            self.pending_changes.append(change)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+    def apply_changes(self):
+        with self.pending_lock:
+            changes = self.pending_changes
+            self.pending_changes = []
+        for action, link in changes:
+            if action == "add" and link not in self.links:
+                self.selector.register(link.fileno(), selectors.EVENT_READ, link)
+                self.links.add(link)
+            elif action == "remove" and link in self.links:
+                self.drop_link(link)
+                link.close()
+
+    def drop_link(self, link):
+        try:
+            self.selector.unregister(link.fileno())
+        except (KeyError, ValueError, OSError):
+            pass
+        self.links.discard(link)
+        # Vehicles only reachable over this link go with it
+        for system_id in [system_id for system_id, vehicle in self.vehicles.items() if vehicle.link is link]:
+            del self.vehicles[system_id]
+            self.vehicle_lost.emit(system_id)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.apply_changes()
+            for key, _ in self.selector.select(SELECT_TIMEOUT):
+                if key.data is None:
+                    # Drain wakeup bytes, the changes themselves are applied at the top of the loop
+                    try:
+                        while self.wakeup_reader.recv(256):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.read_link(key.data)
+
+        # Close links removed or added just before stop() too
+        self.apply_changes()
+        for link in list(self.links):
+            self.drop_link(link)
+            link.close()
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+    def read_link(self, link):
+        try:
+            # Parse everything buffered, bounded so one busy link cannot starve the rest
+            if link.parser is None:
+                self.read_messages(link)
+            else:
+                self.read_frames(link)
+        except Exception as e:
+            self.lose_link(link, str(e))
+            return
+        if link.eof:
+            self.lose_link(link, "Connection closed by peer.")
+
+    def read_messages(self, link):
+        # Links handing over decoded messages, i.e. replays; their packets are on disk already
+        for _ in range(MAX_MESSAGES_PER_WAKEUP):
+            msg = link.connection.recv_msg()
+            if msg is None:
+                break
+            link.message_count += 1
+            link.statistics.record(msg.get_srcSystem(), msg.get_srcComponent(), msg.get_seq(), msg.get_msgId(),
+                                   len(msg.get_msgbuf()), msg._timestamp)
+            self.handle_message(link, msg)
+
+    def read_frames(self, link):
+        timestamp = time.time()
+        decoded_ids = self.decoded_ids
+        statistics = link.statistics
+        for msgid, system_id, component_id, seq, packet in link.read_frames(MAX_MESSAGES_PER_WAKEUP):
+            link.message_count += 1
+            statistics.record(system_id, component_id, seq, msgid, len(packet), timestamp)
+            for listener in self.packet_listeners:
+                try:
+                    listener(packet, msgid, timestamp)
+                except Exception as e:
+                    log_rate_limited(f"packet-listener:{msgid}", logging.ERROR,
+                                     f"Packet listener failed on message {msgid}: {e}", exc_info=True)
+
+            if decoded_ids is not None and msgid not in decoded_ids:
+                # Nobody reads it: counted for its vehicle and dropped without unpacking the payload
+                vehicle = self.vehicles.get(system_id)
+                if vehicle is not None:
+                    vehicle.saw(component_id, timestamp)
+                continue
+            try:
+                msg = link.decoder.decode(msgid, packet)
+            except Exception as e:
+                log_rate_limited(f"undecodable:{msgid}", logging.WARNING, f"Dropping undecodable message {msgid}: {e}")
+                continue
+            msg._timestamp = timestamp
+            self.handle_message(link, msg)
+
+    def lose_link(self, link, reason):
+        if link in self.links:
+            self.drop_link(link)
+            self.link_lost.emit(link.connection_string, reason)
+
+    def handle_message(self, link, msg):
+        if msg.get_type() == "BAD_DATA":
+            return
+        # Start of the receive-to-UI latency stages, 0.0 while instrumentation is off
+        msg._received = perf_metrics.now()
+        system_id = msg.get_srcSystem()
+        vehicle = self.vehicles.get(system_id)
+        if vehicle is None and msg.get_type() == "HEARTBEAT" and is_vehicle_heartbeat(msg):
+            vehicle = VehicleState(system_id, link)
+            self.vehicles[system_id] = vehicle
+            self.vehicle_discovered.emit(system_id)
+        if vehicle is not None:
+            vehicle.update(msg)
+
+        msg_type = msg.get_type()
+        for listener, listener_types in self.thread_listeners:
+            if listener_types is not None and msg_type not in listener_types:
+                continue
+            try:
+                listener(msg)
+            except Exception as e:
+                # A broken listener fails on every message, keep that from flooding the log
+                log_rate_limited(f"listener:{msg.get_type()}", logging.ERROR,
+                                 f"Thread listener failed on {msg.get_type()}: {e}", exc_info=True)
+
+        # Only hand over what a page is listening for, and from the vehicle it shows; everything
+        # else is dropped here instead of crossing into the GUI thread
+        if msg_type in self.all_vehicle_types or (
+                msg_type in self.message_types and self.selected_system in (None, system_id)):
+            self.message_received.emit(msg)
@@ -1,68 +1,208 @@
-from pymavlink import mavutil
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QComboBox, QPushButton, QMessageBox, QDialog, QLabel
+import json, os
+from PyQt6.QtCore import QCoreApplication, QTimer, QUrl
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QHBoxLayout, QComboBox, QPushButton, QMessageBox, QDialog, QLabel, QFileDialog
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 import folium
-import geocoder
+from fetch_service import FetchService, weather_key
+from flight_track import FlightTrack
+from link_quality_indicator import LinkQualityIndicator
+import perf_metrics
+from replay_controls import ReplayControls
+from telemetry_hub import TELEMETRY_LOG_FOLDER
+from telemetry_replay import REPLAY_PREFIX
+from tile_cache import TileCache, TileServer, open_tile_store, TILE_ATTRIBUTION, MAX_ZOOM
+from vehicle_selector import VehicleSelector
+
+# Helpers injected into the page once the Leaflet map is loaded; every later
+# change is a small call into these instead of a full document reload
+MAP_HELPERS_JS = """
+window.gcs = {
+    map: %(map)s,
+    droneMarker: null,
+    userMarker: null,
+    track: null,
+    trackHead: null,
+    resetTrack: function(points) {
+        if (this.track === null) {
+            this.track = L.polyline(points, {color: '#e6194b', weight: 3}).addTo(this.map);
+            this.trackHead = L.polyline([], {color: '#e6194b', weight: 3, dashArray: '4 4'}).addTo(this.map);
+        } else {
+            this.track.setLatLngs(points);
+        }
+    },
+    extendTrack: function(points, headLat, headLon) {
+        // Append new vertices and move the live segment from the last vertex to the drone
+        for (var i = 0; i < points.length; i++) { this.track.addLatLng(points[i]); }
+        var latlngs = this.track.getLatLngs();
+        var last = latlngs[latlngs.length - 1];
+        this.trackHead.setLatLngs(headLat === null || !last ? [] : [last, [headLat, headLon]]);
+    },
+    setDrone: function(lat, lon, heading) {
+        if (this.droneMarker === null) {
+            var icon = L.divIcon({
+                className: '',
+                html: '<img id="gcs-drone-icon" src="assets/drone_icon.png" style="width:50px;height:50px;">',
+                iconSize: [50, 50],
+                iconAnchor: [25, 25]
+            });
+            this.droneMarker = L.marker([lat, lon], {icon: icon}).addTo(this.map);
+        } else {
+            this.droneMarker.setLatLng([lat, lon]);
+        }
+        if (heading !== null) {
+            var img = document.getElementById('gcs-drone-icon');
+            if (img) { img.style.transform = 'rotate(' + heading + 'deg)'; }
+        }
+    },
+    setUser: function(lat, lon, zoom) {
+        if (this.userMarker === null) {
+            this.userMarker = L.marker([lat, lon]).bindPopup('Your Location').addTo(this.map);
+        } else {
+            this.userMarker.setLatLng([lat, lon]);
+        }
+        this.map.setView([lat, lon], zoom);
+    }
+};
+"""
+
+# Flush pending map changes at most this often (roughly one display frame)
+MAP_FRAME_INTERVAL_MS = 33
+
+WEATHER_REFRESH_INTERVAL_MS = 10 * 60 * 1000
+REPLAY_FILE_FILTER = "Telemetry Log (*.tlog)"
+# Rates asked of the vehicle while the map is on screen
+STREAM_RATES = {"GLOBAL_POSITION_INT": 5}
 
 class MapWidget(QWebEngineView):
     def __init__(self):
         super().__init__()
 
-        self.drone_marker = None
+        self.map_loaded = False
+        # Latest drone state and queued one-off calls, flushed together once per frame
+        self.pending_drone = None
+        self.pending_calls = []
+        # Receive stamp of the oldest position not yet on the map
+        self.pending_received = 0.0
+
+        # Simplified flight path; only vertices added since the last flush are sent to the page
+        self.flight_track = FlightTrack()
+        self.track_dirty = False
+        self.rendered_vertices = 0
+        self.rendered_generation = None
+
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(MAP_FRAME_INTERVAL_MS)
+        self.frame_timer.timeout.connect(self.flush_updates)
+
+        # Tiles come from the local cache server, which only goes online for tiles it has never seen
+        self.tile_cache = TileCache(open_tile_store())
+        self.tile_server = TileServer(self.tile_cache)
+        self.tile_server.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.tile_server.stop)
+
+        self.loadFinished.connect(self.on_load_finished)
         self.init_map()
 
     def init_map(self):
         # Create a map centered at a default location
-        self.map = folium.Map(location=[51.5074, -0.1278], zoom_start=10)
+        self.map = folium.Map(location=[51.5074, -0.1278], zoom_start=10, tiles=None)
+        folium.TileLayer(tiles=self.tile_server.url_template, attr=TILE_ATTRIBUTION, name="OpenStreetMap",
+                         max_zoom=MAX_ZOOM).add_to(self.map)
 
-        # Convert the folium map to HTML and load it into the web view
-        map_html = self.map._repr_html_()
-        self.setHtml(map_html)
+        # Render the folium map once; the base URL lets the page resolve assets/
+        map_html = self.map.get_root().render()
+        base_url = QUrl.fromLocalFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), ""))
+        self.setHtml(map_html, base_url)
 
-    def update_drone_location(self, latitude, longitude):
-        # Remove the previous drone marker if it exists
-        if self.drone_marker:
-            self.map.get_root().add_child(self.drone_marker)
-            self.drone_marker = None
+    def on_load_finished(self, ok):
+        if not ok:
+            return
+        self.page().runJavaScript(MAP_HELPERS_JS % {"map": self.map.get_name()})
+        self.map_loaded = True
+        self.frame_timer.start()
 
-        # Create a marker with a custom drone icon at the drone's location
-        drone_icon = folium.features.CustomIcon(icon_image='assets/drone_icon.png', icon_size=(50, 50))
-        self.drone_marker = folium.Marker([latitude, longitude], icon=drone_icon)
+    def run_map_script(self, script):
+        # Queue a call for the next frame flush
+        self.pending_calls.append(script)
 
-        # Add the drone marker to the map
-        self.map.get_root().add_child(self.drone_marker)
+    def flush_updates(self):
+        if not self.map_loaded:
+            return
 
-        # Convert the updated folium map to HTML and reload it into the web view
-        map_html = self.map._repr_html_()
-        self.setHtml(map_html)
+        scripts = self.pending_calls
+        self.pending_calls = []
+        if self.pending_drone is not None:
+            latitude, longitude, heading = self.pending_drone
+            heading_js = "null" if heading is None else repr(float(heading))
+            scripts.append(f"gcs.setDrone({float(latitude)!r}, {float(longitude)!r}, {heading_js});")
+            self.pending_drone = None
+
+        if self.track_dirty:
+            scripts.append(self.track_script())
+            self.track_dirty = False
+
+        # One round trip into the page per frame, however many updates arrived
+        if scripts:
+            self.page().runJavaScript("\n".join(scripts))
+        perf_metrics.record_since("dashboard.position_to_map", self.pending_received)
+        self.pending_received = 0.0
+
+    def update_drone_location(self, latitude, longitude, heading=None, timestamp=None, received=0.0):
+        # Only the newest position matters, older ones are overwritten before the flush
+        self.pending_drone = (latitude, longitude, heading)
+        self.pending_received = self.pending_received or received
+        self.flight_track.add(latitude, longitude, timestamp)
+        self.track_dirty = True
+
+    def track_script(self):
+        track = self.flight_track
+        if track.generation != self.rendered_generation:
+            # Vertices were thinned or cleared, redraw the whole (bounded) track once
+            script = f"gcs.resetTrack({json.dumps(track.coordinates())});"
+            new_vertices = []
+            self.rendered_generation = track.generation
+        else:
+            script = ""
+            new_vertices = track.coordinates(self.rendered_vertices)
+        self.rendered_vertices = len(track)
+        head = "null, null" if track.head is None else f"{track.head[0]!r}, {track.head[1]!r}"
+        return script + f"gcs.extendTrack({json.dumps(new_vertices)}, {head});"
 
-    def show_user_location(self):
-        # Get the user's current location using geocoder based on their IP address
-        g = geocoder.ip('me')
-        user_latitude, user_longitude = g.latlng
+    def clear_track(self):
+        self.flight_track.clear()
+        self.track_dirty = True
 
-        # Create a marker for the user's location
-        user_marker = folium.Marker([user_latitude, user_longitude], popup='Your Location')
+    def set_user_location(self, user_latitude, user_longitude):
+        # Add or move the user marker and center the view on it
+        self.run_map_script(f"gcs.setUser({user_latitude!r}, {user_longitude!r}, 12);")
 
-        # Add the user marker to the map
-        self.map.get_root().add_child(user_marker)
 
-        # Set the map view to the user's location
-        self.map.location = [user_latitude, user_longitude]
-        self.map.zoom_start = 12
+class DashboardPage(QWidget):
+    def __init__(self, telemetry_hub):
+        super().__init__()
 
-        # Convert the updated folium map to HTML and reload it into the web view
-        map_html = self.map._repr_html_()
-        self.setHtml(map_html)
+        self.telemetry_hub = telemetry_hub
+        self.status_label = None
+        self.user_location = None
 
+        # Geolocation and weather are fetched in the background and cached on disk
+        self.fetch_service = FetchService(parent=self)
+        self.fetch_service.location_ready.connect(self.on_user_location)
+        self.fetch_service.weather_ready.connect(self.on_weather)
+        self.fetch_service.fetch_failed.connect(self.on_fetch_failed)
 
-class DashboardPage(QWidget):
-    def __init__(self, vehicle):
-        super().__init__()
+        self.weather_timer = QTimer(self)
+        self.weather_timer.setInterval(WEATHER_REFRESH_INTERVAL_MS)
+        self.weather_timer.timeout.connect(self.update_weather_info)
 
-        self.vehicle = vehicle
         self.init_ui()
 
+        self.telemetry_hub.subscribe('GLOBAL_POSITION_INT', self.on_global_position_int)
+        # Each vehicle shown starts a fresh track; the tlog keeps every earlier flight
+        self.telemetry_hub.selected_vehicle_changed.connect(lambda _: self.map_widget.clear_track())
+        self.telemetry_hub.disconnected.connect(self.show_connection_status)
+        self.telemetry_hub.connection_lost.connect(lambda _: self.show_connection_status())
+
     def init_ui(self):
         self.setWindowTitle("Dashboard")
         layout = QVBoxLayout()
@@ -78,23 +218,46 @@ class DashboardPage(QWidget):
         self.connect_button.clicked.connect(self.show_connection_dialog)
         connection_layout.addWidget(self.connect_button)
 
+        # A recorded flight plays through the same hub as a live link
+        self.replay_button = QPushButton("Replay Log")
+        self.replay_button.clicked.connect(self.open_replay)
+        connection_layout.addWidget(self.replay_button)
+
+        # Which of the connected vehicles the map follows
+        self.vehicle_selector = VehicleSelector(self.telemetry_hub)
+        connection_layout.addWidget(self.vehicle_selector)
+
         layout.addLayout(connection_layout)
 
+        # Loss, throughput, heartbeat and round trip of the followed vehicle's link
+        self.link_quality_indicator = LinkQualityIndicator(self.telemetry_hub)
+        layout.addWidget(self.link_quality_indicator)
+
+        self.replay_controls = ReplayControls(self.telemetry_hub)
+        layout.addWidget(self.replay_controls)
+
         # Add the map widget to the layout
         self.map_widget = MapWidget()
         layout.addWidget(self.map_widget)
 
-        # Add a label for the drone's location
-        self.update_map(drone_connected=False)
-
         # Add a label for weather information
         self.weather_label = QLabel("Weather: N/A")
-        # Update the weather information
-        self.update_weather_info()
         layout.addWidget(self.weather_label)
 
+        # Center on the user's location; the weather follows once it is known
+        self.update_map(drone_connected=False)
+        self.weather_timer.start()
+
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        self.telemetry_hub.stream_rates.set_rates(self, STREAM_RATES)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.telemetry_hub.stream_rates.clear_rates(self)
+        super().hideEvent(event)
+
     def show_connection_dialog(self):
         dialog = QDialog(self)
         dialog.setWindowTitle("Connect to Drone")
@@ -134,32 +297,72 @@ class DashboardPage(QWidget):
         connection_type = self.connection_type_dropdown.currentText()
         connection_string = f"{connection_type.lower()}:{hostname}:{port}"
 
-        # Establish connection using MAVLink
+        # Establish connection using MAVLink, the hub reads it on its own thread
         try:
-            self.vehicle = mavutil.mavlink_connection(connection_string)
+            self.telemetry_hub.connect_to_vehicle(connection_string)
             QMessageBox.information(self, "Success", "Connected to the drone successfully.")
-            self.show_connection_status(hostname, port)
-            self.vehicle.add_message_listener('GLOBAL_POSITION_INT', self.on_global_position_int)
+            self.show_connection_status()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to connect to the drone: {str(e)}")
 
-    def show_connection_status(self, hostname, port):
-        status_label = QLabel(f"Connected to Drone on {hostname} port {port}")
-        layout = self.layout()
-        layout.insertWidget(0, status_label)  # Insert the status label at the top
+    def open_replay(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Replay Telemetry Log", TELEMETRY_LOG_FOLDER, REPLAY_FILE_FILTER)
+        if not path:
+            return
+        try:
+            self.telemetry_hub.connect_to_vehicle(f"{REPLAY_PREFIX}{path}")
+            self.show_connection_status()
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Failed to open the telemetry log: {str(e)}")
+
+    def show_connection_status(self):
+        # Reuse the status label on reconnect instead of stacking new ones
+        if self.status_label is None:
+            self.status_label = QLabel()
+            layout = self.layout()
+            layout.insertWidget(0, self.status_label)  # Insert the status label at the top
+        links = list(self.telemetry_hub.links)
+        if links:
+            self.status_label.setText(f"Connected to Drone on {', '.join(links)}")
+        else:
+            self.status_label.setText("Not connected")
 
-    def update_map(self, drone_connected, latitude=None, longitude=None):
+    def update_map(self, drone_connected, latitude=None, longitude=None, heading=None, timestamp=None, received=0.0):
         if drone_connected:
-            self.map_widget.update_drone_location(latitude, longitude)
+            self.map_widget.update_drone_location(latitude, longitude, heading, timestamp, received)
         else:
-            self.map_widget.show_user_location()
+            self.fetch_service.request_location()
+
+    def on_user_location(self, latitude, longitude, fresh):
+        self.map_widget.set_user_location(latitude, longitude)
+        self.user_location = (latitude, longitude)
+        self.update_weather_info()
 
     def update_weather_info(self):
-        # Get the weather information using the OpenWeatherMap API
-        pass
+        # Weather at the user's location, served from the cache until it expires
+        if self.user_location is None:
+            self.fetch_service.request_location()
+            return
+        self.fetch_service.request_weather(*self.user_location)
+
+    def on_weather(self, latitude, longitude, weather, fresh):
+        # Drop answers for a location the user has since moved away from
+        if self.user_location is None or weather_key(latitude, longitude) != weather_key(*self.user_location):
+            return
+        text = (f"Weather: {weather['temperature']:.1f}\u00b0C, {weather['description']}, "
+                f"wind {weather['wind_speed']:.0f} km/h from {weather['wind_direction']:.0f}\u00b0")
+        self.weather_label.setText(text if fresh else text + " (cached)")
+
+    def on_fetch_failed(self, kind, error):
+        # Keep showing whatever was cached; only say so when there is nothing at all
+        if kind == "weather" and self.weather_label.text() == "Weather: N/A":
+            self.weather_label.setText("Weather: unavailable (offline)")
 
-    def on_global_position_int(self, _, msg):
+    def on_global_position_int(self, msg):
         # Callback function to receive the GLOBAL_POSITION_INT message and update the map
         latitude = msg.lat / 1e7
         longitude = msg.lon / 1e7
-        self.update_map(drone_connected=True, latitude=latitude, longitude=longitude)
+        # hdg is in centidegrees, UINT16_MAX when unknown
+        heading = msg.hdg / 100 if msg.hdg != 65535 else None
+        self.update_map(drone_connected=True, latitude=latitude, longitude=longitude, heading=heading,
+                        timestamp=getattr(msg, "_timestamp", None), received=getattr(msg, "_received", 0.0))
@@ -1,26 +1,71 @@
+import math
+import numpy as np
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QLabel, QVBoxLayout, QWidget
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
+import perf_metrics
+from timeseries import TimeSeries
+from vehicle_selector import VehicleSelector
+
+# Samples kept per series; at 50 Hz this is 10 minutes of history
+SERIES_CAPACITY = 30000
+# Plot redraw rate, independent of how fast messages arrive
+PLOT_REFRESH_INTERVAL_MS = 50
+# Width of the visible time window in seconds
+PLOT_WINDOW_SECONDS = 60.0
+# Rates asked of the vehicle while the plots are on screen
+STREAM_RATES = {"ATTITUDE": 50, "RC_CHANNELS": 25}
+
+# (label, message type, field, line style) for every plotted series
+PLOT_SERIES = [
+    ("Roll", "RC_CHANNELS", "chan1_raw", "r-"),
+    ("Pitch", "RC_CHANNELS", "chan2_raw", "g-"),
+    ("Throttle", "RC_CHANNELS", "chan3_raw", "y-"),
+    ("Yaw", "RC_CHANNELS", "chan4_raw", "b-"),
+]
 
 class DataVisualizationPage(QWidget):
-    def __init__(self, vehicle):
+    def __init__(self, telemetry_hub):
         super().__init__()
 
-        self.vehicle = vehicle
+        self.telemetry_hub = telemetry_hub
+        self.series = []
+        self.lines = []
+        self.background = None
+        # Receive stamp of the oldest sample not yet drawn
+        self.oldest_pending = 0.0
 
         self.init_ui()
 
+        # Plots restart from empty whenever another vehicle is picked
+        self.telemetry_hub.selected_vehicle_changed.connect(self.clear_data)
+
     def init_ui(self):
         self.setWindowTitle("Data Visualization")
         layout = QVBoxLayout()
 
+        # Which of the connected vehicles is plotted
+        self.vehicle_selector = VehicleSelector(self.telemetry_hub)
+        layout.addWidget(self.vehicle_selector)
+
         # Create a Matplotlib figure and axes for the graph
-        self.figure, self.axes = plt.subplots(figsize=(8, 6))
+        self.figure = Figure(figsize=(8, 6))
+        self.axes = self.figure.add_subplot()
         self.axes.set_title("Throttle, Pitch, Roll, and Yaw Over Time")
         self.axes.set_xlabel("Time (seconds)")
         self.axes.set_ylabel("Value")
+        self.axes.set_xlim(0, PLOT_WINDOW_SECONDS)
+        # Standard RC PWM range, widened on demand
+        self.axes.set_ylim(900, 2100)
+
+        # One persistent artist per series, updated in place with set_data
+        for label, message_type, field, style in PLOT_SERIES:
+            self.add_series(label, message_type, field, style)
+        self.axes.legend(loc="upper left")
 
         self.canvas = FigureCanvas(self.figure)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
         layout.addWidget(self.canvas)
 
         # Labels to display pitch, roll, and yaw angles
@@ -35,32 +80,138 @@ class DataVisualizationPage(QWidget):
 
         self.setLayout(layout)
 
-        # Start receiving data from the vehicle
-        if self.vehicle is not None:
-            self.start_receiving_data()
+        # Redraw the plot at a fixed display rate
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(PLOT_REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refresh_plot)
+        self.refresh_timer.start()
+
+        # Start receiving data, the hub delivers messages once a vehicle connects
+        self.start_receiving_data()
+
+    def add_series(self, label, message_type, field, style, scale=1.0):
+        series = TimeSeries(label, message_type, field, SERIES_CAPACITY, scale)
+        # Animated artists are skipped by canvas.draw() and blitted on top of the cached background
+        line, = self.axes.plot([], [], style, label=label, animated=True)
+        self.series.append(series)
+        self.lines.append(line)
+        return series
 
     def start_receiving_data(self):
         # Subscribe to the ATTITUDE message to receive pitch, roll, and yaw data
-        self.vehicle.add_message_listener("ATTITUDE", self.handle_attitude_message)
-        # Subscribe to the RC_CHANNELS message to receive throttle data
-        self.vehicle.add_message_listener("RC_CHANNELS", self.handle_rc_channels_message)
+        self.telemetry_hub.subscribe("ATTITUDE", self.handle_attitude_message)
+        # Subscribe to every message type feeding a plotted series
+        for message_type in {series.message_type for series in self.series}:
+            if message_type == "RC_CHANNELS":
+                self.telemetry_hub.subscribe(message_type, self.handle_rc_channels_message)
+            elif message_type != "ATTITUDE":
+                # ATTITUDE series are fed by handle_attitude_message
+                self.telemetry_hub.subscribe(message_type, self.handle_series_message)
+
+    def showEvent(self, event):
+        self.telemetry_hub.stream_rates.set_rates(self, STREAM_RATES)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        # Nobody is looking, let the vehicle fall back to its own rates and spare the radio
+        self.telemetry_hub.stream_rates.clear_rates(self)
+        super().hideEvent(event)
+
+    def clear_data(self):
+        for series in self.series:
+            series.buffer.clear()
+            series.dirty = True
+        self.pitch_label.setText("Pitch: N/A")
+        self.roll_label.setText("Roll: N/A")
+        self.yaw_label.setText("Yaw: N/A")
 
     def handle_attitude_message(self, message):
         # Update the pitch, roll, and yaw labels with the received data
-        pitch_degrees = round(message.pitch * 180 / 3.14159, 2)
-        roll_degrees = round(message.roll * 180 / 3.14159, 2)
-        yaw_degrees = round(message.yaw * 180 / 3.14159, 2)
+        pitch_degrees = round(math.degrees(message.pitch), 2)
+        roll_degrees = round(math.degrees(message.roll), 2)
+        yaw_degrees = round(math.degrees(message.yaw), 2)
 
         self.pitch_label.setText(f"Pitch: {pitch_degrees} degrees")
         self.roll_label.setText(f"Roll: {roll_degrees} degrees")
         self.yaw_label.setText(f"Yaw: {yaw_degrees} degrees")
 
-    def handle_rc_channels_message(self, message):
-        # Update the throttle value in the graph
-        time = message.time_boot_ms * 1e-3
-        throttle = message.chan4_raw
+        self.handle_series_message(message)
 
-        self.axes.plot(time, throttle, 'y.', label="Throttle")
+    def handle_rc_channels_message(self, message):
+        # Only buffer the samples here, drawing happens on the refresh timer
+        self.handle_series_message(message)
 
-        self.axes.legend()
-        self.canvas.draw()
+    def handle_series_message(self, message):
+        if not self.oldest_pending:
+            self.oldest_pending = getattr(message, "_received", 0.0)
+        time = message.time_boot_ms * 1e-3
+        message_type = message.get_type()
+        for series in self.series:
+            if series.message_type == message_type:
+                series.add_message(time, message)
+
+    def on_draw(self, event):
+        # Cache everything except the animated lines after each full draw
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def update_limits(self):
+        # Returns True when the axes changed and a full redraw is needed
+        latest_time = None
+        low, high = self.axes.get_ylim()
+        new_low, new_high = low, high
+        for series in self.series:
+            last = series.buffer.last()
+            if last is None:
+                continue
+            latest_time = last[0] if latest_time is None else max(latest_time, last[0])
+            new_low = min(new_low, last[1])
+            new_high = max(new_high, last[1])
+
+        changed = False
+        if latest_time is not None:
+            start, end = self.axes.get_xlim()
+            if latest_time > end or latest_time < start:
+                # Jump half a window ahead so full redraws stay rare
+                new_start = max(0.0, latest_time - PLOT_WINDOW_SECONDS / 2)
+                self.axes.set_xlim(new_start, new_start + PLOT_WINDOW_SECONDS)
+                changed = True
+
+        if (new_low, new_high) != (low, high):
+            margin = (new_high - new_low) * 0.05
+            self.axes.set_ylim(new_low - margin, new_high + margin)
+            changed = True
+
+        return changed
+
+    def refresh_plot(self):
+        if not self.isVisible() or not any(series.dirty for series in self.series):
+            return
+
+        started = perf_metrics.now()
+        self.redraw_lines()
+        perf_metrics.record_since("plot.refresh", started)
+        perf_metrics.record_since("plot.message_to_draw", self.oldest_pending)
+        self.oldest_pending = 0.0
+
+    def redraw_lines(self):
+        limits_changed = self.update_limits()
+        window_start = self.axes.get_xlim()[0]
+        for series, line in zip(self.series, self.lines):
+            if series.dirty or limits_changed:
+                # Hand matplotlib only the samples inside the visible window
+                times, values = series.buffer.data()
+                first = np.searchsorted(times, window_start)
+                line.set_data(times[first:], values[first:])
+                series.dirty = False
+
+        if limits_changed or self.background is None:
+            # Full redraw re-captures the background via on_draw
+            self.canvas.draw()
+            return
+
+        self.canvas.restore_region(self.background)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+        self.canvas.blit(self.axes.bbox)
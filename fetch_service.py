@@ -0,0 +1,184 @@
+import json, os, queue, threading, time
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from PyQt6.QtCore import QCoreApplication, QObject, QThread, pyqtSignal
+from logger import logger
+
+CACHE_PATH = os.path.join("cache", "fetch_cache.json")
+
+# Seconds a cached result counts as fresh; older values are still shown while a refresh runs
+LOCATION_TTL = 60 * 60
+WEATHER_TTL = 15 * 60
+
+FETCH_TIMEOUT = 5.0
+
+# Weather is cached per ~1 km cell so small moves reuse the same entry
+WEATHER_KEY_DECIMALS = 2
+
+# IP geolocation in the ipinfo.io format ({"loc": "lat,lon"}), the service geocoder.ip used
+DEFAULT_LOCATION_URL = "https://ipinfo.io/json"
+# Open-Meteo current conditions, no API key needed
+DEFAULT_WEATHER_URL = "https://api.open-meteo.com/v1/forecast"
+
+# WMO weather interpretation codes used by Open-Meteo
+WEATHER_CODES = {
+    0: "Clear", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast", 45: "Fog", 48: "Rime fog",
+    51: "Light drizzle", 53: "Drizzle", 55: "Dense drizzle", 61: "Light rain", 63: "Rain", 65: "Heavy rain",
+    71: "Light snow", 73: "Snow", 75: "Heavy snow", 80: "Rain showers", 81: "Rain showers",
+    82: "Violent rain showers", 95: "Thunderstorm", 96: "Thunderstorm with hail", 99: "Thunderstorm with hail",
+}
+
+def weather_key(latitude, longitude):
+    return f"weather:{latitude:.{WEATHER_KEY_DECIMALS}f},{longitude:.{WEATHER_KEY_DECIMALS}f}"
+
+
+class FetchCache:
+    # Small JSON file of key -> (value, fetch time), read once and rewritten on every store
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable fetch cache {path}: {e}")
+
+    def get(self, key, ttl):
+        # (value, fresh) or None when nothing was ever stored
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, fetched_at = entry
+        return value, time.time() - fetched_at < ttl
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = [value, time.time()]
+            snapshot = json.dumps(self.entries)
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Write then rename so a crash never leaves a half written cache
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                f.write(snapshot)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write fetch cache {self.path}: {e}")
+
+
+class HttpFetchBackend:
+    # Default backend; point the URLs at a local server to run without the internet
+    def __init__(self, location_url=DEFAULT_LOCATION_URL, weather_url=DEFAULT_WEATHER_URL, timeout=FETCH_TIMEOUT):
+        self.location_url = location_url
+        self.weather_url = weather_url
+        self.timeout = timeout
+
+    def get_json(self, url):
+        with urlopen(url, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def locate(self):
+        reply = self.get_json(self.location_url)
+        if "loc" in reply:
+            latitude, longitude = reply["loc"].split(",")
+        else:
+            latitude, longitude = reply["lat"], reply["lon"]
+        return float(latitude), float(longitude)
+
+    def weather(self, latitude, longitude):
+        query = urlencode({"latitude": f"{latitude:.4f}", "longitude": f"{longitude:.4f}", "current_weather": "true"})
+        current = self.get_json(f"{self.weather_url}?{query}")["current_weather"]
+        code = int(current.get("weathercode", -1))
+        return {
+            "temperature": float(current["temperature"]),
+            "wind_speed": float(current["windspeed"]),
+            "wind_direction": float(current["winddirection"]),
+            "description": WEATHER_CODES.get(code, f"Code {code}"),
+        }
+
+
+class FetchThread(QThread):
+    # Runs queued fetches one at a time so a slow link never holds up the GUI thread
+    def __init__(self, service):
+        super().__init__(service)
+        self.service = service
+        self.jobs = queue.Queue()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            self.service.run_job(*job)
+
+
+class FetchService(QObject):
+    location_ready = pyqtSignal(float, float, bool)   # latitude, longitude, fresh
+    weather_ready = pyqtSignal(float, float, object, bool)   # latitude, longitude, weather dict, fresh
+    fetch_failed = pyqtSignal(str, str)   # "location" or "weather", error
+
+    def __init__(self, backend=None, cache=None, parent=None):
+        super().__init__(parent)
+
+        self.backend = backend if backend is not None else HttpFetchBackend()
+        self.cache = cache if cache is not None else FetchCache()
+        # Keys queued or being fetched, so repeated requests do not pile up behind a slow link
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.thread = FetchThread(self)
+        self.thread.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.stop)
+
+    def request_location(self):
+        self.request("location", "location", LOCATION_TTL, ())
+
+    def request_weather(self, latitude, longitude):
+        self.request("weather", weather_key(latitude, longitude), WEATHER_TTL, (latitude, longitude))
+
+    def request(self, kind, key, ttl, args):
+        # The cached value is delivered straight away; only a missing or stale one goes to the network
+        cached = self.cache.get(key, ttl)
+        if cached is not None:
+            value, fresh = cached
+            self.emit_result(kind, args, value, fresh)
+            if fresh:
+                return
+        with self.in_flight_lock:
+            if key in self.in_flight:
+                return
+            self.in_flight.add(key)
+        self.thread.jobs.put((kind, key, args))
+
+    def emit_result(self, kind, args, value, fresh):
+        if kind == "location":
+            self.location_ready.emit(float(value[0]), float(value[1]), fresh)
+        else:
+            self.weather_ready.emit(*args, value, fresh)
+
+    def run_job(self, kind, key, args):
+        # Fetch thread; signals are queued over to the receivers' thread
+        try:
+            value = self.backend.locate() if kind == "location" else self.backend.weather(*args)
+        except Exception as e:
+            with self.in_flight_lock:
+                self.in_flight.discard(key)
+            logger.warning(f"Fetching {kind} failed: {e}")
+            self.fetch_failed.emit(kind, str(e))
+            return
+        self.cache.put(key, list(value) if kind == "location" else value)
+        with self.in_flight_lock:
+            self.in_flight.discard(key)
+        self.emit_result(kind, args, value, True)
+
+    def stop(self):
+        if not self.thread.isRunning():
+            return
+        self.thread.jobs.put(None)
+        # An in-progress request is bounded by the backend timeout
+        self.thread.wait()
@@ -0,0 +1,136 @@
+import math, time
+import numpy as np
+from waypoint_store import EARTH_RADIUS_M
+
+# Vertices kept for the drawn track; at capacity every other vertex is dropped
+TRACK_CAPACITY = 2000
+# A vertex is kept once the path strays this far from the straight line through the last one
+TRACK_TOLERANCE_M = 2.0
+# Positions closer than this to the last one are hover jitter and ignored
+TRACK_MIN_STEP_M = 0.5
+
+TRACK_DTYPE = np.dtype([("latitude", np.float64), ("longitude", np.float64), ("time", np.float64)])
+
+def local_offset(origin_latitude, origin_longitude, latitude, longitude):
+    # East/north metres from the origin; flat-earth is plenty over one track segment
+    east = math.radians(longitude - origin_longitude) * EARTH_RADIUS_M * math.cos(math.radians(origin_latitude))
+    north = math.radians(latitude - origin_latitude) * EARTH_RADIUS_M
+    return east, north
+
+
+class FlightTrack:
+    # Online simplified flight path in fixed memory. Full resolution stays in the telemetry log.
+    def __init__(self, capacity=TRACK_CAPACITY, tolerance_m=TRACK_TOLERANCE_M, min_step_m=TRACK_MIN_STEP_M):
+        self.capacity = capacity
+        # Doubles on every decimation; a cleared track starts again from initial_tolerance_m
+        self.initial_tolerance_m = tolerance_m
+        self.tolerance_m = tolerance_m
+        self.min_step_m = min_step_m
+        self.vertices = np.zeros(capacity, dtype=TRACK_DTYPE)
+        self.count = 0
+        # Latest position, not yet a vertex: the live end of the drawn line
+        self.head = None
+        # Bumped whenever existing vertices change, telling renderers to redraw instead of extend
+        self.generation = 0
+        self.points_seen = 0
+        # Sleeve state since the last vertex: (reference direction, low, high) and furthest distance
+        self.sector = None
+        self.head_distance = 0.0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def data(self):
+        return self.vertices[:self.count]
+
+    def clear(self):
+        self.count = 0
+        self.head = None
+        self.generation += 1
+        self.points_seen = 0
+        self.tolerance_m = self.initial_tolerance_m
+        self.sector = None
+        self.head_distance = 0.0
+
+    def add(self, latitude, longitude, timestamp):
+        # Returns True when the previous head became a vertex
+        timestamp = time.time() if timestamp is None else timestamp
+        self.points_seen += 1
+        point = (latitude, longitude, timestamp)
+        if self.count == 0:
+            self.append_vertex(point)
+            return True
+        if self.head is not None:
+            step_east, step_north = local_offset(self.head[0], self.head[1], latitude, longitude)
+            if math.hypot(step_east, step_north) < self.min_step_m:
+                return False
+
+        committed = False
+        if not self.fits_sleeve(latitude, longitude):
+            # The new point cannot share a segment with everything since the last vertex
+            self.append_vertex(self.head)
+            committed = True
+            self.fits_sleeve(latitude, longitude)
+        self.head = point
+        return committed
+
+    def fits_sleeve(self, latitude, longitude):
+        # Sleeve fitting: every point since the last vertex narrows the sector of directions a
+        # segment from that vertex can take while passing within the tolerance of all of them
+        anchor = self.vertices[self.count - 1]
+        east, north = local_offset(float(anchor["latitude"]), float(anchor["longitude"]), latitude, longitude)
+        distance = math.hypot(east, north)
+        if distance < self.head_distance - self.tolerance_m:
+            # Turned back towards the last vertex, keep the turning point
+            return False
+        self.head_distance = max(self.head_distance, distance)
+        if distance <= self.tolerance_m:
+            return True
+
+        direction = math.atan2(north, east)
+        spread = math.asin(self.tolerance_m / distance)
+        if self.sector is None:
+            # Offsets are kept relative to the first direction so the sector never wraps around
+            self.sector = (direction, -spread, spread)
+            return True
+        reference, low, high = self.sector
+        offset = (direction - reference + math.pi) % (2 * math.pi) - math.pi
+        if not low <= offset <= high:
+            return False
+        self.sector = (reference, max(low, offset - spread), min(high, offset + spread))
+        return True
+
+    def append_vertex(self, point):
+        if self.count == self.capacity:
+            self.decimate()
+        self.vertices[self.count] = point
+        self.count += 1
+        self.sector = None
+        self.head_distance = 0.0
+
+    def decimate(self):
+        # Halve the vertex count keeping both ends; the track gets coarser instead of growing
+        keep = np.arange(0, self.count, 2)
+        if keep[-1] != self.count - 1:
+            keep = np.append(keep, self.count - 1)
+        kept = self.vertices[keep]
+        self.vertices[:len(kept)] = kept
+        self.count = len(kept)
+        self.tolerance_m *= 2
+        self.generation += 1
+
+    def coordinates(self, first=0):
+        # [[lat, lon], ...] for vertices from first on, ready for Leaflet
+        return np.column_stack((self.vertices["latitude"][first:self.count],
+                                self.vertices["longitude"][first:self.count])).tolist()
+
+
+def track_from_log(reader, start_time=None, end_time=None):
+    # Full resolution path out of a recorded tlog: (time, lat, lon) arrays
+    times, latitudes, longitudes = [], [], []
+    for msg in reader.messages(start_time, end_time, ["GLOBAL_POSITION_INT"]):
+        times.append(msg._timestamp)
+        latitudes.append(msg.lat / 1e7)
+        longitudes.append(msg.lon / 1e7)
+    return np.array(times), np.array(latitudes), np.array(longitudes)
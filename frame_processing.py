@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+
+def brightness_contrast_params(brightness, contrast):
+    # Slider values (0-100) to the gain/offset used on pixel values
+    alpha = (contrast + 100) / 100.0
+    beta = brightness - 50
+    return alpha, beta
+
+def build_brightness_contrast_lut(brightness, contrast):
+    # Same result as cv2.convertScaleAbs(frame, alpha, beta), precomputed for all 256 inputs
+    alpha, beta = brightness_contrast_params(brightness, contrast)
+    values = np.abs(np.arange(256, dtype=np.float64) * alpha + beta)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+def is_identity_lut(lut):
+    return np.array_equal(lut, np.arange(256, dtype=np.uint8))
+
+def apply_lut(frame, lut, dst=None):
+    # One table lookup per byte instead of float math per pixel
+    if dst is not None:
+        return cv2.LUT(frame, lut, dst=dst)
+    return cv2.LUT(frame, lut)
@@ -0,0 +1,285 @@
+import threading, time
+from collections import deque
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+import perf_metrics
+from logger import logger
+
+# Rates are averaged over this many whole seconds of traffic
+RATE_WINDOW_SECONDS = 5
+# MAVLink sequence numbers wrap at 256; a packet up to this far behind the newest one is late or a
+# duplicate, anything further back is the first packet after a gap. Kept small so an outage of up to
+# 256 - REORDER_WINDOW packets still counts as loss
+REORDER_WINDOW = 32
+HEARTBEAT_MSGID = 0
+# Smoothing of the heartbeat jitter estimate, as for RTP interarrival jitter (RFC 3550)
+JITTER_GAIN = 1 / 16
+# Round trips kept for the latency statistics
+ROUND_TRIP_HISTORY = 30
+# TIMESYNC pings measure the round trip to every vehicle on a live link
+UPDATE_INTERVAL_MS = 1000
+PING_TIMEOUT = 5.0
+# Indicator thresholds: packet loss as a fraction, heartbeat age and round trip in seconds
+LOSS_WARNING = 0.02
+LOSS_CRITICAL = 0.10
+HEARTBEAT_STALE = 3.0
+ROUND_TRIP_WARNING = 0.5
+
+
+class SequenceTracker:
+    # Loss, duplicates and reordering of one system/component from its packet sequence numbers
+    __slots__ = ("last", "seen", "received", "lost", "duplicates", "reordered")
+
+    def __init__(self, seq):
+        self.last = seq
+        # Which of the 256 sequence numbers arrived since they were last skipped over
+        self.seen = bytearray(256)
+        self.seen[seq] = 1
+        self.received = 1
+        self.lost = 0
+        self.duplicates = 0
+        self.reordered = 0
+
+    def update(self, seq):
+        self.received += 1
+        step = (seq - self.last) & 0xFF
+        late = step > 256 - REORDER_WINDOW
+        if step == 0 or (late and self.seen[seq]):
+            self.duplicates += 1
+        elif late:
+            # Counted lost when the packets after it overtook it
+            self.seen[seq] = 1
+            self.reordered += 1
+            if self.lost:
+                self.lost -= 1
+        else:
+            for skipped in range(self.last + 1, self.last + step):
+                self.seen[skipped & 0xFF] = 0
+            self.seen[seq] = 1
+            self.lost += step - 1
+            self.last = seq
+
+    def summary(self):
+        expected = self.received - self.duplicates + self.lost
+        return {"received": self.received, "lost": self.lost, "duplicates": self.duplicates,
+                "reordered": self.reordered, "loss": self.lost / expected if expected else 0.0}
+
+
+class HeartbeatTiming:
+    __slots__ = ("last", "interval", "jitter", "count")
+
+    def __init__(self, timestamp):
+        self.last = timestamp
+        self.interval = None
+        self.jitter = 0.0
+        self.count = 1
+
+    def update(self, timestamp):
+        interval = timestamp - self.last
+        if self.interval is not None:
+            self.jitter += (abs(interval - self.interval) - self.jitter) * JITTER_GAIN
+        self.interval = interval
+        self.last = timestamp
+        self.count += 1
+
+
+class LinkStatistics:
+    # Per-link counters fed by the I/O thread for every packet and read from the GUI thread. clock gives
+    # the time packets are stamped on: the wall clock for a live link, the log's clock for a replay.
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (system id, component id) -> SequenceTracker / HeartbeatTiming
+            self.sources = {}
+            self.heartbeats = {}
+            # Whole seconds of traffic, (second, {msgid: [messages, bytes]}), plus the one filling up
+            self.buckets = deque(maxlen=RATE_WINDOW_SECONDS)
+            self.second = None
+            self.current = {}
+            self.packets = 0
+            self.bytes = 0
+            # system id -> recent TIMESYNC round trips in seconds
+            self.round_trips = {}
+
+    def record(self, system_id, component_id, seq, msgid, size, timestamp):
+        with self.lock:
+            self.packets += 1
+            self.bytes += size
+            source = (system_id, component_id)
+            tracker = self.sources.get(source)
+            if tracker is None:
+                self.sources[source] = SequenceTracker(seq)
+            else:
+                tracker.update(seq)
+
+            second = int(timestamp)
+            if second != self.second:
+                if self.second is not None:
+                    self.buckets.append((self.second, self.current))
+                self.second = second
+                self.current = {}
+            counts = self.current.get(msgid)
+            if counts is None:
+                self.current[msgid] = [1, size]
+            else:
+                counts[0] += 1
+                counts[1] += size
+
+            if msgid == HEARTBEAT_MSGID:
+                timing = self.heartbeats.get(source)
+                if timing is None:
+                    self.heartbeats[source] = HeartbeatTiming(timestamp)
+                else:
+                    timing.update(timestamp)
+
+    def record_round_trip(self, system_id, seconds):
+        with self.lock:
+            history = self.round_trips.get(system_id)
+            if history is None:
+                history = self.round_trips[system_id] = deque(maxlen=ROUND_TRIP_HISTORY)
+            history.append(seconds)
+
+    def snapshot(self):
+        # Plain numbers keyed by msgid and "system:component", ready for JSON
+        now = self.clock()
+        with self.lock:
+            buckets = list(self.buckets)
+            if self.second is not None:
+                buckets.append((self.second, self.current))
+            # Only whole seconds inside the window count; the one filling up would read low
+            newest = int(now)
+            buckets = [(second, counts) for second, counts in buckets
+                       if newest - RATE_WINDOW_SECONDS <= second < newest]
+            rates = {}
+            for _, counts in buckets:
+                for msgid, (messages, size) in counts.items():
+                    totals = rates.setdefault(msgid, [0, 0])
+                    totals[0] += messages
+                    totals[1] += size
+            span = max(1, min(RATE_WINDOW_SECONDS, newest - buckets[0][0])) if buckets else 1
+            data = {
+                "packets": self.packets,
+                "bytes": self.bytes,
+                "messages_per_second": sum(messages for messages, _ in rates.values()) / span,
+                "bytes_per_second": sum(size for _, size in rates.values()) / span,
+                "rates": {msgid: {"messages_per_second": messages / span, "bytes_per_second": size / span}
+                          for msgid, (messages, size) in rates.items()},
+                "sources": {f"{system_id}:{component_id}": tracker.summary()
+                            for (system_id, component_id), tracker in self.sources.items()},
+                "heartbeats": {f"{system_id}:{component_id}": {
+                    "age": now - timing.last, "interval": timing.interval, "jitter": timing.jitter,
+                    "count": timing.count} for (system_id, component_id), timing in self.heartbeats.items()},
+                "round_trips": {system_id: {"last": history[-1], "mean": sum(history) / len(history),
+                                            "max": max(history)}
+                                for system_id, history in self.round_trips.items() if history},
+            }
+        return data
+
+
+class LinkQualityMonitor(QObject):
+    # Collects every link's statistics once a second for the dashboard and the metrics log, and pings the
+    # vehicles with TIMESYNC to measure the round trip
+    updated = pyqtSignal(object)
+
+    def __init__(self, telemetry_hub):
+        super().__init__(telemetry_hub)
+
+        self.telemetry_hub = telemetry_hub
+        # ts1 of TIMESYNC pings in flight -> connection string they went out on
+        self.pings = {}
+        self.latest = {}
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(UPDATE_INTERVAL_MS)
+        self.timer.timeout.connect(self.update)
+
+        telemetry_hub.connected.connect(self.on_connected)
+        telemetry_hub.disconnected.connect(self.on_disconnected)
+        telemetry_hub.subscribe("TIMESYNC", self.on_timesync, all_vehicles=True)
+
+    def on_connected(self, connection_string):
+        if not self.timer.isActive():
+            perf_metrics.add_source("links", self.snapshot)
+            self.timer.start()
+        self.update()
+
+    def on_disconnected(self):
+        self.timer.stop()
+        perf_metrics.remove_source("links")
+        self.pings = {}
+        self.latest = {}
+        self.updated.emit(self.latest)
+
+    def update(self):
+        self.ping()
+        self.latest = self.snapshot()
+        self.updated.emit(self.latest)
+
+    def snapshot(self):
+        from pymavlink import mavutil
+        mavlink_map = mavutil.mavlink.mavlink_map
+        links = {}
+        for connection_string, link in self.telemetry_hub.links.items():
+            data = link.statistics.snapshot()
+            data["rates"] = {(mavlink_map[msgid].msgname if msgid in mavlink_map else str(msgid)): rates
+                             for msgid, rates in data["rates"].items()}
+            # Checksum failures and line noise the frame parser threw away, live links only
+            if link.parser is not None:
+                data["bad_packets"] = link.parser.bad_packets
+                data["skipped_bytes"] = link.parser.skipped_bytes
+            links[connection_string] = data
+        return links
+
+    def ping(self):
+        # A TIMESYNC with tc1 = 0 is answered by the autopilot echoing ts1, our send time in nanoseconds
+        from telemetry_replay import replay_path
+        now = time.time()
+        self.pings = {ts1: entry for ts1, entry in self.pings.items() if now - ts1 / 1e9 < PING_TIMEOUT}
+        for connection_string, link in self.telemetry_hub.links.items():
+            if replay_path(connection_string) is not None:
+                continue
+            ts1 = time.time_ns()
+            try:
+                link.send(link.connection.mav.timesync_encode(0, ts1))
+            except Exception as e:
+                logger.warning(f"Could not send TIMESYNC on {connection_string}: {e}")
+                continue
+            self.pings[ts1] = connection_string
+
+    def on_timesync(self, msg):
+        if msg.tc1 == 0:
+            return
+        connection_string = self.pings.pop(msg.ts1, None)
+        link = self.telemetry_hub.links.get(connection_string)
+        if link is None:
+            return
+        # Receive time stamped on the I/O thread, so GUI thread delays stay out of the measurement
+        link.statistics.record_round_trip(msg.get_srcSystem(), msg._timestamp - msg.ts1 / 1e9)
+
+    def vehicle_summary(self, system_id):
+        # What the dashboard shows for one vehicle: its link's rates and its own loss, heartbeat and latency
+        vehicle = self.telemetry_hub.vehicle(system_id)
+        if vehicle is None:
+            return None
+        data = self.latest.get(vehicle.link.connection_string)
+        if data is None:
+            return None
+        sources = [summary for source, summary in data["sources"].items() if source.split(":")[0] == str(system_id)]
+        received = sum(summary["received"] - summary["duplicates"] for summary in sources)
+        lost = sum(summary["lost"] for summary in sources)
+        return {
+            "connection_string": vehicle.link.connection_string,
+            "loss": lost / (received + lost) if received + lost else 0.0,
+            "lost": lost,
+            "duplicates": sum(summary["duplicates"] for summary in sources),
+            "reordered": sum(summary["reordered"] for summary in sources),
+            "messages_per_second": data["messages_per_second"],
+            "bytes_per_second": data["bytes_per_second"],
+            "rates": data["rates"],
+            "bad_packets": data.get("bad_packets", 0),
+            "heartbeat": data["heartbeats"].get(f"{system_id}:{vehicle.component_id}"),
+            "round_trip": data["round_trips"].get(system_id),
+        }
@@ -0,0 +1,85 @@
+from PyQt6.QtWidgets import QHBoxLayout, QLabel, QWidget
+from link_quality import HEARTBEAT_STALE, LOSS_CRITICAL, LOSS_WARNING, ROUND_TRIP_WARNING
+
+# Label colours for good / degraded / bad
+GOOD_COLOR = "#2e7d32"
+WARNING_COLOR = "#ef6c00"
+CRITICAL_COLOR = "#c62828"
+# Message types listed in the tooltip, busiest first
+TOOLTIP_TYPES = 12
+
+def format_bytes_per_second(value):
+    return f"{value / 1024:.1f} kB/s" if value >= 1024 else f"{value:.0f} B/s"
+
+def format_ms(seconds):
+    return f"{seconds * 1e3:.0f} ms"
+
+
+class LinkQualityIndicator(QWidget):
+    # Loss, throughput, heartbeat and round trip of the selected vehicle's link, refreshed by the hub's
+    # link quality monitor; hidden while nothing is connected
+    def __init__(self, telemetry_hub, parent=None):
+        super().__init__(parent)
+
+        self.telemetry_hub = telemetry_hub
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.loss_label = QLabel()
+        self.throughput_label = QLabel()
+        self.heartbeat_label = QLabel()
+        self.round_trip_label = QLabel()
+        for label in (self.loss_label, self.throughput_label, self.heartbeat_label, self.round_trip_label):
+            layout.addWidget(label)
+        layout.addStretch()
+        self.setLayout(layout)
+        self.hide()
+
+        telemetry_hub.link_quality.updated.connect(self.refresh)
+        telemetry_hub.selected_vehicle_changed.connect(lambda _: self.refresh())
+
+    def refresh(self, _=None):
+        summary = self.telemetry_hub.link_quality.vehicle_summary(self.telemetry_hub.selected_system)
+        if summary is None:
+            self.hide()
+            return
+
+        loss = summary["loss"]
+        self.show_value(self.loss_label, f"Loss {loss * 100:.1f}% ({summary['lost']} lost, "
+                        f"{summary['duplicates']} dup, {summary['reordered']} late)",
+                        CRITICAL_COLOR if loss >= LOSS_CRITICAL else WARNING_COLOR if loss >= LOSS_WARNING
+                        else GOOD_COLOR)
+        self.throughput_label.setText(f"{summary['messages_per_second']:.0f} msg/s, "
+                                      f"{format_bytes_per_second(summary['bytes_per_second'])}")
+
+        heartbeat = summary["heartbeat"]
+        if heartbeat is None:
+            self.show_value(self.heartbeat_label, "Heartbeat -", WARNING_COLOR)
+        elif heartbeat["age"] >= HEARTBEAT_STALE:
+            self.show_value(self.heartbeat_label, f"Heartbeat {heartbeat['age']:.0f} s ago", CRITICAL_COLOR)
+        else:
+            interval = heartbeat["interval"]
+            self.show_value(self.heartbeat_label, f"Heartbeat {interval or 0:.2f} s "
+                            f"±{format_ms(heartbeat['jitter'])}", GOOD_COLOR)
+
+        round_trip = summary["round_trip"]
+        if round_trip is None:
+            # Replays and autopilots that do not answer TIMESYNC
+            self.round_trip_label.hide()
+        else:
+            self.show_value(self.round_trip_label, f"RTT {format_ms(round_trip['last'])} "
+                            f"(max {format_ms(round_trip['max'])})",
+                            WARNING_COLOR if round_trip["mean"] >= ROUND_TRIP_WARNING else GOOD_COLOR)
+            self.round_trip_label.show()
+
+        rates = sorted(summary["rates"].items(), key=lambda item: item[1]["bytes_per_second"], reverse=True)
+        lines = [f"{summary['connection_string']}: {summary['bad_packets']} corrupt packets"]
+        lines += [f"{message_type}: {rates['messages_per_second']:.1f} msg/s, "
+                  f"{format_bytes_per_second(rates['bytes_per_second'])}"
+                  for message_type, rates in rates[:TOOLTIP_TYPES]]
+        self.setToolTip("\n".join(lines))
+        self.show()
+
+    def show_value(self, label, text, color):
+        label.setText(text)
+        label.setStyleSheet(f"color: {color}")
@@ -1,4 +1,5 @@
-import os, logging
+import atexit, json, os, logging, queue, threading, time
+from logging.handlers import QueueHandler, RotatingFileHandler
 from PyQt6.QtCore import QDateTime
 
 # Get the current date and time
@@ -9,13 +10,170 @@ os.makedirs(logs_folder, exist_ok=True)
 # Use the date and time to create a unique log filename inside the "logs" folder
 log_filename = os.path.join(logs_folder, f"{current_date_time.toString('yyyyMMdd_hhmmss')}.log")
 
+# "text" or "json" (one JSON object per line)
+LOG_FORMAT = os.environ.get("GCS_LOG_FORMAT", "text")
+# Roll over to a new file at this size or age, whichever comes first
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_MAX_AGE_SECONDS = 24 * 60 * 60
+LOG_BACKUP_COUNT = 5
+# Written records reach the disk at most this often; errors are flushed at once
+LOG_FLUSH_INTERVAL = 1.0
+LOG_QUEUE_SIZE = 10000
+# Hot-path messages logged through log_rate_limited repeat at most this often per key
+RATE_LIMIT_INTERVAL = 1.0
 
-# Basic configuration for logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s [%(levelname)s]: %(message)s',
-                    filename=log_filename,
-                    filemode='a',
-                    datefmt='%Y-%m-%d %H:%M:%S')
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry)
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    # Size and age based rotation; the write buffer is only flushed when flush_now() says so
+    def __init__(self, filename, max_bytes, max_age, backup_count):
+        super().__init__(filename, mode="a", maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.max_age = max_age
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.stream is not None and time.time() - self.opened_at >= self.max_age:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+    def _open(self):
+        # Large buffer so a burst of records costs one write
+        return open(self.baseFilename, self.mode, buffering=64 * 1024, encoding=self.encoding)
+
+    def flush(self):
+        # Called by emit() after every record; the writer thread batches instead
+        pass
+
+    def flush_now(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+class LogWriterThread(threading.Thread):
+    # Drains the log queue in batches so file I/O never happens on the thread that logged
+    def __init__(self, log_queue, handlers):
+        super().__init__(name="LogWriter", daemon=True)
+        self.log_queue = log_queue
+        self.handlers = handlers
+        self.stopping = False
+
+    def run(self):
+        last_flush = time.monotonic()
+        pending = False
+        while True:
+            try:
+                record = self.log_queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                record = None
+            if record is None and self.stopping:
+                break
+
+            urgent = False
+            batch = [] if record is None else [record]
+            # Take whatever else is already queued without waiting
+            while batch and len(batch) < 1000:
+                try:
+                    record = self.log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self.stopping = True
+                    break
+                batch.append(record)
+            for record in batch:
+                urgent = urgent or record.levelno >= logging.ERROR
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            pending = pending or bool(batch)
+
+            if pending and (urgent or self.stopping or time.monotonic() - last_flush >= LOG_FLUSH_INTERVAL):
+                for handler in self.handlers:
+                    handler.flush_now()
+                last_flush = time.monotonic()
+                pending = False
+            if self.stopping and self.log_queue.empty():
+                break
+
+    def stop(self):
+        self.stopping = True
+        self.log_queue.put(None)
+        self.join()
+        for handler in self.handlers:
+            handler.flush_now()
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Never blocks the caller: if the writer falls far behind, records are counted and dropped
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+file_handler = BatchedRotatingFileHandler(log_filename, LOG_MAX_BYTES, LOG_MAX_AGE_SECONDS, LOG_BACKUP_COUNT)
+if LOG_FORMAT == "json":
+    file_handler.setFormatter(JsonLinesFormatter())
+else:
+    file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s',
+                                                datefmt='%Y-%m-%d %H:%M:%S'))
+
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+log_writer = LogWriterThread(log_queue, [file_handler])
+log_writer.start()
+
+# The root logger only enqueues; formatting to disk happens on the writer thread
+queue_handler = DroppingQueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+def shutdown_logging():
+    # Flush whatever is still queued when the application exits
+    if queue_handler.dropped:
+        logging.getLogger(__name__).warning(f"{queue_handler.dropped} log records were dropped, the log queue was full.")
+    log_writer.stop()
+
+atexit.register(shutdown_logging)
 
 # Create a logger
-logger = logging.getLogger(__name__)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+# key -> (time of the last record, number suppressed since)
+rate_limits = {}
+rate_limit_lock = threading.Lock()
+
+def log_rate_limited(key, level, message, interval=RATE_LIMIT_INTERVAL, **kwargs):
+    # For messages that can repeat at telemetry rates: at most one per interval per key
+    now = time.monotonic()
+    with rate_limit_lock:
+        last, suppressed = rate_limits.get(key, (None, 0))
+        if last is not None and now - last < interval:
+            rate_limits[key] = (last, suppressed + 1)
+            return
+        rate_limits[key] = (now, 0)
+    if suppressed:
+        message += f" ({suppressed} similar messages suppressed)"
+    logger.log(level, message, **kwargs)
@@ -1,10 +1,20 @@
-import sys
+import sys, importlib
+from PyQt6.QtCore import Qt, QCoreApplication, QTimer
+from PyQt6.QtGui import QKeySequence, QShortcut
 from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QStackedWidget, QPushButton, QWidget
-from dashboard_page import DashboardPage
-from mission_planning_page import MissionPlanningPage
-from camera_visualization_page import CameraVisualizationPage
-from data_visualization_page import DataVisualizationPage
-from settings_page import SettingsPage
+from perf_overlay import MetricsExporter, PerfPanel
+from telemetry_hub import TelemetryHub
+
+# (button label, module, class, takes the telemetry hub) for every page.
+# Modules are imported the first time their page is shown, so cv2, matplotlib,
+# folium and QtWebEngine stay off the startup path.
+PAGES = [
+    ("Dashboard", "dashboard_page", "DashboardPage", True),
+    ("Mission Planning", "mission_planning_page", "MissionPlanningPage", True),
+    ("Camera Visualization", "camera_visualization_page", "CameraVisualizationPage", False),
+    ("Data Visualization", "data_visualization_page", "DataVisualizationPage", True),
+    ("Settings", "settings_page", "SettingsPage", False),
+]
 
 class GroundStationApp(QMainWindow):
     def __init__(self):
@@ -14,58 +24,72 @@ class GroundStationApp(QMainWindow):
         self.setGeometry(100, 100, 1000, 800)
 
         layout = QVBoxLayout()
-        central_widget = QWidget()
-        central_widget.setLayout(layout)
-        self.setCentralWidget(central_widget)
 
         self.stacked_widget  = QStackedWidget()
 
-        # Initialize the vehicle
-        self.vehicle = None
-
-        # Initialize the pages
-        dashboard_page = DashboardPage(self.vehicle)
-        mission_planning_page = MissionPlanningPage(self.vehicle)
-        camera_visualization_page = CameraVisualizationPage()
-        data_visualization_page = DataVisualizationPage(self.vehicle)
-        settings_page = SettingsPage()
+        # Single telemetry hub owning the vehicle link, shared by every page
+        self.telemetry_hub = TelemetryHub(self)
 
-        self.stacked_widget.addWidget(dashboard_page)
-        self.stacked_widget.addWidget(mission_planning_page)
-        self.stacked_widget.addWidget(camera_visualization_page)
-        self.stacked_widget.addWidget(data_visualization_page)
-        self.stacked_widget.addWidget(settings_page)
+        # Pages are built on first use; index -> page widget once constructed
+        self.pages = {}
 
         layout.addWidget(self.stacked_widget)
 
         # Add buttons to switch between pages
-        self.dashboard_button = QPushButton("Dashboard")
-        self.mission_planning_button = QPushButton("Mission Planning")
-        self.camera_visualization_button = QPushButton("Camera Visualization")
-        self.data_visualization_button = QPushButton("Data Visualization")
-        self.settings_button = QPushButton("Settings")
-
-        # Connect buttons to their corresponding page
-        self.dashboard_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(0))
-        self.mission_planning_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(1))
-        self.camera_visualization_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(2))
-        self.data_visualization_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(3))
-        self.settings_button.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(4))
-
-        # Add buttons to the layout
-        layout.addWidget(self.dashboard_button)
-        layout.addWidget(self.mission_planning_button)
-        layout.addWidget(self.camera_visualization_button)
-        layout.addWidget(self.data_visualization_button)
-        layout.addWidget(self.settings_button)
+        self.page_buttons = []
+        for index, (label, _, _, _) in enumerate(PAGES):
+            button = QPushButton(label)
+            button.clicked.connect(lambda _, index=index: self.show_page(index))
+            layout.addWidget(button)
+            self.page_buttons.append(button)
 
         central_widget = QWidget()
         central_widget.setLayout(layout)
         self.setCentralWidget(central_widget)
 
+        # F12 toggles the latency panel; metrics are exported while measuring is on
+        self.metrics_exporter = MetricsExporter(self)
+        self.perf_panel = None
+        QShortcut(QKeySequence("F12"), self, self.toggle_perf_panel)
+
+        # Build the dashboard right after the window is on screen, not before
+        QTimer.singleShot(0, lambda: self.show_page(0))
+
+    def page(self, index):
+        if index not in self.pages:
+            _, module_name, class_name, takes_hub = PAGES[index]
+            page_class = getattr(importlib.import_module(module_name), class_name)
+            page = page_class(self.telemetry_hub) if takes_hub else page_class()
+            self.stacked_widget.addWidget(page)
+            self.pages[index] = page
+        return self.pages[index]
+
+    def show_page(self, index):
+        self.stacked_widget.setCurrentWidget(self.page(index))
+
+    def toggle_perf_panel(self):
+        if self.perf_panel is None:
+            self.perf_panel = PerfPanel(self.metrics_exporter, self)
+        self.perf_panel.setVisible(not self.perf_panel.isVisible())
+
+    def closeEvent(self, event):
+        # Pages inside the stack never get a close event of their own; closing them stops the camera
+        # capture and finishes a recording in progress
+        for page in self.pages.values():
+            page.close()
+        # A camera capture left blocked in open or read gets one more bounded wait before the window goes
+        camera_page = sys.modules.get("camera_visualization_page")
+        if camera_page is not None:
+            camera_page.wait_for_detached_captures()
+        # Stop the receive thread and release the socket before exiting
+        self.telemetry_hub.disconnect_from_vehicle()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
+    # Lets QtWebEngine be imported after the application exists, when the dashboard is first built
+    QCoreApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     window = GroundStationApp()
     window.setFixedSize
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
@@ -0,0 +1,163 @@
+import importlib, struct
+from pymavlink import mavutil
+from pymavlink.generator.mavcrc import x25crc
+
+MAVLINK_V1_MAGIC = 0xFE
+MAVLINK_V2_MAGIC = 0xFD
+MAVLINK_V1_HEADER = 6
+MAVLINK_V2_HEADER = 10
+MAVLINK_SIGNATURE_LENGTH = 13
+MAVLINK_IFLAG_SIGNED = 0x01
+MAGIC_BYTES = (MAVLINK_V1_MAGIC, MAVLINK_V2_MAGIC)
+CRC = struct.Struct("<H")
+
+def mavlink2_dialect():
+    # The MAVLink 2 module of the active dialect parses both v1 and v2 packets
+    return importlib.import_module(f"pymavlink.dialects.v20.{mavutil.current_dialect}")
+
+def packet_length(buffer, position):
+    # Total length of the packet starting at position, from its header alone
+    magic = buffer[position]
+    payload_length = buffer[position + 1]
+    if magic == MAVLINK_V1_MAGIC:
+        return MAVLINK_V1_HEADER + payload_length + 2
+    if magic == MAVLINK_V2_MAGIC:
+        signed = buffer[position + 2] & MAVLINK_IFLAG_SIGNED
+        return MAVLINK_V2_HEADER + payload_length + 2 + (MAVLINK_SIGNATURE_LENGTH if signed else 0)
+    return None
+
+def packet_msgid(buffer, position):
+    if buffer[position] == MAVLINK_V1_MAGIC:
+        return buffer[position + 5]
+    return buffer[position + 7] | (buffer[position + 8] << 8) | (buffer[position + 9] << 16)
+
+def header_length(packet):
+    return MAVLINK_V1_HEADER if packet[0] == MAVLINK_V1_MAGIC else MAVLINK_V2_HEADER
+
+
+class FrameParser:
+    # Splits a byte stream into MAVLink v1/v2 packets from their headers alone, every packet of a datagram
+    # or read in one call. Only the checksum is computed; payloads are left for the decoder, so packets
+    # nobody subscribed to are never unpacked. Returns (msgid, system id, component id, seq, packet) tuples.
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.buffer = bytearray()
+        # Bytes skipped while resynchronising and packets failing their checksum, for link statistics
+        self.skipped_bytes = 0
+        self.bad_packets = 0
+
+    def crc_extra(self, msgid):
+        message_class = self.dialect.mavlink_map.get(msgid)
+        return message_class.crc_extra if message_class is not None else None
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        size = len(buffer)
+        frames = []
+        position = 0
+        while position < size:
+            magic = buffer[position]
+            if magic not in MAGIC_BYTES:
+                # Resynchronise on the next start byte of either version
+                found = [index for index in (buffer.find(MAVLINK_V1_MAGIC, position),
+                                             buffer.find(MAVLINK_V2_MAGIC, position)) if index >= 0]
+                next_position = min(found) if found else size
+                self.skipped_bytes += next_position - position
+                position = next_position
+                continue
+            if size - position < 3:
+                break
+            length = packet_length(buffer, position)
+            if size - position < length:
+                break
+
+            msgid = packet_msgid(buffer, position)
+            header = MAVLINK_V1_HEADER if magic == MAVLINK_V1_MAGIC else MAVLINK_V2_HEADER
+            crc_end = position + header + buffer[position + 1]
+            crc_extra = self.crc_extra(msgid)
+            if crc_extra is not None:
+                crc = x25crc(buffer[position + 1:crc_end])
+                crc.accumulate(bytes((crc_extra,)))
+            # A message outside the dialect cannot be checked and is far more often a start byte inside
+            # noise than a real packet, so it is treated like a checksum failure: retry from the next byte
+            if crc_extra is None or crc.crc != CRC.unpack_from(buffer, crc_end)[0]:
+                self.bad_packets += 1
+                self.skipped_bytes += 1
+                position += 1
+                continue
+
+            if magic == MAVLINK_V1_MAGIC:
+                seq, system_id, component_id = buffer[position + 2], buffer[position + 3], buffer[position + 4]
+            else:
+                seq, system_id, component_id = buffer[position + 4], buffer[position + 5], buffer[position + 6]
+            frames.append((msgid, system_id, component_id, seq, bytes(buffer[position:position + length])))
+            position += length
+        del buffer[:position]
+        return frames
+
+
+class FastDecoder:
+    # Builds pymavlink message objects straight from one struct unpack. Messages without array or string
+    # fields (HEARTBEAT, ATTITUDE, GLOBAL_POSITION_INT, RC_CHANNELS, ...) skip pymavlink's generic decode;
+    # the rest go through it. Packets arrive checksummed by FrameParser.
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.mav = dialect.MAVLink(None)
+        self.mav.robust_parsing = True
+        # msgid -> (message class, payload struct, field names in wire order, instance attributes), or None
+        # for messages left to pymavlink
+        self.layouts = {}
+
+    def layout(self, msgid):
+        if msgid in self.layouts:
+            return self.layouts[msgid]
+        message_class = self.dialect.mavlink_map.get(msgid)
+        layout = None
+        if message_class is not None and sum(message_class.lengths) == len(message_class.lengths) and \
+                "s" not in message_class.unpacker.format:
+            wire_names = [None] * len(message_class.fieldnames)
+            for index, name in enumerate(message_class.fieldnames):
+                wire_names[message_class.orders[index]] = name
+            # What the generated constructor and MAVLink_message.__init__ would set
+            attributes = {
+                "_fieldnames": message_class.fieldnames,
+                "_type": message_class.msgname,
+                "_signed": False,
+                "_link_id": None,
+                "_instances": None,
+                "_instance_field": message_class.instance_field,
+                "_instance_offset": message_class.instance_offset,
+            }
+            layout = (message_class, message_class.unpacker, wire_names, attributes)
+        self.layouts[msgid] = layout
+        return layout
+
+    def decode(self, msgid, packet):
+        layout = self.layout(msgid)
+        if layout is None:
+            return self.mav.decode(bytearray(packet))
+
+        message_class, unpacker, wire_names, attributes = layout
+        header = header_length(packet)
+        payload_length = packet[1]
+        payload = packet[header:header + payload_length]
+        if payload_length < unpacker.size:
+            # MAVLink 2 trims trailing zeros
+            payload += bytes(unpacker.size - payload_length)
+        msg = message_class.__new__(message_class)
+        fields = msg.__dict__
+        fields.update(attributes)
+        fields.update(zip(wire_names, unpacker.unpack_from(payload)))
+        if header == MAVLINK_V1_HEADER:
+            incompat_flags = compat_flags = 0
+            seq, system_id, component_id = packet[2], packet[3], packet[4]
+        else:
+            incompat_flags, compat_flags = packet[2], packet[3]
+            seq, system_id, component_id = packet[4], packet[5], packet[6]
+        fields["_header"] = self.dialect.MAVLink_header(msgid, incompat_flags, compat_flags, payload_length, seq,
+                                                        system_id, component_id)
+        fields["_msgbuf"] = packet
+        fields["_payload"] = packet[header:header + payload_length]
+        fields["_crc"] = CRC.unpack_from(packet, header + payload_length)[0]
+        return msg
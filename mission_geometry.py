@@ -0,0 +1,278 @@
+import json
+import numpy as np
+from waypoint_store import EARTH_RADIUS_M
+
+# Planning defaults, same cruise speed the .plan export declares
+DEFAULT_CRUISE_SPEED = 15.0   # m/s
+DEFAULT_VERTICAL_SPEED = 3.0   # m/s, climb or descent
+DEFAULT_ENDURANCE = 20 * 60.0   # s of flight on a full battery
+
+# WGS84 ellipsoid for the Vincenty distances
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+VINCENTY_ITERATIONS = 20
+
+def haversine(latitudes1, longitudes1, latitudes2, longitudes2):
+    # Great-circle distance in metres on the mean-radius sphere, element-wise
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (latitudes1, longitudes1, latitudes2, longitudes2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def vincenty(latitudes1, longitudes1, latitudes2, longitudes2):
+    # Inverse Vincenty on WGS84, element-wise; sub-millimetre, with haversine for the rare non-converging pair
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (latitudes1, longitudes1, latitudes2, longitudes2))
+    L = lon2 - lon1
+    U1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sin_U1, cos_U1, sin_U2, cos_U2 = np.sin(U1), np.cos(U1), np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_U2 * sin_lam, cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos2_alpha)
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            if np.all(np.abs(lam - previous) < 1e-12):
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distance = WGS84_B * A * (sigma - delta_sigma)
+
+    unconverged = ~np.isfinite(distance) | (np.abs(lam - previous) >= 1e-9)
+    if np.any(unconverged):
+        distance = np.where(unconverged, haversine(latitudes1, longitudes1, latitudes2, longitudes2), distance)
+    return distance
+
+def initial_bearing(latitudes1, longitudes1, latitudes2, longitudes2):
+    # Compass bearing in degrees [0, 360) at the start of each leg
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (latitudes1, longitudes1, latitudes2, longitudes2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+class MissionGeometry:
+    # Per-waypoint leg values for a waypoint store; leg i runs from waypoint i-1 to i, leg 0 is empty
+    def __init__(self, cruise_speed=DEFAULT_CRUISE_SPEED, vertical_speed=DEFAULT_VERTICAL_SPEED,
+                 endurance=DEFAULT_ENDURANCE, ellipsoidal=True):
+        self.cruise_speed = cruise_speed
+        self.vertical_speed = vertical_speed
+        self.endurance = endurance
+        self.distance_function = vincenty if ellipsoidal else haversine
+        self.compute(None)
+
+    def __len__(self):
+        return len(self.leg_distance)
+
+    def compute(self, store):
+        # Full recompute, vectorised over every leg
+        count = 0 if store is None else len(store)
+        self.leg_distance = np.zeros(count)
+        self.bearing = np.full(count, np.nan)
+        self.climb = np.zeros(count)
+        self.leg_time = np.zeros(count)
+        if count > 1:
+            self.compute_legs(store.data, 1, count)
+        self.accumulate(0)
+
+    def compute_legs(self, data, first, last):
+        # Legs first..last-1 (each needs waypoint i-1), written in place
+        previous = data[first - 1:last - 1]
+        current = data[first:last]
+        self.leg_distance[first:last] = self.distance_function(previous["latitude"], previous["longitude"],
+                                                               current["latitude"], current["longitude"])
+        self.bearing[first:last] = initial_bearing(previous["latitude"], previous["longitude"],
+                                                   current["latitude"], current["longitude"])
+        self.climb[first:last] = current["altitude"].astype(np.float64) - previous["altitude"]
+        # The slower of flying the leg and changing height sets its duration
+        self.leg_time[first:last] = np.maximum(self.leg_distance[first:last] / self.cruise_speed,
+                                               np.abs(self.climb[first:last]) / self.vertical_speed)
+
+    def accumulate(self, first):
+        # Running totals only change from the first edited leg on
+        if first == 0:
+            self.cumulative_distance = np.cumsum(self.leg_distance)
+            self.cumulative_time = np.cumsum(self.leg_time)
+            return
+        self.cumulative_distance[first:] = self.cumulative_distance[first - 1] + np.cumsum(self.leg_distance[first:])
+        self.cumulative_time[first:] = self.cumulative_time[first - 1] + np.cumsum(self.leg_time[first:])
+
+    def update_rows(self, store, rows):
+        # A moved waypoint changes only its own leg and the next one
+        if len(store) != len(self):
+            self.compute(store)
+            return 0
+        first = max(1, min(rows))
+        last = min(len(store), max(rows) + 2)
+        if first < last:
+            self.compute_legs(store.data, first, last)
+        self.accumulate(first)
+        return max(0, min(rows))
+
+    def set_speeds(self, store, cruise_speed=None, vertical_speed=None):
+        if cruise_speed is not None:
+            self.cruise_speed = cruise_speed
+        if vertical_speed is not None:
+            self.vertical_speed = vertical_speed
+        self.compute(store)
+
+    def summary(self):
+        return {
+            "distance": float(self.cumulative_distance[-1]) if len(self) else 0.0,
+            "climb": float(np.maximum(self.climb, 0.0).sum()),
+            "descent": float(np.maximum(-self.climb, 0.0).sum()),
+            "time": float(self.cumulative_time[-1]) if len(self) else 0.0,
+            "battery": (float(self.cumulative_time[-1]) if len(self) else 0.0) / self.endurance,
+        }
+
+
+def local_projection(latitudes, longitudes, origin_latitude, origin_longitude):
+    # Equirectangular east/north metres around the origin; accurate enough over a fence's extent
+    x = np.radians(np.asarray(longitudes, dtype=np.float64) - origin_longitude) \
+        * EARTH_RADIUS_M * np.cos(np.radians(origin_latitude))
+    y = np.radians(np.asarray(latitudes, dtype=np.float64) - origin_latitude) * EARTH_RADIUS_M
+    return x, y
+
+def points_in_polygon(x, y, polygon_x, polygon_y):
+    # Even-odd ray casting, one edge at a time; points are sorted by y so each edge
+    # only touches the points inside its own y span
+    order = np.argsort(y, kind="stable")
+    sorted_x, sorted_y = x[order], y[order]
+    inside = np.zeros(len(x), dtype=bool)
+    x_end, y_end = np.roll(polygon_x, -1), np.roll(polygon_y, -1)
+    for x1, y1, x2, y2 in zip(polygon_x.tolist(), polygon_y.tolist(), x_end.tolist(), y_end.tolist()):
+        if y1 == y2:
+            continue
+        # Half-open span, a ray through a shared vertex counts once
+        low = np.searchsorted(sorted_y, min(y1, y2), side="right")
+        high = np.searchsorted(sorted_y, max(y1, y2), side="right")
+        if low == high:
+            continue
+        band_x, band_y = sorted_x[low:high], sorted_y[low:high]
+        inside[low:high] ^= band_x < x1 + (band_y - y1) * (x2 - x1) / (y2 - y1)
+    result = np.empty(len(x), dtype=bool)
+    result[order] = inside
+    return result
+
+def segments_cross(ax, ay, bx, by, polygon_x, polygon_y):
+    # Which segments a->b properly intersect any polygon edge. Segments are sorted by their lower y,
+    # so each edge only tests the few whose y range can overlap its own
+    crosses = np.zeros(len(ax), dtype=bool)
+    if len(ax) == 0:
+        return crosses
+    min_y = np.minimum(ay, by)
+    order = np.argsort(min_y, kind="stable")
+    ax, ay, bx, by, min_y = ax[order], ay[order], bx[order], by[order], min_y[order]
+    max_y = np.maximum(ay, by)
+    min_x, max_x = np.minimum(ax, bx), np.maximum(ax, bx)
+    tallest = float((max_y - min_y).max())
+    x_end, y_end = np.roll(polygon_x, -1), np.roll(polygon_y, -1)
+    for x1, y1, x2, y2 in zip(polygon_x.tolist(), polygon_y.tolist(), x_end.tolist(), y_end.tolist()):
+        low = np.searchsorted(min_y, min(y1, y2) - tallest, side="left")
+        high = np.searchsorted(min_y, max(y1, y2), side="right")
+        if low == high:
+            continue
+        band = slice(low, high)
+        # Bounding boxes next, most legs in the band are nowhere near the edge
+        near = ((min_x[band] <= max(x1, x2)) & (max_x[band] >= min(x1, x2)) & (max_y[band] >= min(y1, y2))
+                & ~crosses[band])
+        if not near.any():
+            continue
+        index = np.flatnonzero(near) + low
+        sax, say, sbx, sby = ax[index], ay[index], bx[index], by[index]
+        d1 = (x2 - x1) * (say - y1) - (y2 - y1) * (sax - x1)
+        d2 = (x2 - x1) * (sby - y1) - (y2 - y1) * (sbx - x1)
+        d3 = (sbx - sax) * (y1 - say) - (sby - say) * (x1 - sax)
+        d4 = (sbx - sax) * (y2 - say) - (sby - say) * (x2 - sax)
+        crosses[index] |= (d1 * d2 < 0) & (d3 * d4 < 0)
+    result = np.empty(len(crosses), dtype=bool)
+    result[order] = crosses
+    return result
+
+
+class Geofence:
+    # Inclusion/exclusion polygons ([[lat, lon], ...]) and circles ((lat, lon, radius m)), as in QGC .plan files
+    def __init__(self, polygons=(), circles=()):
+        # [(inclusion, latitudes, longitudes)] and [(inclusion, latitude, longitude, radius)]
+        self.polygons = [(bool(inclusion), np.asarray(vertices, dtype=np.float64)[:, 0],
+                          np.asarray(vertices, dtype=np.float64)[:, 1]) for inclusion, vertices in polygons]
+        self.circles = [(bool(inclusion), float(latitude), float(longitude), float(radius))
+                        for inclusion, latitude, longitude, radius in circles]
+        latitudes = [latitude for _, lats, _ in self.polygons for latitude in lats.tolist()]
+        latitudes += [latitude for _, latitude, _, _ in self.circles]
+        longitudes = [longitude for _, _, lons in self.polygons for longitude in lons.tolist()]
+        longitudes += [longitude for _, _, longitude, _ in self.circles]
+        self.origin = (float(np.mean(latitudes)), float(np.mean(longitudes))) if latitudes else (0.0, 0.0)
+        self.projected = [(inclusion, *local_projection(lats, lons, *self.origin))
+                          for inclusion, lats, lons in self.polygons]
+
+    def __bool__(self):
+        return bool(self.polygons or self.circles)
+
+    def outside_points(self, latitudes, longitudes):
+        # True where a waypoint is outside every inclusion zone (if any) or inside an exclusion zone
+        x, y = local_projection(latitudes, longitudes, *self.origin)
+        included = np.zeros(len(x), dtype=bool)
+        excluded = np.zeros(len(x), dtype=bool)
+        has_inclusion = False
+        for inclusion, polygon_x, polygon_y in self.projected:
+            inside = points_in_polygon(x, y, polygon_x, polygon_y)
+            if inclusion:
+                has_inclusion = True
+                included |= inside
+            else:
+                excluded |= inside
+        for inclusion, latitude, longitude, radius in self.circles:
+            inside = haversine(latitudes, longitudes, latitude, longitude) <= radius
+            if inclusion:
+                has_inclusion = True
+                included |= inside
+            else:
+                excluded |= inside
+        return excluded | (~included if has_inclusion else False)
+
+    def crossing_legs(self, latitudes, longitudes):
+        # True at waypoint i when the leg from waypoint i-1 crosses a polygon fence edge
+        crossing = np.zeros(len(latitudes), dtype=bool)
+        if len(latitudes) < 2:
+            return crossing
+        x, y = local_projection(latitudes, longitudes, *self.origin)
+        for _, polygon_x, polygon_y in self.projected:
+            crossing[1:] |= segments_cross(x[:-1], y[:-1], x[1:], y[1:], polygon_x, polygon_y)
+        return crossing
+
+    def violations(self, data):
+        # Per waypoint: waypoint outside the allowed area, or the leg into it crossing the fence
+        if not self or len(data) == 0:
+            return np.zeros(len(data), dtype=bool)
+        return (self.outside_points(data["latitude"], data["longitude"])
+                | self.crossing_legs(data["latitude"], data["longitude"]))
+
+def load_geofence(path):
+    # The geoFence section of a QGroundControl .plan file
+    with open(path) as f:
+        plan = json.load(f)
+    fence = plan.get("geoFence", {})
+    polygons = [(item.get("inclusion", True), item["polygon"]) for item in fence.get("polygons", [])
+                if len(item.get("polygon", [])) >= 3]
+    circles = [(item.get("inclusion", True), item["circle"]["center"][0], item["circle"]["center"][1],
+                item["circle"]["radius"]) for item in fence.get("circles", [])]
+    return Geofence(polygons, circles)
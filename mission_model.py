@@ -0,0 +1,261 @@
+import numpy as np
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QStyledItemDelegate, QComboBox
+from waypoint_store import WaypointStore, MISSION_TYPE_COMMANDS, mission_type_name
+from mission_geometry import MissionGeometry
+
+MISSION_TYPES = list(MISSION_TYPE_COMMANDS)
+
+# Column index -> header; the columns after Mission Type are computed and read-only
+MISSION_COLUMNS = ["Latitude", "Longitude", "Altitude", "Mission Type", "Leg (m)", "Bearing", "Distance (m)",
+                   "Climb (m)", "ETA"]
+LATITUDE_COLUMN, LONGITUDE_COLUMN, ALTITUDE_COLUMN, MISSION_TYPE_COLUMN, LEG_COLUMN, BEARING_COLUMN, \
+    DISTANCE_COLUMN, CLIMB_COLUMN, ETA_COLUMN = range(len(MISSION_COLUMNS))
+FIRST_GEOMETRY_COLUMN = LEG_COLUMN
+VIOLATION_COLOR = QColor(255, 200, 200)
+# Store field shown in each numeric column
+COLUMN_FIELDS = ["latitude", "longitude", "altitude"]
+
+def contiguous_ranges(rows):
+    # Sorted rows -> [(first, last), ...] so bulk changes emit one signal per block
+    ranges = []
+    for row in sorted(set(rows)):
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return [tuple(block) for block in ranges]
+
+def validate_waypoint(latitude, longitude, altitude):
+    if not -90.0 <= latitude <= 90.0:
+        raise ValueError(f"Latitude {latitude} is outside -90..90.")
+    if not -180.0 <= longitude <= 180.0:
+        raise ValueError(f"Longitude {longitude} is outside -180..180.")
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class MissionTableModel(QAbstractTableModel):
+    # Emitted after leg distances, times or geofence results change
+    geometry_changed = pyqtSignal()
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+
+        self.store = store if store is not None else WaypointStore()
+        self.geometry = MissionGeometry()
+        self.geofence = None
+        self.compute_geometry()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(MISSION_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return MISSION_COLUMNS[section]
+        # Row numbers come from the header, so inserts never touch the rows below
+        return f"Mission {section + 1}"
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return VIOLATION_COLOR if self.violations[row] else None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return "Outside the geofence or crossing its boundary" if self.violations[row] else None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return None
+        # Read straight from the store's columns, no per-row Python objects
+        if column == MISSION_TYPE_COLUMN:
+            return mission_type_name(self.store.records["command"][row])
+        if column >= FIRST_GEOMETRY_COLUMN:
+            return self.geometry_text(row, column)
+        return float(self.store.records[COLUMN_FIELDS[column]][row])
+
+    def geometry_text(self, row, column):
+        # The first waypoint has no leg into it
+        if row == 0 and column in (LEG_COLUMN, BEARING_COLUMN, CLIMB_COLUMN):
+            return ""
+        if column == LEG_COLUMN:
+            return f"{self.geometry.leg_distance[row]:.1f}"
+        if column == BEARING_COLUMN:
+            return f"{self.geometry.bearing[row]:.0f}\u00b0"
+        if column == DISTANCE_COLUMN:
+            return f"{self.geometry.cumulative_distance[row]:.1f}"
+        if column == CLIMB_COLUMN:
+            return f"{self.geometry.climb[row]:+.1f}"
+        return format_duration(self.geometry.cumulative_time[row])
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if index.column() >= FIRST_GEOMETRY_COLUMN:
+            return Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
+        return Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole or index.column() >= FIRST_GEOMETRY_COLUMN:
+            return False
+        row = index.row()
+        column = index.column()
+        if column == MISSION_TYPE_COLUMN:
+            if value not in MISSION_TYPES:
+                return False
+            self.store.set_row(row, command=MISSION_TYPE_COMMANDS[value])
+        else:
+            try:
+                waypoint = [float(self.store.records[field][row]) for field in COLUMN_FIELDS]
+                waypoint[column] = float(value)
+                validate_waypoint(*waypoint)
+            except (TypeError, ValueError):
+                return False
+            self.store.set_row(row, **{COLUMN_FIELDS[column]: waypoint[column]})
+        self.dataChanged.emit(index, index, [role])
+        if column != MISSION_TYPE_COLUMN:
+            self.update_geometry(row)
+        return True
+
+    def waypoint(self, row):
+        # ((lat, lon, alt), mission type) for dialogs
+        record = self.store.records[row]
+        return ((float(record["latitude"]), float(record["longitude"]), float(record["altitude"])),
+                mission_type_name(record["command"]))
+
+    def set_store(self, store):
+        # Wholesale replacement, e.g. after a mission download or file import
+        self.beginResetModel()
+        self.store = store
+        self.compute_geometry()
+        self.endResetModel()
+
+    def set_waypoint(self, row, waypoint, mission_type):
+        validate_waypoint(*waypoint)
+        latitude, longitude, altitude = waypoint
+        self.store.set_row(row, latitude=latitude, longitude=longitude, altitude=altitude,
+                           command=MISSION_TYPE_COMMANDS[mission_type])
+        self.update_geometry(row)
+
+    def insert_waypoints(self, row, records):
+        if len(records) == 0:
+            return
+        self.beginInsertRows(QModelIndex(), row, row + len(records) - 1)
+        self.store.insert(row, records)
+        self.compute_geometry()
+        self.endInsertRows()
+        self.geometry_rows_changed(row + len(records))
+
+    def append_waypoints(self, records):
+        self.insert_waypoints(len(self.store), records)
+
+    def remove_waypoints(self, rows):
+        ranges = contiguous_ranges(rows)
+        if not ranges:
+            return
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.store.delete(range(first, last + 1))
+            self.compute_geometry()
+            self.endRemoveRows()
+            self.geometry_rows_changed(first)
+            return
+        # A scattered selection is one store delete and one geometry pass, not one of each per block
+        self.beginResetModel()
+        self.store.delete([row for first, last in ranges for row in range(first, last + 1)])
+        self.compute_geometry()
+        self.endResetModel()
+        self.geometry_changed.emit()
+
+    def waypoints_changed(self, first=0, last=None):
+        # Bulk in-place edits (altitude offset, translate, reverse) repaint only the affected rows
+        last = len(self.store) - 1 if last is None else last
+        if last >= first:
+            # Running totals below the edited block change too
+            self.compute_geometry()
+            self.geometry_rows_changed(first)
+
+    def move_waypoints(self, rows, destination):
+        # Move a contiguous selection so its first row lands at destination
+        ranges = contiguous_ranges(rows)
+        if len(ranges) != 1:
+            raise ValueError("Only a contiguous block of missions can be moved.")
+        first, last = ranges[0]
+        destination = max(0, min(destination, len(self.store) - (last - first + 1)))
+        if destination == first:
+            return False
+
+        # Qt's destination is the row the block is inserted before, in pre-move numbering
+        qt_destination = destination if destination < first else destination + (last - first + 1)
+        if not self.beginMoveRows(QModelIndex(), first, last, QModelIndex(), qt_destination):
+            return False
+        self.store.move(first, last, destination)
+        self.compute_geometry()
+        self.endMoveRows()
+        self.geometry_rows_changed(min(first, destination))
+        return True
+
+    def reorder_waypoints(self, order):
+        # Whole-mission reordering, e.g. from the route optimiser
+        self.beginResetModel()
+        self.store.reorder(order)
+        self.compute_geometry()
+        self.endResetModel()
+        self.geometry_changed.emit()
+
+    def compute_geometry(self):
+        # Whole-mission recompute, used whenever rows are added, removed or reordered
+        self.geometry.compute(self.store)
+        self.violations = np.zeros(len(self.store), dtype=bool)
+        if self.geofence:
+            self.violations = self.geofence.violations(self.store.data)
+
+    def update_geometry(self, row):
+        # One waypoint changed: only the legs into and out of it are recomputed; running totals
+        # (and so the displayed cells) change from that row down
+        self.geometry.update_rows(self.store, [row])
+        if self.geofence:
+            # The leg out of the row starts at it, so rows row..row+1 can change
+            first = max(row - 1, 0)
+            last = min(row + 2, len(self.store))
+            self.violations[row:last] = self.geofence.violations(self.store.data[first:last])[row - first:]
+        self.geometry_rows_changed(row)
+
+    def geometry_rows_changed(self, first):
+        last = len(self.store) - 1
+        if last >= first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(MISSION_COLUMNS) - 1))
+        self.geometry_changed.emit()
+
+    def set_cruise_speed(self, cruise_speed):
+        self.geometry.set_speeds(self.store, cruise_speed=cruise_speed)
+        self.geometry_rows_changed(0)
+
+    def set_geofence(self, geofence):
+        self.geofence = geofence
+        self.compute_geometry()
+        self.geometry_rows_changed(0)
+
+
+class MissionTypeDelegate(QStyledItemDelegate):
+    # Mission type cells are edited in place with a combo box
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.addItems(MISSION_TYPES)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(Qt.ItemDataRole.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.ItemDataRole.EditRole)
@@ -1,13 +1,25 @@
-from pymavlink import mavutil
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, \
-    QPushButton, QDialog, QLineEdit, QRadioButton, QMessageBox
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTableView, QAbstractItemView, \
+    QHeaderView, QPushButton, QDialog, QLineEdit, QRadioButton, QMessageBox, QProgressDialog, QFileDialog, \
+    QDoubleSpinBox
+from mission_geometry import MissionGeometry, load_geofence, DEFAULT_CRUISE_SPEED
+from mission_model import MissionTableModel, MissionTypeDelegate, MISSION_TYPE_COLUMN, format_duration
+from mission_transfer import MissionTransferWorker
+from route_optimizer import RouteOptimizerWorker, flight_runs
+from survey import survey_waypoints, load_survey_polygon, DEFAULT_SIDE_OVERLAP, DEFAULT_FRONT_OVERLAP
+from waypoint_store import WaypointStore, make_waypoint, load_mission_file, save_mission_file, mission_type_name
+
+MISSION_FILE_FILTER = "Mission files (*.waypoints *.txt *.plan);;QGC WPL (*.waypoints *.txt);;QGC Plan (*.plan)"
+GEOFENCE_FILE_FILTER = "QGC Plan (*.plan)"
 
 class MissionPlanningPage(QWidget):
-    def __init__(self, vehicle):
+    def __init__(self, telemetry_hub):
         super().__init__()
 
-        self.missions_data = []
-        self.vehicle = vehicle
+        self.missions_model = MissionTableModel()
+        self.telemetry_hub = telemetry_hub
+        self.transfer_worker = None
+        self.optimizer_worker = None
 
         self.init_ui()
 
@@ -15,21 +27,60 @@ class MissionPlanningPage(QWidget):
         self.setWindowTitle("Mission Planning")
         layout = QVBoxLayout()
 
-        # List of missions
-        self.missions_list = QListWidget()
-        self.update_missions_list()
+        # Table of missions; rows are painted by the view's delegates, no widget per waypoint
+        self.missions_list = QTableView()
+        self.missions_list.setModel(self.missions_model)
+        self.missions_list.setItemDelegateForColumn(MISSION_TYPE_COLUMN, MissionTypeDelegate(self.missions_list))
+        self.missions_list.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.missions_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.missions_list.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked
+                                           | QAbstractItemView.EditTrigger.EditKeyPressed)
+        # Fixed row heights keep scrolling through thousands of rows cheap
+        self.missions_list.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.missions_list.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         layout.addWidget(self.missions_list)
 
+        # Mission totals, cruise speed for the ETA column, and the geofence the rows are checked against
+        summary_layout = QHBoxLayout()
+        self.summary_label = QLabel()
+        summary_layout.addWidget(self.summary_label, 1)
+        summary_layout.addWidget(QLabel("Cruise speed (m/s):"))
+        self.cruise_speed_input = QDoubleSpinBox()
+        self.cruise_speed_input.setRange(1.0, 100.0)
+        self.cruise_speed_input.setValue(DEFAULT_CRUISE_SPEED)
+        summary_layout.addWidget(self.cruise_speed_input)
+        self.load_geofence_button = QPushButton("Load Geofence")
+        self.clear_geofence_button = QPushButton("Clear Geofence")
+        self.clear_geofence_button.setEnabled(False)
+        summary_layout.addWidget(self.load_geofence_button)
+        summary_layout.addWidget(self.clear_geofence_button)
+        self.optimize_button = QPushButton("Optimise Route")
+        summary_layout.addWidget(self.optimize_button)
+        layout.addLayout(summary_layout)
+
         # Buttons to create, delete, and edit missions
         buttons_layout = QHBoxLayout()
         self.create_button = QPushButton("Create Mission")
+        self.survey_button = QPushButton("Create Survey")
         self.delete_button = QPushButton("Delete Mission")
         self.edit_button = QPushButton("Edit Mission")
         self.uplad_mission = QPushButton("Upload Mission")
+        self.download_mission_button = QPushButton("Download Mission")
+        self.move_up_button = QPushButton("Move Up")
+        self.move_down_button = QPushButton("Move Down")
         buttons_layout.addWidget(self.create_button)
+        buttons_layout.addWidget(self.survey_button)
         buttons_layout.addWidget(self.delete_button)
         buttons_layout.addWidget(self.edit_button)
+        buttons_layout.addWidget(self.move_up_button)
+        buttons_layout.addWidget(self.move_down_button)
         buttons_layout.addWidget(self.uplad_mission)
+        buttons_layout.addWidget(self.download_mission_button)
+
+        self.import_button = QPushButton("Import Mission")
+        self.export_button = QPushButton("Export Mission")
+        buttons_layout.addWidget(self.import_button)
+        buttons_layout.addWidget(self.export_button)
 
         layout.addLayout(buttons_layout)
 
@@ -37,41 +88,124 @@ class MissionPlanningPage(QWidget):
 
         # Connect button signals to corresponding functions
         self.create_button.clicked.connect(self.create_mission)
+        self.survey_button.clicked.connect(self.create_survey)
         self.delete_button.clicked.connect(self.delete_mission)
         self.edit_button.clicked.connect(self.edit_mission)
+        self.move_up_button.clicked.connect(lambda: self.move_selected_missions(-1))
+        self.move_down_button.clicked.connect(lambda: self.move_selected_missions(1))
         self.uplad_mission.clicked.connect(self.upload_mission)
+        self.download_mission_button.clicked.connect(self.download_mission)
+        self.import_button.clicked.connect(self.import_mission)
+        self.export_button.clicked.connect(self.export_mission)
+        self.cruise_speed_input.valueChanged.connect(self.missions_model.set_cruise_speed)
+        self.load_geofence_button.clicked.connect(self.load_geofence)
+        self.clear_geofence_button.clicked.connect(self.clear_geofence)
+        self.optimize_button.clicked.connect(self.optimize_route)
+        self.missions_model.geometry_changed.connect(self.update_summary)
+        self.missions_model.modelReset.connect(self.update_summary)
+        self.update_summary()
+
+    @property
+    def missions_data(self):
+        # Columnar waypoint store behind the table
+        return self.missions_model.store
+
+    def update_summary(self):
+        summary = self.missions_model.geometry.summary()
+        text = (f"Distance: {summary['distance'] / 1000:.2f} km   Climb: +{summary['climb']:.0f} m / "
+                f"-{summary['descent']:.0f} m   ETA: {format_duration(summary['time'])}   "
+                f"Battery: {summary['battery'] * 100:.0f}%")
+        if self.missions_model.geofence:
+            violations = int(self.missions_model.violations.sum())
+            text += f"   Geofence: {violations} outside" if violations else "   Geofence: OK"
+        self.summary_label.setText(text)
+
+    def load_geofence(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Geofence", "", GEOFENCE_FILE_FILTER)
+        if not path:
+            return
+        try:
+            geofence = load_geofence(path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+            QMessageBox.warning(self, "Error", f"Could not load a geofence from {path}: {e}")
+            return
+        if not geofence:
+            QMessageBox.warning(self, "Error", f"{path} has no geofence polygons or circles.")
+            return
+        self.missions_model.set_geofence(geofence)
+        self.clear_geofence_button.setEnabled(True)
 
-    def update_missions_list(self):
-        self.missions_list.clear()
-        for idx, mission_data in enumerate(self.missions_data, start=1):
-            mission_info = f"Mission {idx}:"
-            waypoint = mission_data["waypoint"]
-            latitude_info = f"Latitude: {waypoint[0]}"
-            longitude_info = f"Longitude: {waypoint[1]}"
-            altitude_info = f"Altitude: {waypoint[2]}"
-            mission_type_info = f"Mission Type: {mission_data['mission_type']}"
-
-            mission_label = QLabel(mission_info)
-            latitude_label = QLabel(latitude_info)
-            longitude_label = QLabel(longitude_info)
-            altitude_label = QLabel(altitude_info)
-            mission_type_label = QLabel(mission_type_info)
-
-            # Create a container widget for the mission item
-            container_widget = QWidget()
-            container_layout = QVBoxLayout()
-            container_layout.addWidget(mission_label)
-            container_layout.addWidget(latitude_label)
-            container_layout.addWidget(longitude_label)
-            container_layout.addWidget(altitude_label)
-            container_layout.addWidget(mission_type_label)
-            container_widget.setLayout(container_layout)
-
-            # Set the size hint for the list widget item
-            item = QListWidgetItem(self.missions_list)
-            item.setSizeHint(container_widget.sizeHint())
-            self.missions_list.addItem(item)
-            self.missions_list.setItemWidget(item, container_widget)
+    def clear_geofence(self):
+        self.missions_model.set_geofence(None)
+        self.clear_geofence_button.setEnabled(False)
+
+    def optimize_route(self):
+        if self.optimizer_worker is not None:
+            return
+        if not any(last > first for first, last in flight_runs(self.missions_data.data["command"])):
+            QMessageBox.warning(self, "Error", "There are no Flight waypoints to reorder.")
+            return
+
+        # Searches a snapshot off the GUI thread; the table stays as it is until the result is accepted
+        self.optimizer_worker = RouteOptimizerWorker(self.missions_data.data.copy())
+        self.optimizer_progress = QProgressDialog("Optimising route...", None, 0, 0, self)
+        self.optimizer_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.optimizer_progress.setMinimumDuration(0)
+        self.optimizer_worker.succeeded.connect(self.on_route_optimized)
+        self.optimizer_worker.failed.connect(self.on_route_failed)
+        self.optimizer_worker.finished.connect(self.on_optimizer_finished)
+        self.optimizer_worker.start()
+
+    def on_route_optimized(self, order):
+        self.optimizer_progress.close()
+        if len(order) != len(self.missions_data):
+            QMessageBox.warning(self, "Error", "The mission changed while the route was being optimised.")
+            return
+        before = self.missions_model.geometry.summary()["distance"]
+        geometry = MissionGeometry(self.missions_model.geometry.cruise_speed)
+        geometry.compute(WaypointStore(self.missions_data.data[order]))
+        after = geometry.summary()["distance"]
+        if after >= before:
+            QMessageBox.information(self, "Optimise Route",
+                                    f"No shorter route found than the current {before / 1000:.2f} km.")
+            return
+        answer = QMessageBox.question(self, "Optimise Route",
+                                      f"Distance: {before / 1000:.2f} km -> {after / 1000:.2f} km "
+                                      f"({(before - after) / before * 100:.1f}% shorter).\n\n"
+                                      "Apply the new waypoint order?")
+        if answer == QMessageBox.StandardButton.Yes:
+            self.missions_model.reorder_waypoints(order)
+
+    def on_route_failed(self, reason):
+        self.optimizer_progress.close()
+        QMessageBox.warning(self, "Error", f"Route optimisation failed: {reason}")
+
+    def on_optimizer_finished(self):
+        self.optimizer_worker.deleteLater()
+        self.optimizer_worker = None
+
+    def selected_rows(self):
+        return sorted(index.row() for index in self.missions_list.selectionModel().selectedRows())
+
+    def import_mission(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Mission", "", MISSION_FILE_FILTER)
+        if not path:
+            return
+        try:
+            store = load_mission_file(path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, "Error", f"Could not import {path}: {e}")
+            return
+        self.missions_model.set_store(store)
+
+    def export_mission(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Mission", "", MISSION_FILE_FILTER)
+        if not path:
+            return
+        try:
+            save_mission_file(self.missions_data, path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not export {path}: {e}")
 
     def create_mission(self):
         dialog = QDialog(self)
@@ -114,6 +248,80 @@ class MissionPlanningPage(QWidget):
         dialog.setLayout(dialog_layout)
         dialog.exec()
 
+    def create_survey(self):
+        # The area comes from 3+ selected waypoints (which the survey replaces) or from a .plan file
+        rows = self.selected_rows()
+        if len(rows) >= 3:
+            data = self.missions_data.data
+            polygon = list(zip(data["latitude"][rows].tolist(), data["longitude"][rows].tolist()))
+            source = f"Area: the {len(rows)} selected waypoints, which the survey replaces"
+        else:
+            path, _ = QFileDialog.getOpenFileName(self, "Survey Area", "", GEOFENCE_FILE_FILTER)
+            if not path:
+                return
+            try:
+                polygon = load_survey_polygon(path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                QMessageBox.warning(self, "Error", f"Could not load a survey area from {path}: {e}")
+                return
+            rows = []
+            source = f"Area: {len(polygon)} corners from {path}"
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Create Survey")
+        dialog_layout = QVBoxLayout()
+        dialog_layout.addWidget(QLabel(source))
+
+        def add_field(label, minimum, maximum, value, suffix):
+            field = QDoubleSpinBox()
+            field.setRange(minimum, maximum)
+            field.setValue(value)
+            field.setSuffix(suffix)
+            dialog_layout.addWidget(QLabel(label))
+            dialog_layout.addWidget(field)
+            return field
+
+        self.survey_altitude_input = add_field("Altitude:", 1.0, 10000.0, 80.0, " m")
+        self.footprint_width_input = add_field("Camera footprint across track:", 0.1, 10000.0, 100.0, " m")
+        self.footprint_length_input = add_field("Camera footprint along track:", 0.1, 10000.0, 75.0, " m")
+        self.side_overlap_input = add_field("Side overlap:", 0.0, 95.0, DEFAULT_SIDE_OVERLAP * 100, " %")
+        self.front_overlap_input = add_field("Front overlap:", 0.0, 95.0, DEFAULT_FRONT_OVERLAP * 100, " %")
+        self.survey_heading_input = add_field("Line heading:", 0.0, 359.9, 0.0, " \u00b0")
+
+        create_button = QPushButton("Create")
+        create_button.clicked.connect(lambda: self.add_survey(dialog, polygon, rows))
+        dialog_layout.addWidget(create_button)
+
+        dialog.setLayout(dialog_layout)
+        dialog.exec()
+
+    def add_survey(self, dialog, polygon, rows):
+        try:
+            records = survey_waypoints(polygon, self.survey_altitude_input.value(),
+                                       self.footprint_width_input.value(), self.footprint_length_input.value(),
+                                       self.side_overlap_input.value() / 100, self.front_overlap_input.value() / 100,
+                                       self.survey_heading_input.value())
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        if len(records) == 0:
+            QMessageBox.warning(self, "Error", "The survey area is too small for a single line.")
+            return
+
+        if rows:
+            # The outline waypoints make way for the survey
+            row = rows[0]
+            self.missions_model.remove_waypoints(rows)
+        else:
+            # Before a final Land item, otherwise at the end
+            commands = self.missions_data.data["command"]
+            row = len(commands)
+            if row and mission_type_name(commands[-1]) == "Land":
+                row -= 1
+        # One insert for the whole block, however many thousand rows
+        self.missions_model.insert_waypoints(row, records)
+        dialog.close()
+
     def add_waypoint(self):
         # Check if a mission type is selected
         if not self.takeoff_radio.isChecked() and not self.flight_radio.isChecked() and not self.land_radio.isChecked():
@@ -139,10 +347,7 @@ class MissionPlanningPage(QWidget):
                 mission_type = "Land"
 
             # Create a new mission with the waypoint and mission type
-            new_mission = {"waypoint": (latitude, longitude, altitude), "mission_type": mission_type}
-            self.missions_data.append(new_mission)
-
-            self.update_missions_list()
+            self.missions_model.append_waypoints(make_waypoint(latitude, longitude, altitude, mission_type))
 
         except ValueError:
             QMessageBox.warning(self, "Error", "Invalid input. Please enter valid numbers for latitude, longitude, and altitude.")
@@ -151,20 +356,35 @@ class MissionPlanningPage(QWidget):
         self.sender().parent().close()
 
     def delete_mission(self):
-        selected_item = self.missions_list.currentItem()
-        if selected_item:
-            idx = self.missions_list.currentRow()
-            if 0 <= idx < len(self.missions_data):
-                del self.missions_data[idx]
-                self.update_missions_list()
+        # Delete every selected mission in one bulk removal
+        rows = self.selected_rows()
+        if rows:
+            self.missions_model.remove_waypoints(rows)
+
+    def move_selected_missions(self, offset):
+        rows = self.selected_rows()
+        if not rows:
+            return
+        try:
+            moved = self.missions_model.move_waypoints(rows, rows[0] + offset)
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        if moved:
+            # Keep the moved block selected
+            selection = self.missions_list.selectionModel()
+            selection.clearSelection()
+            first = max(0, min(rows[0] + offset, len(self.missions_data) - len(rows)))
+            for row in range(first, first + len(rows)):
+                selection.select(self.missions_model.index(row, 0),
+                                 selection.SelectionFlag.Select | selection.SelectionFlag.Rows)
 
     def edit_mission(self):
-        selected_item = self.missions_list.currentItem()
-        if selected_item:
-            idx = self.missions_list.currentRow()
+        current = self.missions_list.currentIndex()
+        if current.isValid():
+            idx = current.row()
             if 0 <= idx < len(self.missions_data):
-                mission_data = self.missions_data[idx]
-                waypoint = mission_data["waypoint"]
+                waypoint, mission_type = self.missions_model.waypoint(idx)
 
                 dialog = QDialog(self)
                 dialog.setWindowTitle("Edit Mission Parameters")
@@ -200,7 +420,6 @@ class MissionPlanningPage(QWidget):
                 dialog_layout.addLayout(mission_type_layout)
 
                 # Set the selected mission type based on the existing mission data
-                mission_type = mission_data["mission_type"]
                 if mission_type == "Takeoff":
                     self.takeoff_radio.setChecked(True)
                 elif mission_type == "Flight":
@@ -216,8 +435,6 @@ class MissionPlanningPage(QWidget):
                 dialog.exec()
 
     def confirm_edit_mission(self, dialog, idx):
-        mission_data = self.missions_data[idx]
-
         # Check if a mission type is selected
         if not self.takeoff_radio.isChecked() and not self.flight_radio.isChecked() and not self.land_radio.isChecked():
             QMessageBox.warning(self, "Error", "Please select a mission type.")
@@ -237,56 +454,73 @@ class MissionPlanningPage(QWidget):
             elif self.land_radio.isChecked():
                 mission_type = "Land"
             
-            mission_data["waypoint"] = (new_latitude, new_longitude, new_altitude)
-            mission_data["mission_type"] = mission_type
+            # Only this row is repainted
+            self.missions_model.set_waypoint(idx, (new_latitude, new_longitude, new_altitude), mission_type)
         except ValueError:
             QMessageBox.warning(self, "Error", "Invalid input. Please enter valid numbers for latitude, longitude, and altitude.")
             return
 
-        self.update_missions_list()
         dialog.close()
 
     def upload_mission(self):
-        if self.vehicle is None:
+        if not self.telemetry_hub.is_connected():
             QMessageBox.warning(self, "Error", "No vehicle connected.")
             return
         if len(self.missions_data) == 0 :
             QMessageBox.warning(self, "Error", "No mission added.")
             return
-        
-        cmds = []
-        for mission in self.missions_data:
-            # Retrieve latitude, longitude, and altitude from the mission dictionary
-            latitude, longitude, altitude = mission["waypoint"]
-            # Retrieve the mission type from the mission dictionary
-            mission_type = mission["mission_type"]
-
-            # Create a command based on the mission type
-            cmd = None
-            if mission_type == "Takeoff":
-                # Handle takeoff mission
-                cmd = self.vehicle.message_factory.command_long_encode(
-                    0, 0,
-                    mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
-                    0, 0, 0, 0, 0, 0, 0, 0, altitude
-                )
-            elif mission_type == "Flight":
-                # Handle flight mission
-                cmd = self.vehicle.message_factory.command_long_encode(
-                    0, 0,
-                    mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
-                    0, 0, 0, 0, 0, 0, latitude, longitude, altitude
-                )
-            elif mission_type == "Land":
-                # Handle land mission
-                cmd = self.vehicle.message_factory.command_long_encode(
-                    0, 0,
-                    mavutil.mavlink.MAV_CMD_NAV_LAND,
-                    0, 0, 0, 0, 0, 0, latitude, longitude, 0
-                )
-
-            # Add the command to the list of mission commands
-            cmds.append(cmd)
-        
-        # Upload the mission to the vehicle
-        self.vehicle.send_mavlink(cmds)
\ No newline at end of file
+
+        try:
+            self.missions_data.validate()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+
+        # Run the MISSION_COUNT/REQUEST/ITEM/ACK handshake off the GUI thread on a snapshot of the store
+        self.start_transfer(MissionTransferWorker.UPLOAD, self.missions_data.data.copy(), "Uploading mission...")
+
+    def download_mission(self):
+        if not self.telemetry_hub.is_connected():
+            QMessageBox.warning(self, "Error", "No vehicle connected.")
+            return
+        self.start_transfer(MissionTransferWorker.DOWNLOAD, None, "Downloading mission...")
+
+    def start_transfer(self, direction, items, label):
+        if self.transfer_worker is not None:
+            QMessageBox.warning(self, "Error", "A mission transfer is already in progress.")
+            return
+
+        self.transfer_progress = QProgressDialog(label, "Cancel", 0, len(items) if items is not None else 0, self)
+        self.transfer_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.transfer_progress.setMinimumDuration(0)
+
+        # Built last: the worker registers itself with the hub and is only released when it finishes
+        self.transfer_worker = MissionTransferWorker(self.telemetry_hub, direction, items)
+        self.transfer_progress.canceled.connect(self.transfer_worker.cancel)
+
+        self.transfer_worker.progress.connect(self.on_transfer_progress)
+        self.transfer_worker.succeeded.connect(self.on_transfer_succeeded)
+        self.transfer_worker.failed.connect(self.on_transfer_failed)
+        self.transfer_worker.finished.connect(self.on_transfer_finished)
+        self.transfer_worker.start()
+
+    def on_transfer_progress(self, done, total):
+        self.transfer_progress.setMaximum(total)
+        self.transfer_progress.setValue(done)
+
+    def on_transfer_succeeded(self, result):
+        if self.transfer_worker.direction == MissionTransferWorker.UPLOAD:
+            QMessageBox.information(self, "Success", f"Uploaded {result} mission items.")
+            return
+
+        # Replace the local mission with what the vehicle holds
+        self.missions_model.set_store(WaypointStore(result))
+        QMessageBox.information(self, "Success", f"Downloaded {len(result)} mission items.")
+
+    def on_transfer_failed(self, reason):
+        QMessageBox.warning(self, "Error", f"Mission transfer failed: {reason}")
+
+    def on_transfer_finished(self):
+        self.transfer_progress.close()
+        self.transfer_worker.deleteLater()
+        self.transfer_worker = None
@@ -0,0 +1,281 @@
+import queue, sys, time
+import numpy as np
+from pymavlink import mavutil
+from PyQt6.QtCore import QThread, pyqtSignal
+from logger import logger
+from waypoint_store import WAYPOINT_DTYPE, mavlink_float
+
+mavlink = mavutil.mavlink
+
+# Mission protocol replies the engine consumes
+MISSION_MESSAGE_TYPES = ("MISSION_REQUEST_INT", "MISSION_REQUEST", "MISSION_ACK", "MISSION_COUNT",
+                         "MISSION_ITEM_INT", "MISSION_ITEM")
+
+class MissionTransferError(Exception):
+    pass
+
+
+def mission_type_args(mav, mission_type):
+    # MAVLink 1 dialects have no mission_type extension field, only MAVLink 2 ones do
+    module = sys.modules[type(mav).__module__]
+    if "mission_type" in module.MAVLink_mission_count_message.fieldnames:
+        return (mission_type,)
+    return ()
+
+
+class MissionTransferEngine:
+    def __init__(self, mav, target_system, target_component, timeout=1.0, max_retries=5, window=1,
+                 mission_type=mavlink.MAV_MISSION_TYPE_MISSION, send=None):
+        # mav only encodes; send puts the packets on the link, e.g. MavlinkLink.send so other
+        # senders on the same link are serialised with us
+        self.mav = mav
+        self.send = send if send is not None else mav.send
+        self.target_system = target_system
+        self.target_component = target_component
+        self.timeout = timeout
+        self.max_retries = max_retries
+        # Number of item requests kept in flight while downloading. PX4 answers requests out of
+        # sequence with an error, so more than one is only for autopilots known to accept it
+        self.window = max(1, window)
+        self.mission_type = mission_type
+        self.mission_type_args = mission_type_args(mav, mission_type)
+
+        # Filled from whichever thread reads the link
+        self.inbox = queue.Queue()
+        self.cancelled = False
+        self.retransmissions = 0
+
+    def handle_message(self, msg):
+        # Only mission protocol traffic from the vehicle we talk to is of interest
+        if msg.get_type() not in MISSION_MESSAGE_TYPES:
+            return
+        if msg.get_srcSystem() != self.target_system:
+            return
+        if getattr(msg, "mission_type", self.mission_type) != self.mission_type:
+            return
+        self.inbox.put(msg)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def next_message(self, deadline):
+        if self.cancelled:
+            raise MissionTransferError("Mission transfer cancelled.")
+        try:
+            return self.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            return None
+
+    def drain_inbox(self):
+        # Forget replies left over from an earlier transfer
+        while True:
+            try:
+                self.inbox.get_nowait()
+            except queue.Empty:
+                return
+
+    def encode_items(self, records):
+        # Encode everything up front so each request is answered without delay
+        latitudes = np.rint(records["latitude"] * 1e7).astype(np.int64).tolist()
+        longitudes = np.rint(records["longitude"] * 1e7).astype(np.int64).tolist()
+        encoded = []
+        for seq, row in enumerate(records.tolist()):
+            _, _, altitude, command, frame, autocontinue, param1, param2, param3, param4 = row
+            encoded.append(self.mav.mission_item_int_encode(
+                self.target_system, self.target_component, seq, frame, command, 1 if seq == 0 else 0,
+                autocontinue, param1, param2, param3, param4, latitudes[seq], longitudes[seq], altitude,
+                *self.mission_type_args))
+        return encoded
+
+    def upload(self, records, progress=None):
+        # records is a WAYPOINT_DTYPE array, e.g. WaypointStore.data
+        self.drain_inbox()
+        encoded = self.encode_items(records)
+        count = len(encoded)
+        count_msg = self.mav.mission_count_encode(self.target_system, self.target_component, count,
+                                                  *self.mission_type_args)
+
+        self.send(count_msg)
+        last_sent = count_msg
+        highest_sent = -1
+        retries = 0
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            msg = self.next_message(deadline)
+            if msg is None:
+                # Nothing heard: repeat whatever we sent last, the vehicle may have missed it
+                retries += 1
+                if retries > self.max_retries:
+                    raise MissionTransferError(f"Vehicle stopped responding after item {highest_sent + 1}/{count}.")
+                self.retransmissions += 1
+                self.send(last_sent)
+                deadline = time.monotonic() + self.timeout
+                continue
+
+            msg_type = msg.get_type()
+            if msg_type in ("MISSION_REQUEST_INT", "MISSION_REQUEST"):
+                if not 0 <= msg.seq < count:
+                    logger.warning(f"Vehicle requested mission item {msg.seq} of {count}, ignoring.")
+                    continue
+                # Repeated requests are answered too, the vehicle lost our item
+                last_sent = encoded[msg.seq]
+                self.send(last_sent)
+                if msg.seq > highest_sent:
+                    highest_sent = msg.seq
+                    retries = 0
+                    if progress is not None:
+                        progress(highest_sent + 1, count)
+                deadline = time.monotonic() + self.timeout
+            elif msg_type == "MISSION_ACK":
+                if msg.type != mavlink.MAV_MISSION_ACCEPTED:
+                    result = mavlink.enums["MAV_MISSION_RESULT"].get(msg.type)
+                    name = result.name if result is not None else str(msg.type)
+                    raise MissionTransferError(f"Vehicle rejected the mission: {name}.")
+                if highest_sent + 1 < count:
+                    # Accepted before every item was requested, e.g. a stale ACK
+                    logger.warning("Ignoring early MISSION_ACK during upload.")
+                    continue
+                if progress is not None:
+                    progress(count, count)
+                return count
+
+    def request_count(self):
+        request_list = self.mav.mission_request_list_encode(self.target_system, self.target_component,
+                                                            *self.mission_type_args)
+        for _ in range(self.max_retries + 1):
+            self.send(request_list)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                msg = self.next_message(deadline)
+                if msg is None:
+                    self.retransmissions += 1
+                    break
+                if msg.get_type() == "MISSION_COUNT":
+                    return msg.count
+        raise MissionTransferError("Vehicle did not report its mission count.")
+
+    def download(self, progress=None):
+        # Returns a WAYPOINT_DTYPE array with the vehicle's mission
+        self.drain_inbox()
+        count = self.request_count()
+        items = np.zeros(count, dtype=WAYPOINT_DTYPE)
+        have = np.zeros(count, dtype=bool)
+        received = 0
+        next_seq = 0
+        # seq -> (deadline, retries) for every request in flight
+        pending = {}
+
+        while received < count:
+            # Keep the request window full
+            while next_seq < count and len(pending) < self.window:
+                if not have[next_seq]:
+                    self.send(self.mav.mission_request_int_encode(
+                        self.target_system, self.target_component, next_seq, *self.mission_type_args))
+                    pending[next_seq] = (time.monotonic() + self.timeout, 0)
+                next_seq += 1
+
+            deadline = min(deadline for deadline, _ in pending.values())
+            msg = self.next_message(deadline)
+
+            if msg is not None and msg.get_type() in ("MISSION_ITEM_INT", "MISSION_ITEM"):
+                seq = msg.seq
+                if 0 <= seq < count and not have[seq]:
+                    if msg.get_type() == "MISSION_ITEM_INT":
+                        latitude, longitude = msg.x / 1e7, msg.y / 1e7
+                    else:
+                        latitude, longitude = mavlink_float(msg.x), mavlink_float(msg.y)
+                    items[seq] = (latitude, longitude, mavlink_float(msg.z), msg.command, msg.frame,
+                                  msg.autocontinue, mavlink_float(msg.param1), mavlink_float(msg.param2),
+                                  mavlink_float(msg.param3), mavlink_float(msg.param4))
+                    have[seq] = True
+                    received += 1
+                    pending.pop(seq, None)
+                    if progress is not None:
+                        progress(received, count)
+                continue
+
+            if (msg is not None and msg.get_type() == "MISSION_ACK" and msg.type != mavlink.MAV_MISSION_ACCEPTED
+                    and len(pending) > 1):
+                # The vehicle refused requests out of sequence: ask again from the oldest, one at a time
+                logger.warning("Vehicle refused pipelined mission requests, downloading one item at a time.")
+                self.window = 1
+                next_seq = min(pending)
+                pending = {}
+                continue
+
+            # Re-request every item whose request timed out
+            now = time.monotonic()
+            for seq, (seq_deadline, retries) in list(pending.items()):
+                if seq_deadline > now:
+                    continue
+                if retries >= self.max_retries:
+                    raise MissionTransferError(f"Vehicle did not send mission item {seq}/{count}.")
+                self.retransmissions += 1
+                self.send(self.mav.mission_request_int_encode(
+                    self.target_system, self.target_component, seq, *self.mission_type_args))
+                pending[seq] = (now + self.timeout, retries + 1)
+
+        self.send(self.mav.mission_ack_encode(self.target_system, self.target_component,
+                                                  mavlink.MAV_MISSION_ACCEPTED, *self.mission_type_args))
+        return items
+
+
+class MissionTransferWorker(QThread):
+    progress = pyqtSignal(int, int)
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    UPLOAD = "upload"
+    DOWNLOAD = "download"
+
+    def __init__(self, telemetry_hub, direction, records=None, parent=None):
+        super().__init__(parent)
+
+        vehicle = telemetry_hub.vehicle()
+        if vehicle is not None:
+            link = vehicle.link
+            target_system = vehicle.system_id
+            target_component = vehicle.component_id
+        else:
+            # Fall back to the usual autopilot ids until a heartbeat told us otherwise
+            link = next(iter(telemetry_hub.links.values()))
+            target_system = 1
+            target_component = mavlink.MAV_COMP_ID_AUTOPILOT1
+
+        self.telemetry_hub = telemetry_hub
+        self.direction = direction
+        self.records = records if records is not None else np.zeros(0, dtype=WAYPOINT_DTYPE)
+        # Sent through the link so our packets and the GUI thread's do not interleave
+        self.engine = MissionTransferEngine(link.connection.mav, target_system, target_component, send=link.send)
+
+        # The receive thread feeds mission replies straight into the engine's inbox;
+        # registered here and removed on finish so the hub is only touched from the GUI thread
+        self.telemetry_hub.add_thread_listener(self.engine.handle_message, MISSION_MESSAGE_TYPES)
+        self.finished.connect(self.detach_from_hub)
+
+    def detach_from_hub(self):
+        self.telemetry_hub.remove_thread_listener(self.engine.handle_message)
+
+    def cancel(self):
+        self.engine.cancel()
+
+    def run(self):
+        started = time.monotonic()
+        try:
+            if self.direction == self.UPLOAD:
+                result = self.engine.upload(self.records, self.progress.emit)
+            else:
+                result = self.engine.download(self.progress.emit)
+        except MissionTransferError as e:
+            logger.error(f"Mission {self.direction} failed: {e}")
+            self.failed.emit(str(e))
+            return
+        except Exception as e:
+            logger.exception(f"Mission {self.direction} failed: {e}")
+            self.failed.emit(str(e))
+            return
+
+        logger.info(f"Mission {self.direction} finished in {time.monotonic() - started:.2f}s "
+                    f"with {self.engine.retransmissions} retransmissions.")
+        self.succeeded.emit(result)
@@ -0,0 +1,202 @@
+import json, math, os, threading, time
+
+# Hot paths check this flag before doing any measuring, so a disabled layer costs one attribute lookup
+enabled = os.environ.get("GCS_PERF", "") not in ("", "0")
+
+# Latency buckets: 20 per decade from 1 us to 1000 s, fixed for the life of the histogram
+BUCKETS_PER_DECADE = 20
+MIN_EXPONENT = -6
+MAX_EXPONENT = 3
+BUCKET_COUNT = (MAX_EXPONENT - MIN_EXPONENT) * BUCKETS_PER_DECADE
+
+def set_enabled(value):
+    global enabled
+    enabled = bool(value)
+
+def bucket_upper_bound(index):
+    return 10.0 ** (MIN_EXPONENT + (index + 1) / BUCKETS_PER_DECADE)
+
+
+class LatencyHistogram:
+    # Log-spaced fixed buckets: constant memory, percentiles good to ~12% of the value
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * BUCKET_COUNT
+            self.count = 0
+            self.total = 0.0
+            self.maximum = 0.0
+
+    def record(self, seconds):
+        if seconds > 0:
+            index = int((math.log10(seconds) - MIN_EXPONENT) * BUCKETS_PER_DECADE)
+            index = min(max(index, 0), BUCKET_COUNT - 1)
+        else:
+            index = 0
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.maximum:
+                self.maximum = seconds
+
+    def percentiles(self, *quantiles):
+        # Upper bound of the bucket holding each quantile, capped by the largest value seen
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.maximum
+        if count == 0:
+            return [None] * len(quantiles)
+        results = []
+        for quantile in quantiles:
+            target = quantile * count
+            seen = 0
+            for index, bucket_count in enumerate(counts):
+                seen += bucket_count
+                if seen >= target and bucket_count:
+                    results.append(min(bucket_upper_bound(index), maximum))
+                    break
+        return results
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles(0.50, 0.95, 0.99)
+        with self.lock:
+            count, total, maximum = self.count, self.total, self.maximum
+        return {"count": count, "mean": total / count if count else None, "p50": p50, "p95": p95, "p99": p99,
+                "max": maximum if count else None}
+
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.value = 0
+        self.started = time.monotonic()
+
+    def add(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def reset(self):
+        with self.lock:
+            self.value = 0
+            self.started = time.monotonic()
+
+    def summary(self):
+        with self.lock:
+            value = self.value
+            elapsed = time.monotonic() - self.started
+        return {"count": value, "rate": value / elapsed if elapsed > 0 else 0.0}
+
+
+histograms = {}
+counters = {}
+registry_lock = threading.Lock()
+# name -> callable returning more JSON-ready data for every snapshot, e.g. link statistics
+sources = {}
+
+def histogram(name):
+    found = histograms.get(name)
+    if found is None:
+        with registry_lock:
+            found = histograms.setdefault(name, LatencyHistogram(name))
+    return found
+
+def counter(name):
+    found = counters.get(name)
+    if found is None:
+        with registry_lock:
+            found = counters.setdefault(name, Counter(name))
+    return found
+
+def record(name, seconds):
+    if enabled:
+        histogram(name).record(seconds)
+
+def count(name, amount=1):
+    if enabled:
+        counter(name).add(amount)
+
+def now():
+    # Stage timestamps share this clock; 0.0 when disabled so callers can skip the clock read
+    return time.monotonic() if enabled else 0.0
+
+def record_since(name, started):
+    # Pair with now(): records nothing for stamps taken while disabled
+    if enabled and started:
+        histogram(name).record(time.monotonic() - started)
+
+
+class span:
+    # with span("stage"): ... records the block's duration
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        if enabled:
+            self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled and self.started:
+            histogram(self.name).record(time.monotonic() - self.started)
+        return False
+
+
+def add_source(name, function):
+    sources[name] = function
+
+def remove_source(name):
+    sources.pop(name, None)
+
+def registered():
+    # Copies taken under the lock: other threads may register new names while we iterate
+    with registry_lock:
+        return sorted(histograms.items()), sorted(counters.items())
+
+def reset():
+    registered_histograms, registered_counters = registered()
+    for _, item in registered_histograms + registered_counters:
+        item.reset()
+
+def snapshot():
+    registered_histograms, registered_counters = registered()
+    data = {
+        "time": time.time(),
+        "latency": {name: item.summary() for name, item in registered_histograms},
+        "counters": {name: item.summary() for name, item in registered_counters},
+    }
+    for name, function in list(sources.items()):
+        data[name] = function()
+    return data
+
+def format_snapshot(data):
+    # Fixed-width text table, latencies in milliseconds
+    def ms(value):
+        return "-" if value is None else f"{value * 1e3:.2f}"
+    lines = [f"{'stage':<32}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+    for name, stats in data["latency"].items():
+        lines.append(f"{name:<32}{stats['count']:>8}{ms(stats['p50']):>9}{ms(stats['p95']):>9}"
+                     f"{ms(stats['p99']):>9}{ms(stats['max']):>9}")
+    if data["counters"]:
+        lines.append("")
+        lines.append(f"{'counter':<32}{'count':>8}{'per s':>9}")
+        for name, stats in data["counters"].items():
+            lines.append(f"{name:<32}{stats['count']:>8}{stats['rate']:>9.1f}")
+    return "\n".join(lines)
+
+def export(path):
+    # Appends one snapshot per line, so a long session is a JSON-lines time series
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(snapshot()) + "\n")
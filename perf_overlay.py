@@ -0,0 +1,90 @@
+import os
+from PyQt6.QtCore import Qt, QDateTime, QObject, QTimer
+from PyQt6.QtGui import QFontDatabase
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QCheckBox, QPushButton
+import perf_metrics
+from logger import logger
+
+METRICS_FOLDER = os.path.join("logs", "metrics")
+PANEL_REFRESH_INTERVAL_MS = 500
+EXPORT_INTERVAL_MS = 10000
+
+class MetricsExporter(QObject):
+    # Appends a snapshot to the session's metrics file while instrumentation is on, or while a source
+    # such as the link statistics has something to report
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        filename = f"{QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')}.jsonl"
+        self.path = os.path.join(METRICS_FOLDER, filename)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(EXPORT_INTERVAL_MS)
+        self.timer.timeout.connect(self.export)
+        self.timer.start()
+
+    def export(self):
+        if not perf_metrics.enabled and not perf_metrics.sources:
+            return
+        try:
+            perf_metrics.export(self.path)
+        except OSError as e:
+            logger.warning(f"Could not export metrics to {self.path}: {e}")
+
+
+class PerfPanel(QWidget):
+    # Live latency percentiles and counters, toggled from the main window
+    def __init__(self, exporter, parent=None):
+        super().__init__(parent, Qt.WindowType.Tool)
+
+        self.exporter = exporter
+        self.setWindowTitle("Performance")
+        self.resize(640, 360)
+        layout = QVBoxLayout()
+
+        controls = QHBoxLayout()
+        self.enabled_checkbox = QCheckBox("Measure")
+        self.enabled_checkbox.setChecked(perf_metrics.enabled)
+        self.enabled_checkbox.toggled.connect(perf_metrics.set_enabled)
+        controls.addWidget(self.enabled_checkbox)
+
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        controls.addWidget(reset_button)
+
+        export_button = QPushButton("Export Now")
+        export_button.clicked.connect(self.exporter.export)
+        controls.addWidget(export_button)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        layout.addWidget(self.text)
+        self.setLayout(layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(PANEL_REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        # Showing the panel turns measuring on, there is nothing to show otherwise
+        self.enabled_checkbox.setChecked(True)
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def reset(self):
+        perf_metrics.reset()
+        self.refresh()
+
+    def refresh(self):
+        text = perf_metrics.format_snapshot(perf_metrics.snapshot())
+        if perf_metrics.enabled:
+            text += f"\n\nExporting every {EXPORT_INTERVAL_MS // 1000} s to {self.exporter.path}"
+        self.text.setPlainText(text)
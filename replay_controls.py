@@ -0,0 +1,116 @@
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QComboBox, QHBoxLayout, QLabel, QPushButton, QSlider, QWidget
+from telemetry_replay import AS_FAST_AS_POSSIBLE, replay_path
+
+# (label, speed) offered for a replay; speed 0 is as fast as possible
+REPLAY_SPEEDS = [("0.25x", 0.25), ("0.5x", 0.5), ("1x", 1.0), ("2x", 2.0), ("5x", 5.0), ("10x", 10.0),
+                 ("25x", 25.0), ("50x", 50.0), ("Max", AS_FAST_AS_POSSIBLE)]
+SLIDER_STEPS = 1000
+
+def format_clock(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ReplayControls(QWidget):
+    # Play/pause, speed and position of the replayed flight; hidden while no replay is open
+    def __init__(self, telemetry_hub, parent=None):
+        super().__init__(parent)
+
+        self.telemetry_hub = telemetry_hub
+        self.link = None
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.play_button = QPushButton("Pause")
+        self.play_button.clicked.connect(self.toggle_playing)
+        layout.addWidget(self.play_button)
+
+        self.speed_dropdown = QComboBox()
+        for label, speed in REPLAY_SPEEDS:
+            self.speed_dropdown.addItem(label, speed)
+        self.speed_dropdown.setCurrentText("1x")
+        self.speed_dropdown.activated.connect(self.on_speed_selected)
+        layout.addWidget(self.speed_dropdown)
+
+        self.position_slider = QSlider(Qt.Orientation.Horizontal)
+        self.position_slider.setRange(0, SLIDER_STEPS)
+        # Seek once on release, not on every step of a drag
+        self.position_slider.sliderReleased.connect(self.on_slider_released)
+        layout.addWidget(self.position_slider)
+
+        self.position_label = QLabel()
+        layout.addWidget(self.position_label)
+
+        self.setLayout(layout)
+        self.hide()
+
+        telemetry_hub.connected.connect(self.on_connected)
+        telemetry_hub.disconnected.connect(self.detach)
+        telemetry_hub.connection_lost.connect(lambda _: self.detach_if_closed())
+
+    def on_connected(self, connection_string):
+        if replay_path(connection_string) is None:
+            return
+        self.detach()
+        self.link = self.telemetry_hub.links[connection_string]
+        self.link.position_changed.connect(self.show_position)
+        self.link.finished.connect(self.on_finished)
+        self.speed_dropdown.setCurrentIndex(self.speed_dropdown.findData(self.link.speed))
+        self.play_button.setText("Pause")
+        self.show_position(self.link.start_time)
+        self.show()
+
+    def detach(self):
+        if self.link is not None:
+            self.link.position_changed.disconnect(self.show_position)
+            self.link.finished.disconnect(self.on_finished)
+            self.link = None
+        self.hide()
+
+    def detach_if_closed(self):
+        if self.link is not None and self.link.connection_string not in self.telemetry_hub.links:
+            self.detach()
+
+    def toggle_playing(self):
+        if self.link is None:
+            return
+        if self.link.at_end():
+            # Play again from the start
+            self.seek(self.link.start_time)
+            self.link.resume()
+        elif self.link.paused:
+            self.link.resume()
+        else:
+            self.link.pause()
+        self.play_button.setText("Play" if self.link.paused else "Pause")
+
+    def on_speed_selected(self, row):
+        if self.link is not None:
+            self.link.set_speed(self.speed_dropdown.itemData(row))
+
+    def on_slider_released(self):
+        if self.link is None:
+            return
+        fraction = self.position_slider.value() / SLIDER_STEPS
+        self.seek(self.link.start_time + fraction * (self.link.end_time - self.link.start_time))
+
+    def seek(self, timestamp):
+        self.link.seek(timestamp)
+        # Plots and the track restart at the new time instead of joining it to the old one
+        self.telemetry_hub.reset_history()
+        self.show_position(timestamp)
+
+    def on_finished(self):
+        self.play_button.setText("Play")
+
+    def show_position(self, timestamp):
+        if self.link is None:
+            return
+        duration = self.link.end_time - self.link.start_time
+        elapsed = min(max(timestamp - self.link.start_time, 0.0), duration)
+        if not self.position_slider.isSliderDown():
+            self.position_slider.setValue(int(elapsed / duration * SLIDER_STEPS) if duration > 0 else 0)
+        self.position_label.setText(f"{format_clock(elapsed)} / {format_clock(duration)}")
@@ -0,0 +1,331 @@
+import math, os, random, time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+from mission_geometry import local_projection
+from waypoint_store import MISSION_TYPE_COMMANDS
+
+FLIGHT_COMMAND = MISSION_TYPE_COMMANDS["Flight"]
+
+# Candidate edges per point for 2-opt and Or-opt; the optimum rarely uses an edge to a farther neighbour
+NEIGHBOURS = 10
+# Longest chain of waypoints Or-opt moves as one piece
+OR_OPT_SEGMENT = 3
+DEFAULT_TIME_BUDGET = 3.0   # s
+# Below this many points a single process finishes well inside the budget
+PARALLEL_THRESHOLD = 1000
+# Perturbations cut the route within this many positions of each other
+KICK_SPAN = 50
+# Give up early once this many perturbations in a row found nothing better
+STALL_KICKS = 1000
+IMPROVEMENT_EPSILON = 1e-7
+
+def flight_runs(commands):
+    # (first, last) of each contiguous block of Flight waypoints; other items keep their place
+    runs = []
+    first = None
+    for row, command in enumerate(commands.tolist()):
+        if command == FLIGHT_COMMAND:
+            if first is None:
+                first = row
+        elif first is not None:
+            runs.append((first, row - 1))
+            first = None
+    if first is not None:
+        runs.append((first, len(commands) - 1))
+    return runs
+
+def nearest_neighbours(x, y, count):
+    # k nearest other points of each point, in row blocks so 5k points never need a full matrix
+    total = len(x)
+    count = min(count, total - 1)
+    if count <= 0:
+        return np.zeros((total, 0), dtype=np.intp)
+    neighbours = np.empty((total, count), dtype=np.intp)
+    for start in range(0, total, 512):
+        stop = min(start + 512, total)
+        # Squared distances rank the same and skip the square root
+        dx = x[start:stop, None] - x[None, :]
+        dy = y[start:stop, None] - y[None, :]
+        distances = dx * dx + dy * dy
+        distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        neighbours[start:stop] = np.take_along_axis(nearest, order, axis=1)
+    return neighbours
+
+
+class PathSolver:
+    # Shortest open path through the points, from a start to an end that are either fixed points or
+    # "free" (a virtual node every point reaches at zero cost). Node n is the start, n + 1 the end.
+    def __init__(self, x, y, start=None, end=None, seed=0):
+        self.count = len(x)
+        self.x = list(map(float, x)) + [0.0, 0.0]
+        self.y = list(map(float, y)) + [0.0, 0.0]
+        self.start_node = self.count
+        self.end_node = self.count + 1
+        self.free = [False] * self.count + [start is None, end is None]
+        if start is not None:
+            self.x[self.start_node], self.y[self.start_node] = start
+        if end is not None:
+            self.x[self.end_node], self.y[self.end_node] = end
+        self.random = random.Random(seed)
+
+        # Anchors take part in the neighbour lists like any other point; free ends are a candidate everywhere
+        all_x = np.asarray(self.x)
+        all_y = np.asarray(self.y)
+        real = [node for node in range(self.count + 2) if not self.free[node]]
+        nearest = nearest_neighbours(all_x[real], all_y[real], NEIGHBOURS)
+        self.neighbours = [[] for _ in range(self.count + 2)]
+        extra = [node for node in (self.start_node, self.end_node) if self.free[node]]
+        for row, node in enumerate(real):
+            self.neighbours[node] = [real[other] for other in nearest[row].tolist()] + extra
+
+    def distance(self, a, b):
+        if self.free[a] or self.free[b]:
+            return 0.0
+        return math.hypot(self.x[a] - self.x[b], self.y[a] - self.y[b])
+
+    def length(self, tour):
+        return sum(self.distance(a, b) for a, b in zip(tour, tour[1:]))
+
+    def nearest_neighbour_tour(self, randomness=0.0):
+        # Greedy construction from the start; with randomness, sometimes take the second nearest.
+        # The neighbour lists answer most steps, a full scan is only needed once they are all visited
+        unvisited = np.ones(self.count, dtype=bool)
+        x = np.asarray(self.x[:self.count])
+        y = np.asarray(self.y[:self.count])
+        tour = [self.start_node]
+        current = self.start_node
+        for _ in range(self.count):
+            if self.free[current]:
+                # From a free start any point is as good as another; begin at the one farthest from the end
+                if self.free[self.end_node]:
+                    candidates = np.flatnonzero(unvisited)[:1].tolist()
+                else:
+                    far = np.hypot(x - self.x[self.end_node], y - self.y[self.end_node])
+                    candidates = [int(np.argmax(np.where(unvisited, far, -1.0)))]
+            else:
+                candidates = [node for node in self.neighbours[current] if node < self.count and unvisited[node]]
+                if randomness and len(candidates) > 1 and self.random.random() < randomness:
+                    candidates = candidates[1:]
+            if not candidates:
+                distances = np.hypot(x - self.x[current], y - self.y[current])
+                distances[~unvisited] = np.inf
+                candidates = [int(np.argmin(distances))]
+            current = int(candidates[0])
+            unvisited[current] = False
+            tour.append(current)
+        tour.append(self.end_node)
+        return tour
+
+    def improve(self, tour, deadline, active=None):
+        # 2-opt and Or-opt with neighbour lists and a queue of nodes whose surroundings changed;
+        # returns how much shorter the tour got
+        position = [0] * (self.count + 2)
+        for index, node in enumerate(tour):
+            position[node] = index
+        queue = list(range(self.count)) if active is None else list(active)
+        queued = [False] * (self.count + 2)
+        for node in queue:
+            queued[node] = True
+        checks = 0
+        total_gain = 0.0
+        while queue:
+            node = queue.pop()
+            queued[node] = False
+            checks += 1
+            if checks % 64 == 0 and time.perf_counter() > deadline:
+                break
+            move = self.two_opt_move(tour, position, node) or self.or_opt_move(tour, position, node)
+            if move:
+                touched, gain = move
+                total_gain += gain
+                for changed in touched:
+                    if changed < self.count and not queued[changed]:
+                        queued[changed] = True
+                        queue.append(changed)
+        return total_gain
+
+    def reverse(self, tour, position, first, last):
+        tour[first:last + 1] = tour[first:last + 1][::-1]
+        for index in range(first, last + 1):
+            position[tour[index]] = index
+
+    def two_opt_move(self, tour, position, a):
+        # Best improving exchange that makes a new edge from a to one of its neighbours
+        distance = self.distance
+        last_index = len(tour) - 1
+        i = position[a]
+        # Every improving exchange has an endpoint whose new edge is shorter than the edge it drops,
+        # so from a only neighbours closer than a's own tour neighbours need trying
+        succ_length = distance(a, tour[i + 1]) if i < last_index else 0.0
+        pred_length = distance(a, tour[i - 1]) if i > 0 else 0.0
+        best_gain = IMPROVEMENT_EPSILON
+        best = None
+        for c in self.neighbours[a]:
+            j = position[c]
+            if abs(i - j) < 2:
+                continue
+            new_length = distance(a, c)
+            # New edges (a, c) and (succ a, succ c)
+            if new_length < succ_length and j < last_index:
+                b, d = tour[i + 1], tour[j + 1]
+                gain = succ_length + distance(c, d) - new_length - distance(b, d)
+                if gain > best_gain:
+                    best_gain, best = gain, (min(i, j) + 1, max(i, j), (a, b, c, d))
+            # New edges (a, c) and (pred a, pred c)
+            if new_length < pred_length and j > 0:
+                b, d = tour[i - 1], tour[j - 1]
+                gain = pred_length + distance(d, c) - new_length - distance(b, d)
+                if gain > best_gain:
+                    best_gain, best = gain, (min(i, j), max(i, j) - 1, (a, b, c, d))
+        if best is None:
+            return None
+        first, last, touched = best
+        self.reverse(tour, position, first, last)
+        return touched, best_gain
+
+    def or_opt_move(self, tour, position, a):
+        # Move a short chain starting or ending at a next to one of its neighbours, either way round
+        distance = self.distance
+        last_index = len(tour) - 1
+        i = position[a]
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            for first in (i, i - length + 1):
+                stop = first + length - 1
+                if first < 1 or stop > last_index - 1:
+                    continue
+                head, tail = tour[first], tour[stop]
+                before, after = tour[first - 1], tour[stop + 1]
+                removal_gain = distance(before, head) + distance(tail, after) - distance(before, after)
+                if removal_gain <= IMPROVEMENT_EPSILON:
+                    continue
+                for end in (head, tail):
+                    for c in self.neighbours[end]:
+                        j = position[c]
+                        # The new edge at the chain's end has to be shorter than what removing it saves
+                        if first <= j <= stop or distance(end, c) >= removal_gain:
+                            continue
+                        for u_index in (j - 1, j):
+                            if u_index < 0 or u_index + 1 > last_index or u_index == first - 1 or u_index == stop:
+                                continue
+                            u, v = tour[u_index], tour[u_index + 1]
+                            forward = distance(u, head) + distance(tail, v)
+                            backward = distance(u, tail) + distance(head, v)
+                            added = min(forward, backward) - distance(u, v)
+                            if removal_gain - added > IMPROVEMENT_EPSILON:
+                                chain = tour[first:stop + 1]
+                                if backward < forward:
+                                    chain.reverse()
+                                self.move_chain(tour, position, first, stop, u_index, chain)
+                                return (before, after, head, tail, u, v), removal_gain - added
+        return None
+
+    def move_chain(self, tour, position, first, stop, u_index, chain):
+        # Take tour[first..stop] out and put chain back right after position u_index (pre-move numbering)
+        length = stop - first + 1
+        if u_index < first:
+            tour[u_index + 1 + length:stop + 1] = tour[u_index + 1:first]
+            tour[u_index + 1:u_index + 1 + length] = chain
+            changed = range(u_index + 1, stop + 1)
+        else:
+            tour[first:u_index + 1 - length] = tour[stop + 1:u_index + 1]
+            tour[u_index + 1 - length:u_index + 1] = chain
+            changed = range(first, u_index + 1)
+        for index in changed:
+            position[tour[index]] = index
+
+    def kick(self, tour):
+        # Local double bridge: swap two neighbouring stretches of the route, then repair around the cuts.
+        # Returns the new tour, the nodes next to the cuts and how much longer it got
+        inner = len(tour) - 2
+        if inner < 4:
+            return tour, [], 0.0
+        span = min(KICK_SPAN, inner - 1)
+        first = self.random.randint(1, inner - span + 1)
+        cuts = sorted(self.random.sample(range(first + 1, first + span), 2))
+        second, third = cuts
+        kicked = tour[:first] + tour[second:third] + tour[first:second] + tour[third:]
+        active = {kicked[index] for cut in (first, second, third, first + third - second)
+                  for index in (cut - 1, cut) if 0 <= index < len(kicked)}
+        distance = self.distance
+        added = (distance(tour[first - 1], tour[second]) + distance(tour[third - 1], tour[first])
+                 + distance(tour[second - 1], tour[third]))
+        removed = (distance(tour[first - 1], tour[first]) + distance(tour[second - 1], tour[second])
+                   + distance(tour[third - 1], tour[third]))
+        return kicked, active, added - removed
+
+    def solve(self, deadline, randomness=0.0):
+        # Construction, local search, then perturb-and-repair until the deadline or a long stall
+        best = self.nearest_neighbour_tour(randomness)
+        self.improve(best, deadline)
+        best_length = self.length(best)
+        stalled = 0
+        while time.perf_counter() < deadline and stalled < STALL_KICKS:
+            candidate, active, change = self.kick(best)
+            if not active:
+                break
+            change -= self.improve(candidate, deadline, active)
+            stalled += 1
+            if change < -IMPROVEMENT_EPSILON:
+                best, best_length = candidate, best_length + change
+                stalled = 0
+        return best[1:-1], best_length
+
+
+def solve_path(x, y, start, end, time_budget, seed):
+    # Process pool entry point; seed 0 is the plain nearest-neighbour start. The budget includes setup
+    deadline = time.perf_counter() + time_budget
+    solver = PathSolver(x, y, start, end, seed)
+    return solver.solve(deadline, 0.0 if seed == 0 else 0.1)
+
+def optimize_path(x, y, start=None, end=None, time_budget=DEFAULT_TIME_BUDGET, workers=None):
+    # Order of the points (indices into x/y) for the shortest path found within the budget
+    if len(x) < 3:
+        return list(range(len(x)))
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(x) >= PARALLEL_THRESHOLD:
+        # Independent searches from different starts; spawn keeps Qt's threads out of the children
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = [pool.submit(solve_path, x, y, start, end, time_budget, seed) for seed in range(workers)]
+            results = [future.result() for future in futures]
+        return min(results, key=lambda result: result[1])[0]
+    return solve_path(x, y, start, end, time_budget, 0)[0]
+
+def optimize_mission(records, time_budget=DEFAULT_TIME_BUDGET, workers=None):
+    # New row order for a mission: each block of Flight waypoints is reordered between the items around it
+    order = np.arange(len(records))
+    runs = [run for run in flight_runs(records["command"]) if run[1] - run[0] >= 1]
+    if not runs:
+        return order
+    origin = (float(records["latitude"].mean()), float(records["longitude"].mean()))
+    x, y = local_projection(records["latitude"], records["longitude"], *origin)
+    for first, last in runs:
+        start = (x[first - 1], y[first - 1]) if first > 0 else None
+        end = (x[last + 1], y[last + 1]) if last + 1 < len(records) else None
+        # Each block gets a share of the budget in proportion to its size
+        share = time_budget * (last - first + 1) / sum(run[1] - run[0] + 1 for run in runs)
+        path = optimize_path(x[first:last + 1], y[first:last + 1], start, end, share, workers)
+        order[first:last + 1] = first + np.asarray(path)
+    return order
+
+
+class RouteOptimizerWorker(QThread):
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, records, time_budget=DEFAULT_TIME_BUDGET, parent=None):
+        super().__init__(parent)
+        self.records = records
+        self.time_budget = time_budget
+
+    def run(self):
+        try:
+            order = optimize_mission(self.records, self.time_budget)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.succeeded.emit(order)
@@ -0,0 +1,431 @@
+import argparse, heapq, math, random, threading, time
+import numpy as np
+from pymavlink import mavutil
+from logger import logger
+from mission_transfer import mission_type_args
+from stream_rates import DATA_STREAM_GROUPS
+from waypoint_store import EARTH_RADIUS_M
+
+mavlink = mavutil.mavlink
+
+# Message -> Hz for a vehicle streaming a typical telemetry set; without streams only HEARTBEAT is sent
+DEFAULT_STREAMS = {
+    "HEARTBEAT": 1,
+    "SYS_STATUS": 1,
+    "GPS_RAW_INT": 2,
+    "ATTITUDE": 10,
+    "GLOBAL_POSITION_INT": 5,
+    "VFR_HUD": 4,
+    "RC_CHANNELS": 5,
+}
+MAX_STREAM_RATE = 1000.0
+# A stream that fell this far behind (e.g. the process was stalled) skips ahead instead of bursting
+MAX_CATCH_UP = 100
+# The simulated flight: a circle around home
+DEFAULT_HOME = (45.0, -75.0, 100.0)
+ORBIT_RADIUS_M = 100.0
+ORBIT_SPEED_MPS = 10.0
+
+class SimulatedVehicle:
+    def __init__(self, connection_string, system_id=1, component_id=mavlink.MAV_COMP_ID_AUTOPILOT1,
+                 loss=0.0, seed=None, mission_timeout=0.5, streams=None, reorder=0.0, delay=0.0, jitter=0.0,
+                 home=DEFAULT_HOME, boot_time=None, message_interval=True):
+        self.connection_string = connection_string
+        self.system_id = system_id
+        self.component_id = component_id
+        # Probability of dropping each packet, applied separately in both directions
+        self.loss = loss
+        # Probability of holding a sent packet back until after the next one
+        self.reorder = reorder
+        # Fixed one-way delay plus uniform random jitter on sent packets, in seconds
+        self.delay = delay
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.mission_timeout = mission_timeout
+
+        self.streams = dict(streams) if streams is not None else {"HEARTBEAT": 1}
+        for name, rate in self.streams.items():
+            if name not in STREAM_ENCODERS:
+                raise ValueError(f"Cannot stream {name}, known messages: {', '.join(sorted(STREAM_ENCODERS))}.")
+            if not 0 < rate <= MAX_STREAM_RATE:
+                raise ValueError(f"{name} rate {rate} Hz is outside 0..{MAX_STREAM_RATE:.0f} Hz.")
+        # Rates a SET_MESSAGE_INTERVAL with interval 0 restores
+        self.default_streams = dict(self.streams)
+        # False turns SET_MESSAGE_INTERVAL down like an older autopilot, leaving REQUEST_DATA_STREAM
+        self.message_interval = message_interval
+        self.home = home
+        # time_boot_ms counts from here; 0.0 makes it the monotonic clock, so a process on the same
+        # machine can tell how old a message is
+        self.boot_time = boot_time
+
+        self.connection = None
+        # Packs the messages; the connection's parser, or a standalone one when recording
+        self.mav = None
+        self.mission_type_args = ()
+        self.thread = None
+        self.running = False
+        # (release time, order, packet) waiting out the simulated delay, and a packet held for reordering
+        self.delayed = []
+        self.delayed_count = 0
+        self.held = None
+        self.sent_packets = 0
+
+        self.mission_items = []
+        # Ground station the mission protocol replies go to
+        self.gcs_system = 255
+        self.gcs_component = 0
+        # Upload in progress: (expected count, received items, next seq, last request time)
+        self.upload_state = None
+        self.dropped_packets = 0
+
+    def start(self):
+        self.connection = mavutil.mavlink_connection(self.connection_string, source_system=self.system_id,
+                                                     source_component=self.component_id)
+        self.mav = self.connection.mav
+        self.mission_type_args = mission_type_args(self.mav, mavlink.MAV_MISSION_TYPE_MISSION)
+        if self.boot_time is None:
+            self.boot_time = time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="SimulatedVehicle", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def lose_packet(self):
+        if self.loss > 0 and self.random.random() < self.loss:
+            self.dropped_packets += 1
+            return True
+        return False
+
+    def send(self, msg):
+        # Packed here so lost packets still use up a sequence number, as they do on a real link
+        packet = self.pack(msg)
+        self.sent_packets += 1
+        if self.lose_packet():
+            return
+        if self.held is None and self.reorder > 0 and self.random.random() < self.reorder:
+            self.held = packet
+            return
+        self.transmit(packet)
+        if self.held is not None:
+            held, self.held = self.held, None
+            self.transmit(held)
+
+    def pack(self, msg):
+        packet = msg.pack(self.mav)
+        self.mav.seq = (self.mav.seq + 1) % 256
+        return packet
+
+    def record(self, path, duration, start_time=None):
+        # Writes what the streams would send over duration seconds straight to a tlog, as fast as it can;
+        # packets are stamped start_time (default now) onwards on the vehicle's own clock
+        from mavlink_frames import mavlink2_dialect
+        from telemetry_log import TelemetryLogWriter
+        self.mav = mavlink2_dialect().MAVLink(None, srcSystem=self.system_id, srcComponent=self.component_id)
+        if self.boot_time is None:
+            self.boot_time = 0.0
+        if start_time is None:
+            start_time = time.time()
+        # Every stream's send times merged into one schedule
+        names = list(self.streams)
+        times = [np.arange(0.0, duration, 1.0 / self.streams[name]) for name in names]
+        order = np.argsort(np.concatenate(times), kind="stable")
+        stream_of = np.repeat(np.arange(len(names)), [len(stream_times) for stream_times in times])[order]
+        times = np.concatenate(times)[order]
+        writer = TelemetryLogWriter(path)
+        try:
+            for elapsed, stream in zip(times.tolist(), stream_of.tolist()):
+                msg = STREAM_ENCODERS[names[stream]](self, self.boot_time + elapsed)
+                packet = self.pack(msg)
+                self.sent_packets += 1
+                if not self.lose_packet():
+                    writer.write_packet(packet, msg.get_msgId(), start_time + elapsed)
+        finally:
+            writer.close()
+
+    def transmit(self, packet):
+        if self.delay > 0 or self.jitter > 0:
+            release = time.monotonic() + self.delay + self.random.uniform(0.0, self.jitter)
+            self.delayed_count += 1
+            heapq.heappush(self.delayed, (release, self.delayed_count, packet))
+        else:
+            self.connection.write(packet)
+
+    def release_delayed(self, now):
+        while self.delayed and self.delayed[0][0] <= now:
+            self.connection.write(heapq.heappop(self.delayed)[2])
+
+    def run(self):
+        # Every stream keeps its own schedule; the loop sleeps in select() until the next one is due
+        next_due = {name: time.monotonic() for name in self.streams}
+        while self.running:
+            now = time.monotonic()
+            for name, rate in self.streams.items():
+                period = 1.0 / rate
+                due = next_due.get(name, now)
+                if now - due > MAX_CATCH_UP * period:
+                    due = now
+                while due <= now:
+                    self.send(STREAM_ENCODERS[name](self, now))
+                    due += period
+                next_due[name] = due
+
+            self.release_delayed(now)
+            self.check_upload_timeout(now)
+
+            # Streams the ground station turned off keep a stale entry, only running ones count
+            wake = min(min((next_due[name] for name in self.streams), default=now + 0.01), now + 0.01)
+            if self.delayed:
+                wake = min(wake, self.delayed[0][0])
+            self.connection.select(max(0.0, wake - time.monotonic()))
+            while self.running:
+                msg = self.connection.recv_msg()
+                if msg is None:
+                    break
+                if self.lose_packet():
+                    continue
+                try:
+                    self.handle_message(msg)
+                except Exception as e:
+                    logger.exception(f"Simulated vehicle failed to handle {msg.get_type()}: {e}")
+
+    # Simulated flight state, a function of time only
+    def time_boot_ms(self, now):
+        return int((now - self.boot_time) * 1000) & 0xFFFFFFFF
+
+    def orbit(self, now):
+        # (lat, lon, alt, north speed, east speed, heading rad) flying counter-clockwise around home
+        latitude, longitude, altitude = self.home
+        angle = (now - self.boot_time) * ORBIT_SPEED_MPS / ORBIT_RADIUS_M
+        north = ORBIT_RADIUS_M * math.sin(angle)
+        east = ORBIT_RADIUS_M * math.cos(angle)
+        latitude += math.degrees(north / EARTH_RADIUS_M)
+        longitude += math.degrees(east / (EARTH_RADIUS_M * math.cos(math.radians(latitude))))
+        speed_north = ORBIT_SPEED_MPS * math.cos(angle)
+        speed_east = -ORBIT_SPEED_MPS * math.sin(angle)
+        heading = math.atan2(speed_east, speed_north)
+        return latitude, longitude, altitude, speed_north, speed_east, heading
+
+    def encode_heartbeat(self, now):
+        return self.mav.heartbeat_encode(
+            mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_GENERIC, 0, 0, mavlink.MAV_STATE_ACTIVE)
+
+    def encode_sys_status(self, now):
+        sensors = mavlink.MAV_SYS_STATUS_SENSOR_3D_GYRO | mavlink.MAV_SYS_STATUS_SENSOR_GPS
+        return self.mav.sys_status_encode(sensors, sensors, sensors, 250, 12400, 1500, 85,
+                                          0, self.dropped_packets & 0xFFFF, 0, 0, 0, 0)
+
+    def encode_gps_raw_int(self, now):
+        latitude, longitude, altitude, speed_north, speed_east, heading = self.orbit(now)
+        return self.mav.gps_raw_int_encode(
+            int((now - self.boot_time) * 1e6), 3, int(latitude * 1e7), int(longitude * 1e7), int(altitude * 1000),
+            90, 120, int(ORBIT_SPEED_MPS * 100), int(math.degrees(heading) % 360 * 100), 14)
+
+    def encode_attitude(self, now):
+        elapsed = now - self.boot_time
+        *_, heading = self.orbit(now)
+        # Constant bank for the turn plus a little wobble so the plots move
+        roll = math.atan(ORBIT_SPEED_MPS ** 2 / (ORBIT_RADIUS_M * 9.81)) + 0.05 * math.sin(elapsed * 3.0)
+        pitch = 0.05 * math.sin(elapsed * 0.7)
+        return self.mav.attitude_encode(self.time_boot_ms(now), roll, pitch, heading,
+                                        0.0, 0.0, ORBIT_SPEED_MPS / ORBIT_RADIUS_M)
+
+    def encode_global_position_int(self, now):
+        latitude, longitude, altitude, speed_north, speed_east, heading = self.orbit(now)
+        return self.mav.global_position_int_encode(
+            self.time_boot_ms(now), int(latitude * 1e7), int(longitude * 1e7), int(altitude * 1000),
+            int(altitude * 1000), int(speed_north * 100), int(speed_east * 100), 0,
+            int(math.degrees(heading) % 360 * 100))
+
+    def encode_vfr_hud(self, now):
+        *_, altitude, _, _, heading = self.orbit(now)
+        return self.mav.vfr_hud_encode(ORBIT_SPEED_MPS, ORBIT_SPEED_MPS,
+                                       int(math.degrees(heading) % 360), 50, altitude, 0.0)
+
+    def encode_rc_channels(self, now):
+        elapsed = now - self.boot_time
+        sticks = [int(1500 + 400 * math.sin(elapsed * rate)) for rate in (0.5, 0.7, 0.3, 0.9)]
+        return self.mav.rc_channels_encode(self.time_boot_ms(now), 8, *sticks,
+                                           *([1500] * 4), *([0] * 10), 255)
+
+    def handle_message(self, msg):
+        msg_type = msg.get_type()
+        if msg_type.startswith("MISSION_"):
+            self.gcs_system = msg.get_srcSystem()
+            self.gcs_component = msg.get_srcComponent()
+
+        if msg_type == "MISSION_COUNT":
+            self.start_upload(msg.count)
+        elif msg_type in ("MISSION_ITEM_INT", "MISSION_ITEM"):
+            self.receive_mission_item(msg)
+        elif msg_type == "MISSION_REQUEST_LIST":
+            self.send(self.mav.mission_count_encode(
+                self.gcs_system, self.gcs_component, len(self.mission_items), *self.mission_type_args))
+        elif msg_type in ("MISSION_REQUEST_INT", "MISSION_REQUEST"):
+            self.send_mission_item(msg)
+        elif msg_type == "COMMAND_LONG":
+            self.handle_command(msg)
+        elif msg_type == "REQUEST_DATA_STREAM":
+            self.request_data_stream(msg)
+        elif msg_type == "TIMESYNC" and msg.tc1 == 0:
+            # Echo the ground station's ts1 so it can time the round trip
+            self.send(self.mav.timesync_encode(time.time_ns(), msg.ts1))
+
+    def set_stream_rate(self, name, rate):
+        # None restores the default rate, 0 stops the stream
+        if rate is None:
+            rate = self.default_streams.get(name, 0)
+        if rate > 0:
+            self.streams[name] = min(rate, MAX_STREAM_RATE)
+        else:
+            self.streams.pop(name, None)
+
+    def handle_command(self, msg):
+        result = mavlink.MAV_RESULT_UNSUPPORTED
+        if msg.command == mavlink.MAV_CMD_SET_MESSAGE_INTERVAL and self.message_interval:
+            message_class = mavlink.mavlink_map.get(int(msg.param1))
+            name = message_class.msgname if message_class is not None else None
+            if name in STREAM_ENCODERS:
+                # Interval in microseconds, -1 stops the message and 0 restores its default
+                interval = msg.param2
+                self.set_stream_rate(name, None if interval == 0 else 0 if interval < 0 else 1e6 / interval)
+                result = mavlink.MAV_RESULT_ACCEPTED
+            else:
+                result = mavlink.MAV_RESULT_DENIED
+        self.send(self.mav.command_ack_encode(msg.command, result))
+
+    def request_data_stream(self, msg):
+        # Sets every simulated message of the group, all of them for MAV_DATA_STREAM_ALL
+        for name in STREAM_ENCODERS:
+            group = DATA_STREAM_GROUPS.get(name)
+            if msg.req_stream_id != mavlink.MAV_DATA_STREAM_ALL and (
+                    group is None or msg.req_stream_id != getattr(mavlink, f"MAV_DATA_STREAM_{group}")):
+                continue
+            self.set_stream_rate(name, msg.req_message_rate if msg.start_stop else 0)
+
+    # Upload: vehicle requests items one by one, then acknowledges
+    def start_upload(self, count):
+        if count == 0:
+            self.mission_items = []
+            self.send_mission_ack()
+            return
+        self.upload_state = [count, [None] * count, 0, 0.0]
+        self.request_next_item()
+
+    def request_next_item(self):
+        next_seq = self.upload_state[2]
+        self.send(self.mav.mission_request_int_encode(self.gcs_system, self.gcs_component, next_seq,
+                                                      *self.mission_type_args))
+        self.upload_state[3] = time.monotonic()
+
+    def check_upload_timeout(self, now):
+        if self.upload_state is not None and now - self.upload_state[3] > self.mission_timeout:
+            self.request_next_item()
+
+    def receive_mission_item(self, msg):
+        if self.upload_state is None:
+            # Our ACK was lost and the GCS repeated the last item
+            if self.mission_items and msg.seq == len(self.mission_items) - 1:
+                self.send_mission_ack()
+            return
+
+        count, items, next_seq, _ = self.upload_state
+        if msg.seq != next_seq:
+            # Duplicate of an earlier item, ask again for the one we need
+            self.request_next_item()
+            return
+
+        items[msg.seq] = msg
+        next_seq += 1
+        self.upload_state[2] = next_seq
+        if next_seq == count:
+            self.mission_items = items
+            self.upload_state = None
+            self.send_mission_ack()
+        else:
+            self.request_next_item()
+
+    def send_mission_ack(self):
+        self.send(self.mav.mission_ack_encode(self.gcs_system, self.gcs_component,
+                                              mavlink.MAV_MISSION_ACCEPTED, *self.mission_type_args))
+
+    # Download: answer each request with the stored item
+    def send_mission_item(self, msg):
+        if not 0 <= msg.seq < len(self.mission_items):
+            return
+        item = self.mission_items[msg.seq]
+        self.send(self.mav.mission_item_int_encode(
+            self.gcs_system, self.gcs_component, msg.seq, item.frame, item.command,
+            item.current, item.autocontinue, item.param1, item.param2, item.param3, item.param4,
+            item.x, item.y, item.z, *self.mission_type_args))
+
+
+# Message name -> encoder method for the streams
+STREAM_ENCODERS = {
+    "HEARTBEAT": SimulatedVehicle.encode_heartbeat,
+    "SYS_STATUS": SimulatedVehicle.encode_sys_status,
+    "GPS_RAW_INT": SimulatedVehicle.encode_gps_raw_int,
+    "ATTITUDE": SimulatedVehicle.encode_attitude,
+    "GLOBAL_POSITION_INT": SimulatedVehicle.encode_global_position_int,
+    "VFR_HUD": SimulatedVehicle.encode_vfr_hud,
+    "RC_CHANNELS": SimulatedVehicle.encode_rc_channels,
+}
+
+def parse_stream(text):
+    # NAME=HZ
+    name, _, rate = text.partition("=")
+    return name.upper(), float(rate)
+
+
+if __name__ == "__main__":
+    # python sim_vehicle.py udpout:127.0.0.1:14550 --stream ATTITUDE=200 --loss 0.01
+    # python sim_vehicle.py --record sortie.tlog --duration 7200
+    parser = argparse.ArgumentParser(description="Headless simulated MAVLink vehicle")
+    parser.add_argument("connection", nargs="?",
+                        help="pymavlink connection string, e.g. udpout:127.0.0.1:14550 or tcpin:0.0.0.0:5760")
+    parser.add_argument("--system-id", type=int, default=1)
+    parser.add_argument("--stream", type=parse_stream, action="append", default=[], metavar="NAME=HZ",
+                        help="stream a message at a rate, repeatable; the default set if none are given")
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss probability")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability a packet is sent late")
+    parser.add_argument("--delay", type=float, default=0.0, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this many seconds")
+    parser.add_argument("--no-message-interval", action="store_true",
+                        help="refuse SET_MESSAGE_INTERVAL like an older autopilot, only REQUEST_DATA_STREAM works")
+    parser.add_argument("--monotonic-clock", action="store_true",
+                        help="time_boot_ms from the system monotonic clock, for latency measurements")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run, forever if not given")
+    parser.add_argument("--record", metavar="PATH",
+                        help="write --duration seconds (default 1 hour) of telemetry to a tlog instead of a link")
+    args = parser.parse_args()
+    if args.connection is None and args.record is None:
+        parser.error("a connection string or --record is required")
+
+    vehicle = SimulatedVehicle(args.connection, system_id=args.system_id, loss=args.loss,
+                               streams=dict(args.stream) if args.stream else DEFAULT_STREAMS,
+                               reorder=args.reorder, delay=args.delay, jitter=args.jitter,
+                               boot_time=0.0 if args.monotonic_clock else None,
+                               message_interval=not args.no_message_interval)
+    if args.record is not None:
+        vehicle.record(args.record, 3600.0 if args.duration is None else args.duration)
+        print(f"recorded {vehicle.sent_packets} packets to {args.record}, dropped {vehicle.dropped_packets}")
+        raise SystemExit
+    vehicle.start()
+    try:
+        if args.duration is None:
+            while True:
+                time.sleep(1.0)
+        else:
+            time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        vehicle.stop()
+        print(f"sent {vehicle.sent_packets} packets, dropped {vehicle.dropped_packets}")
@@ -0,0 +1,255 @@
+import math, time
+from PyQt6.QtCore import QObject, QTimer
+from logger import logger
+
+# Page changes are merged and sent at most this often, so flipping through pages costs one round
+APPLY_DELAY_MS = 250
+ACK_CHECK_INTERVAL_MS = 200
+# Per SET_MESSAGE_INTERVAL command: wait this long for its COMMAND_ACK, send it this many times, then
+# treat the autopilot as one that only understands REQUEST_DATA_STREAM
+ACK_TIMEOUT = 1.0
+MAX_ATTEMPTS = 3
+# What a 57600 baud telemetry radio carries, 10 bits per byte on the air
+RADIO_BYTES_PER_SECOND = 57600 // 10
+# MAVLink 2 header and checksum around every payload
+MAVLINK2_OVERHEAD = 12
+# REQUEST_DATA_STREAM cannot restore a vehicle's own rate; a group no page wants any more drops to this
+DATA_STREAM_IDLE_RATE = 1
+
+# MAV_DATA_STREAM group carrying each message on autopilots without SET_MESSAGE_INTERVAL (ArduPilot's grouping)
+DATA_STREAM_GROUPS = {
+    "SYS_STATUS": "EXTENDED_STATUS",
+    "GPS_RAW_INT": "EXTENDED_STATUS",
+    "MISSION_CURRENT": "EXTENDED_STATUS",
+    "NAV_CONTROLLER_OUTPUT": "EXTENDED_STATUS",
+    "RAW_IMU": "RAW_SENSORS",
+    "SCALED_PRESSURE": "RAW_SENSORS",
+    "RC_CHANNELS": "RC_CHANNELS",
+    "RC_CHANNELS_RAW": "RC_CHANNELS",
+    "SERVO_OUTPUT_RAW": "RC_CHANNELS",
+    "GLOBAL_POSITION_INT": "POSITION",
+    "LOCAL_POSITION_NED": "POSITION",
+    "ATTITUDE": "EXTRA1",
+    "VFR_HUD": "EXTRA2",
+}
+
+def message_bytes(message_type):
+    # On-air size of one message, for the bandwidth estimate
+    from pymavlink import mavutil
+    mavlink = mavutil.mavlink
+    message_class = mavlink.mavlink_map.get(getattr(mavlink, f"MAVLINK_MSG_ID_{message_type}", None))
+    return (message_class.unpacker.size if message_class is not None else 0) + MAVLINK2_OVERHEAD
+
+def estimated_bandwidth(rates):
+    return sum(rate * message_bytes(message_type) for message_type, rate in rates.items())
+
+
+class StreamRateRegistry(QObject):
+    # Pages declare the messages they display and how often; the selected vehicle is asked for the fastest
+    # rate anybody wants, and back to its own default once nobody does. Requests are sent one at a time as
+    # SET_MESSAGE_INTERVAL, falling back to REQUEST_DATA_STREAM when the autopilot refuses or never answers.
+    def __init__(self, telemetry_hub):
+        super().__init__(telemetry_hub)
+
+        self.telemetry_hub = telemetry_hub
+        # owner (usually a page) -> {message type: Hz}
+        self.requests = {}
+        # Vehicle the rates are negotiated with, and what it acknowledged: message type -> Hz
+        self.system_id = None
+        self.confirmed = {}
+        # (message type, Hz, sent at, attempts) awaiting a COMMAND_ACK
+        self.in_flight = None
+        # Messages the vehicle refused a rate for; the rest are still negotiated
+        self.unavailable = set()
+        # Set once the vehicle turned SET_MESSAGE_INTERVAL down; group -> Hz last requested
+        self.legacy = False
+        self.data_stream_rates = {}
+
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setSingleShot(True)
+        self.apply_timer.setInterval(APPLY_DELAY_MS)
+        self.apply_timer.timeout.connect(self.apply)
+
+        self.ack_timer = QTimer(self)
+        self.ack_timer.setInterval(ACK_CHECK_INTERVAL_MS)
+        self.ack_timer.timeout.connect(self.check_ack)
+
+        telemetry_hub.selected_vehicle_changed.connect(self.on_vehicle_selected)
+        telemetry_hub.subscribe("COMMAND_ACK", self.on_command_ack)
+
+    def set_rates(self, owner, rates):
+        # Replaces everything owner asked for before; an empty dict withdraws it
+        rates = {message_type: float(rate) for message_type, rate in rates.items() if rate > 0}
+        if rates:
+            self.requests[owner] = rates
+        else:
+            self.requests.pop(owner, None)
+        self.apply_timer.start()
+
+    def clear_rates(self, owner):
+        self.set_rates(owner, {})
+
+    def wanted(self):
+        merged = {}
+        for rates in self.requests.values():
+            for message_type, rate in rates.items():
+                merged[message_type] = max(rate, merged.get(message_type, 0.0))
+        return merged
+
+    def on_vehicle_selected(self, system_id):
+        system_id = system_id or None
+        if system_id == self.system_id:
+            return
+        # The vehicle no longer shown goes back to its own rates, without waiting for answers
+        previous = self.telemetry_hub.vehicle(self.system_id) if self.system_id is not None else None
+        if previous is not None and not self.legacy:
+            for message_type in self.confirmed:
+                self.send_interval(previous, message_type, 0.0, 0)
+        self.system_id = system_id
+        self.confirmed = {}
+        self.unavailable = set()
+        self.in_flight = None
+        self.legacy = False
+        self.data_stream_rates = {}
+        self.ack_timer.stop()
+        self.apply_timer.start()
+
+    def apply(self):
+        vehicle = self.vehicle()
+        if vehicle is None:
+            return
+        wanted = self.wanted()
+        bandwidth = estimated_bandwidth(wanted)
+        if bandwidth > RADIO_BYTES_PER_SECOND:
+            logger.warning(f"Requested telemetry needs about {bandwidth:.0f} B/s, more than a 57600 baud radio "
+                           f"carries ({RADIO_BYTES_PER_SECOND} B/s).")
+        if self.legacy:
+            self.request_data_streams(vehicle, wanted)
+        else:
+            self.send_next()
+
+    def vehicle(self):
+        return self.telemetry_hub.vehicle(self.system_id) if self.system_id is not None else None
+
+    def next_change(self):
+        # First message whose acknowledged rate differs from the wanted one; 0 Hz is the vehicle's default
+        wanted = self.wanted()
+        for message_type, rate in wanted.items():
+            if message_type not in self.unavailable and self.confirmed.get(message_type) != rate:
+                return message_type, rate
+        for message_type in self.confirmed:
+            if message_type not in wanted:
+                return message_type, 0.0
+        return None
+
+    def send_next(self):
+        vehicle = self.vehicle()
+        if self.in_flight is not None or self.legacy or vehicle is None:
+            return
+        change = self.next_change()
+        if change is None:
+            self.ack_timer.stop()
+            return
+        message_type, rate = change
+        self.in_flight = (message_type, rate, time.monotonic(), 1)
+        self.send_interval(vehicle, message_type, rate, 0)
+        self.ack_timer.start()
+
+    def send_interval(self, vehicle, message_type, rate, confirmation):
+        from pymavlink import mavutil
+        mavlink = mavutil.mavlink
+        msgid = getattr(mavlink, f"MAVLINK_MSG_ID_{message_type}")
+        # Interval in microseconds, 0 restores the vehicle's default
+        interval = 1e6 / rate if rate > 0 else 0.0
+        msg = vehicle.link.connection.mav.command_long_encode(
+            vehicle.system_id, vehicle.component_id, mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, confirmation,
+            msgid, interval, 0, 0, 0, 0, 0)
+        try:
+            self.telemetry_hub.send(msg, vehicle.system_id)
+        except Exception as e:
+            logger.warning(f"Could not request {message_type} at {rate:g} Hz: {e}")
+
+    def on_command_ack(self, msg):
+        from pymavlink import mavutil
+        mavlink = mavutil.mavlink
+        if self.in_flight is None or msg.command != mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+            return
+        if msg.get_srcSystem() != self.system_id:
+            return
+        message_type, rate, _, _ = self.in_flight
+        if msg.result == mavlink.MAV_RESULT_ACCEPTED:
+            self.in_flight = None
+            if rate > 0:
+                self.confirmed[message_type] = rate
+            else:
+                self.confirmed.pop(message_type, None)
+            logger.info(f"Vehicle {self.system_id} streams {message_type} at "
+                        f"{f'{rate:g} Hz' if rate > 0 else 'its default rate'}.")
+            self.send_next()
+        elif msg.result in (mavlink.MAV_RESULT_TEMPORARILY_REJECTED, mavlink.MAV_RESULT_IN_PROGRESS):
+            # Resent when the ack timeout runs out
+            return
+        elif msg.result == mavlink.MAV_RESULT_UNSUPPORTED:
+            self.fall_back(f"it answered {message_type} with result {msg.result}")
+        else:
+            # Denied or failed for this message only, e.g. one the autopilot cannot stream; PX4 has no
+            # REQUEST_DATA_STREAM to fall back to, so the other messages keep being negotiated
+            logger.warning(f"Vehicle {self.system_id} refused {message_type} at "
+                           f"{f'{rate:g} Hz' if rate > 0 else 'its default rate'} (result {msg.result}).")
+            self.in_flight = None
+            self.unavailable.add(message_type)
+            self.confirmed.pop(message_type, None)
+            self.send_next()
+
+    def check_ack(self):
+        if self.in_flight is None:
+            self.ack_timer.stop()
+            return
+        message_type, rate, sent_at, attempts = self.in_flight
+        if time.monotonic() - sent_at < ACK_TIMEOUT:
+            return
+        vehicle = self.vehicle()
+        if vehicle is None:
+            self.in_flight = None
+            return
+        if attempts >= MAX_ATTEMPTS:
+            self.fall_back(f"no answer after {attempts} attempts")
+            return
+        # Radios lose packets; the confirmation field counts the resends
+        self.in_flight = (message_type, rate, time.monotonic(), attempts + 1)
+        self.send_interval(vehicle, message_type, rate, attempts)
+
+    def fall_back(self, reason):
+        logger.info(f"Vehicle {self.system_id} does not take SET_MESSAGE_INTERVAL ({reason}), "
+                    f"using REQUEST_DATA_STREAM instead.")
+        self.legacy = True
+        self.in_flight = None
+        self.ack_timer.stop()
+        vehicle = self.vehicle()
+        if vehicle is not None:
+            self.request_data_streams(vehicle, self.wanted())
+
+    def request_data_streams(self, vehicle, wanted):
+        # Whole groups at the rate of their fastest wanted message; fire and forget, there is no ack
+        from pymavlink import mavutil
+        mavlink = mavutil.mavlink
+        rates = {}
+        for message_type, rate in wanted.items():
+            group = DATA_STREAM_GROUPS.get(message_type)
+            if group is None:
+                logger.warning(f"{message_type} has no data stream group, its rate cannot be requested.")
+                continue
+            rates[group] = max(rates.get(group, 0), math.ceil(rate))
+        for group in self.data_stream_rates:
+            rates.setdefault(group, DATA_STREAM_IDLE_RATE)
+        for group, rate in rates.items():
+            if self.data_stream_rates.get(group) == rate:
+                continue
+            msg = vehicle.link.connection.mav.request_data_stream_encode(
+                vehicle.system_id, vehicle.component_id, getattr(mavlink, f"MAV_DATA_STREAM_{group}"), rate, 1)
+            try:
+                self.telemetry_hub.send(msg, vehicle.system_id)
+            except Exception as e:
+                logger.warning(f"Could not request data stream {group} at {rate} Hz: {e}")
+                continue
+            self.data_stream_rates[group] = rate
@@ -0,0 +1,168 @@
+import json, math
+import numpy as np
+from mission_geometry import local_projection
+from waypoint_store import EARTH_RADIUS_M, make_waypoints, MISSION_TYPE_COMMANDS
+
+DEFAULT_SIDE_OVERLAP = 0.7
+DEFAULT_FRONT_OVERLAP = 0.8
+# Scan lines are intersected with the polygon edges this many at a time
+LINE_BLOCK = 1024
+MAX_SURVEY_WAYPOINTS = 200000
+
+def line_spacing(footprint_width, side_overlap):
+    return footprint_width * (1.0 - side_overlap)
+
+def trigger_spacing(footprint_length, front_overlap):
+    return footprint_length * (1.0 - front_overlap)
+
+def rotate(x, y, angle):
+    # Counter-clockwise by angle radians
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    return x * cos_a - y * sin_a, x * sin_a + y * cos_a
+
+def scan_segments(polygon_x, polygon_y, line_y):
+    # Inside stretches of the horizontal lines y = line_y across the polygon, even-odd rule so concave
+    # outlines give several stretches per line. Returns (line index, x start, x end) arrays
+    x1, y1 = polygon_x, polygon_y
+    x2, y2 = np.roll(polygon_x, -1), np.roll(polygon_y, -1)
+    sloped = y1 != y2
+    x1, y1, x2, y2 = x1[sloped], y1[sloped], x2[sloped], y2[sloped]
+    lines, starts, ends = [], [], []
+    for first in range(0, len(line_y), LINE_BLOCK):
+        y = line_y[first:first + LINE_BLOCK, None]
+        # Half-open test so a line through a vertex crosses exactly one of its two edges
+        crosses = (y1 <= y) != (y2 <= y)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            crossing_x = np.where(crosses, x1 + (y - y1) * (x2 - x1) / (y2 - y1), np.inf)
+        crossing_x.sort(axis=1)
+        count = crosses.sum(axis=1)
+        pairs = count.max() // 2 if len(count) else 0
+        if pairs == 0:
+            continue
+        enter = crossing_x[:, 0:2 * pairs:2]
+        leave = crossing_x[:, 1:2 * pairs:2]
+        valid = np.isfinite(leave) & (leave > enter)
+        line_index, _ = np.nonzero(valid)
+        lines.append(line_index + first)
+        starts.append(enter[valid])
+        ends.append(leave[valid])
+    if not lines:
+        empty = np.zeros(0)
+        return empty.astype(np.intp), empty, empty
+    return np.concatenate(lines), np.concatenate(starts), np.concatenate(ends)
+
+def order_stretches(lines, starts, ends, line_count, spacing):
+    # Flying order for the stretches. Consecutive lines crossing the polygon the same number of times
+    # form a band; the k-th stretch of each line in a band is one cell, e.g. each arm of a U. Cells are
+    # flown one after another as small lawnmowers, so concave areas are not crossed on every line.
+    # Returns (begin x, finish x, line) per stretch in flying order
+    order = np.lexsort((starts, lines))
+    lines, starts, ends = lines[order], starts[order], ends[order]
+    per_line = np.bincount(lines, minlength=line_count)
+    first_of_line = np.cumsum(per_line) - per_line
+    rank = np.arange(len(lines)) - first_of_line[lines]
+    # A band ends wherever the stretch count changes
+    band_of_line = np.cumsum(np.concatenate(([0], per_line[1:] != per_line[:-1])))
+    band = band_of_line[lines]
+    cell_order = np.lexsort((lines, rank, band))
+
+    begin = np.empty(len(lines))
+    finish = np.empty(len(lines))
+    ordered_lines = np.empty(len(lines), dtype=np.intp)
+    position = None
+    done = 0
+    cell_keys = band[cell_order] * (per_line.max() + 1) + rank[cell_order]
+    boundaries = np.flatnonzero(np.diff(cell_keys)) + 1
+    for cell in np.split(cell_order, boundaries):
+        cell_starts, cell_ends, cell_lines = starts[cell], ends[cell], lines[cell]
+        index, from_end = 0, False
+        if position is not None:
+            # Enter the cell at whichever of its four corners is closest to where the last one ended
+            corners = [(math.hypot((cell_ends[index] if from_end else cell_starts[index]) - position[0],
+                                   cell_lines[index] * spacing - position[1]), index, from_end)
+                       for index in (0, -1) for from_end in (False, True)]
+            _, index, from_end = min(corners)
+        if index == -1:
+            cell_starts, cell_ends, cell_lines = cell_starts[::-1], cell_ends[::-1], cell_lines[::-1]
+        # Alternate direction line by line
+        flip = (np.arange(len(cell)) % 2 == 1) != from_end
+        stop = done + len(cell)
+        begin[done:stop] = np.where(flip, cell_ends, cell_starts)
+        finish[done:stop] = np.where(flip, cell_starts, cell_ends)
+        ordered_lines[done:stop] = cell_lines
+        position = (finish[stop - 1], cell_lines[-1] * spacing)
+        done = stop
+    return begin, finish, ordered_lines
+
+def boustrophedon(polygon_x, polygon_y, spacing, point_spacing=None, heading=0.0):
+    # Lawnmower pattern over a polygon in local east/north metres. Lines run along heading (degrees
+    # from north) and carry a point every point_spacing metres (just their ends if None)
+    if spacing <= 0:
+        raise ValueError("Line spacing must be positive.")
+    if point_spacing is not None and point_spacing <= 0:
+        raise ValueError("Waypoint spacing must be positive.")
+    polygon_x = np.asarray(polygon_x, dtype=np.float64)
+    polygon_y = np.asarray(polygon_y, dtype=np.float64)
+    if len(polygon_x) < 3:
+        raise ValueError("A survey area needs at least 3 corners.")
+
+    # Turn the polygon so the flight lines are horizontal: a compass heading h is the direction
+    # (sin h, cos h), which rotating by h - 90 degrees maps onto +x
+    angle = math.radians(heading) - math.pi / 2
+    x, y = rotate(polygon_x, polygon_y, angle)
+    line_count = int(math.floor((y.max() - y.min()) / spacing)) + 1
+    if line_count > MAX_SURVEY_WAYPOINTS:
+        raise ValueError("The line spacing is too small for this area.")
+    # Centre the lines in the area's extent across track
+    offset = (y.max() - y.min() - (line_count - 1) * spacing) / 2
+    line_y = y.min() + offset + spacing * np.arange(line_count)
+    lines, starts, ends = scan_segments(x, y, line_y)
+    if len(lines) == 0:
+        return np.zeros(0), np.zeros(0)
+
+    begin, finish, lines = order_stretches(lines, starts, ends, line_count, spacing)
+
+    # Points per stretch, evenly spread so both ends are always included
+    lengths = np.abs(finish - begin)
+    if point_spacing is None:
+        counts = np.full(len(lines), 2)
+    else:
+        counts = np.ceil(lengths / point_spacing).astype(np.intp) + 1
+    total = int(counts.sum())
+    if total > MAX_SURVEY_WAYPOINTS:
+        raise ValueError(f"The survey would need {total} waypoints, more than {MAX_SURVEY_WAYPOINTS}.")
+    stretch = np.repeat(np.arange(len(lines)), counts)
+    step = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = step / np.maximum(counts[stretch] - 1, 1)
+    point_x = begin[stretch] + (finish[stretch] - begin[stretch]) * fraction
+    point_y = line_y[lines[stretch]]
+    return rotate(point_x, point_y, -angle)
+
+def survey_waypoints(polygon, altitude, footprint_width, footprint_length, side_overlap=DEFAULT_SIDE_OVERLAP,
+                     front_overlap=DEFAULT_FRONT_OVERLAP, heading=0.0):
+    # Flight waypoints covering a polygon of (lat, lon) corners with photos at the given overlaps
+    if not 0.0 <= side_overlap < 1.0 or not 0.0 <= front_overlap < 1.0:
+        raise ValueError("Overlaps must be at least 0% and below 100%.")
+    if footprint_width <= 0 or footprint_length <= 0:
+        raise ValueError("The camera footprint must be positive.")
+    polygon = np.asarray(polygon, dtype=np.float64)
+    origin = (float(polygon[:, 0].mean()), float(polygon[:, 1].mean()))
+    x, y = local_projection(polygon[:, 0], polygon[:, 1], *origin)
+    east, north = boustrophedon(x, y, line_spacing(footprint_width, side_overlap),
+                                trigger_spacing(footprint_length, front_overlap), heading)
+    latitudes = origin[0] + np.degrees(north / EARTH_RADIUS_M)
+    longitudes = origin[1] + np.degrees(east / (EARTH_RADIUS_M * math.cos(math.radians(origin[0]))))
+    return make_waypoints(latitudes, longitudes, altitude, MISSION_TYPE_COMMANDS["Flight"])
+
+def load_survey_polygon(path):
+    # Survey area from a QGC .plan file: the first survey item's polygon, else the first geofence polygon
+    with open(path) as f:
+        plan = json.load(f)
+    for item in plan.get("mission", {}).get("items", []):
+        polygon = item.get("polygon") or item.get("TransectStyleComplexItem", {}).get("polygon")
+        if item.get("type") == "ComplexItem" and polygon and len(polygon) >= 3:
+            return [(float(latitude), float(longitude)) for latitude, longitude in polygon]
+    for item in plan.get("geoFence", {}).get("polygons", []):
+        if len(item.get("polygon", [])) >= 3:
+            return [(float(latitude), float(longitude)) for latitude, longitude in item["polygon"]]
+    raise ValueError("No survey or geofence polygon in the file.")
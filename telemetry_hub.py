@@ -0,0 +1,236 @@
+import logging, os
+from PyQt6.QtCore import QObject, QDateTime, pyqtSignal
+import perf_metrics
+from link_quality import LinkQualityMonitor
+from logger import logger, log_rate_limited
+from stream_rates import StreamRateRegistry
+
+# Raw MAVLink traffic of every connection is recorded here
+TELEMETRY_LOG_FOLDER = os.path.join("logs", "telemetry")
+
+class TelemetryHub(QObject):
+    # Emitted when a link opens / when the last link closes
+    connected = pyqtSignal(str)
+    disconnected = pyqtSignal()
+    connection_lost = pyqtSignal(str)
+    vehicle_added = pyqtSignal(int)
+    vehicle_removed = pyqtSignal(int)
+    # System id of the vehicle pages display, 0 when there is none
+    selected_vehicle_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # connection string -> MavlinkLink, all read by one I/O thread
+        self.links = {}
+        self.io_thread = None
+        # system id -> VehicleState, mirrored from the I/O thread as vehicles appear and vanish
+        self.vehicles = {}
+        self.selected_system = None
+        # Callbacks for the selected vehicle's messages, and for every vehicle's
+        self.subscribers = {}
+        self.all_vehicle_subscribers = {}
+        # (callable, message types or None) for decoded messages and callables for raw packets, both
+        # run on the I/O thread
+        self.thread_listeners = []
+        self.packet_listeners = []
+        self.telemetry_log = None
+        # Message rates pages ask the selected vehicle for
+        self.stream_rates = StreamRateRegistry(self)
+        # Loss, rates, heartbeat timing and round trips of every link
+        self.link_quality = LinkQualityMonitor(self)
+
+    def is_connected(self):
+        return bool(self.links)
+
+    def connect_to_vehicle(self, connection_string):
+        # Adds a link next to any already open; reconnecting the same string replaces its socket
+        if connection_string in self.links:
+            self.disconnect_from_vehicle(connection_string)
+
+        # Imported on first connect, pymavlink is slow to load and not needed for startup
+        from connection_manager import LinkIOThread, MavlinkLink
+        from telemetry_replay import ReplayLink, replay_path
+
+        # May raise, callers report the error to the user. replay:<tlog> plays a recorded flight instead
+        if replay_path(connection_string) is not None:
+            link = ReplayLink(connection_string)
+        else:
+            link = MavlinkLink(connection_string)
+        if self.io_thread is None:
+            self.start_telemetry_log()
+            self.io_thread = LinkIOThread()
+            self.io_thread.set_selected_system(self.selected_system)
+            self.io_thread.set_thread_listeners(self.thread_listeners)
+            self.io_thread.set_packet_listeners(self.packet_listeners)
+            self.update_reader_filter()
+            self.io_thread.message_received.connect(self.dispatch_message)
+            self.io_thread.link_lost.connect(self.on_connection_lost)
+            self.io_thread.vehicle_discovered.connect(self.on_vehicle_discovered)
+            self.io_thread.vehicle_lost.connect(self.on_vehicle_lost)
+            self.io_thread.start()
+        self.links[connection_string] = link
+        self.io_thread.add_link(link)
+
+        logger.info(f"Telemetry hub connected to {connection_string}")
+        self.connected.emit(connection_string)
+
+    def disconnect_from_vehicle(self, connection_string=None):
+        # One link, or every link when no connection string is given
+        if connection_string is None:
+            connection_strings = list(self.links)
+        else:
+            connection_strings = [connection_string] if connection_string in self.links else []
+        for closing in connection_strings:
+            link = self.links.pop(closing)
+            # The I/O thread unregisters and closes it between reads
+            self.io_thread.remove_link(link)
+            logger.info(f"Telemetry hub disconnected from {closing}")
+
+        if not self.links and self.io_thread is not None:
+            self.shut_down()
+
+    def shut_down(self):
+        self.io_thread.stop()
+        self.io_thread.wait()
+        self.io_thread = None
+        self.stop_telemetry_log()
+        for system_id in list(self.vehicles):
+            self.on_vehicle_lost(system_id)
+        self.disconnected.emit()
+
+    def start_telemetry_log(self):
+        # Record every packet of every link with its receive time as a tlog plus a seek index
+        from telemetry_log import TelemetryLogWriter
+        os.makedirs(TELEMETRY_LOG_FOLDER, exist_ok=True)
+        filename = f"{QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')}.tlog"
+        try:
+            self.telemetry_log = TelemetryLogWriter(os.path.join(TELEMETRY_LOG_FOLDER, filename))
+        except OSError as e:
+            logger.error(f"Could not start telemetry log: {e}")
+            return
+        self.add_packet_listener(self.telemetry_log.write_packet)
+        logger.info(f"Recording telemetry to {self.telemetry_log.path}")
+
+    def stop_telemetry_log(self):
+        if self.telemetry_log is not None:
+            self.remove_packet_listener(self.telemetry_log.write_packet)
+            self.telemetry_log.close()
+            self.telemetry_log = None
+
+    def on_connection_lost(self, connection_string, reason):
+        logger.error(f"Telemetry link {connection_string} lost: {reason}")
+        link = self.links.pop(connection_string, None)
+        if link is not None:
+            link.close()
+        self.connection_lost.emit(reason)
+        if not self.links and self.io_thread is not None:
+            self.shut_down()
+
+    def on_vehicle_discovered(self, system_id):
+        vehicle = self.io_thread.vehicles.get(system_id) if self.io_thread is not None else None
+        if vehicle is None:
+            return
+        self.vehicles[system_id] = vehicle
+        logger.info(f"Discovered {vehicle.name} on {vehicle.link.connection_string}")
+        self.vehicle_added.emit(system_id)
+        if self.selected_system is None:
+            self.select_vehicle(system_id)
+
+    def on_vehicle_lost(self, system_id):
+        if self.vehicles.pop(system_id, None) is None:
+            return
+        self.vehicle_removed.emit(system_id)
+        if self.selected_system == system_id:
+            self.select_vehicle(min(self.vehicles) if self.vehicles else None)
+
+    def select_vehicle(self, system_id):
+        if system_id == self.selected_system:
+            return
+        self.selected_system = system_id
+        if self.io_thread is not None:
+            self.io_thread.set_selected_system(system_id)
+        self.selected_vehicle_changed.emit(system_id or 0)
+
+    def reset_history(self):
+        # Pages drop their plots and tracks as when another vehicle is picked, e.g. after a replay seek
+        self.selected_vehicle_changed.emit(self.selected_system or 0)
+
+    def vehicle(self, system_id=None):
+        # The selected vehicle by default; None until a heartbeat identified one
+        return self.vehicles.get(self.selected_system if system_id is None else system_id)
+
+    def subscribe(self, message_type, callback, all_vehicles=False):
+        # By default callbacks only see the selected vehicle; all_vehicles=True sees every one
+        subscribers = self.all_vehicle_subscribers if all_vehicles else self.subscribers
+        callbacks = subscribers.setdefault(message_type, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+        self.update_reader_filter()
+
+    def unsubscribe(self, message_type, callback):
+        for subscribers in (self.subscribers, self.all_vehicle_subscribers):
+            callbacks = subscribers.get(message_type, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                subscribers.pop(message_type, None)
+        self.update_reader_filter()
+
+    def add_thread_listener(self, listener, message_types=None):
+        # The listener runs on the I/O thread for every link and must not touch widgets. Naming the
+        # message types it handles spares decoding the rest; None decodes every message for it
+        self.thread_listeners = [entry for entry in self.thread_listeners if entry[0] != listener]
+        self.thread_listeners.append((listener, None if message_types is None else frozenset(message_types)))
+        if self.io_thread is not None:
+            self.io_thread.set_thread_listeners(self.thread_listeners)
+
+    def remove_thread_listener(self, listener):
+        self.thread_listeners = [entry for entry in self.thread_listeners if entry[0] != listener]
+        if self.io_thread is not None:
+            self.io_thread.set_thread_listeners(self.thread_listeners)
+
+    def add_packet_listener(self, listener):
+        # Called on the I/O thread with (packet bytes, msgid, receive time) for every packet of a live link
+        if listener not in self.packet_listeners:
+            self.packet_listeners.append(listener)
+        if self.io_thread is not None:
+            self.io_thread.set_packet_listeners(self.packet_listeners)
+
+    def remove_packet_listener(self, listener):
+        if listener in self.packet_listeners:
+            self.packet_listeners.remove(listener)
+        if self.io_thread is not None:
+            self.io_thread.set_packet_listeners(self.packet_listeners)
+
+    def update_reader_filter(self):
+        if self.io_thread is not None:
+            self.io_thread.set_message_types(self.subscribers.keys(), self.all_vehicle_subscribers.keys())
+
+    def dispatch_message(self, msg):
+        # Runs on the GUI thread; copy so callbacks may (un)subscribe while iterating
+        perf_metrics.record_since("mavlink.receive_to_dispatch", getattr(msg, "_received", 0.0))
+        perf_metrics.count("mavlink.dispatched")
+        started = perf_metrics.now()
+        msg_type = msg.get_type()
+        callbacks = list(self.all_vehicle_subscribers.get(msg_type, ()))
+        if self.selected_system in (None, msg.get_srcSystem()):
+            callbacks += self.subscribers.get(msg_type, ())
+        for callback in callbacks:
+            try:
+                callback(msg)
+            except Exception as e:
+                log_rate_limited(f"subscriber:{msg_type}", logging.ERROR, f"Subscriber for {msg_type} failed: {e}",
+                                 exc_info=True)
+        perf_metrics.record_since("mavlink.subscribers", started)
+
+    def send(self, msg, system_id=None):
+        if not self.links:
+            raise ConnectionError("No vehicle connected.")
+        vehicle = self.vehicle(system_id)
+        if vehicle is not None:
+            vehicle.send(msg)
+            return
+        # No heartbeat seen yet, so the vehicle's link is unknown: try them all
+        for link in self.links.values():
+            link.send(msg)
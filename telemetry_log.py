@@ -0,0 +1,199 @@
+import logging, mmap, os, struct, threading, time
+import numpy as np
+from logger import logger, log_rate_limited
+from mavlink_frames import mavlink2_dialect, packet_length, packet_msgid
+
+# tlog record: big-endian microsecond receive timestamp followed by the raw MAVLink packet
+TLOG_TIMESTAMP = struct.Struct(">Q")
+
+# Sidecar index: magic, then one fixed-size record per packet
+INDEX_MAGIC = b"GCSIDX01"
+INDEX_DTYPE = np.dtype([("time_us", "<u8"), ("offset", "<u8"), ("msgid", "<u4")])
+# Index records filtered at once when reading messages of some types
+MESSAGE_CHUNK = 65536
+
+def index_path_for(log_path):
+    return log_path + ".idx"
+
+
+class TelemetryLogWriter:
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self.index_path = index_path_for(path)
+        self.log_file = open(path, "wb", buffering=buffer_size)
+        self.index_file = open(self.index_path, "wb", buffering=buffer_size)
+        self.index_file.write(INDEX_MAGIC)
+        self.offset = 0
+        self.packets = 0
+        self.lock = threading.Lock()
+
+    def write_packet(self, packet, msgid, timestamp=None):
+        # Packet listener for the telemetry hub: every packet of every live link as received
+        time_us = int((time.time() if timestamp is None else timestamp) * 1e6)
+        with self.lock:
+            if self.log_file is None:
+                return
+            self.log_file.write(TLOG_TIMESTAMP.pack(time_us))
+            self.log_file.write(packet)
+            # The index points at the timestamp so readers can seek straight to a record
+            self.index_file.write(struct.pack("<QQI", time_us, self.offset, msgid))
+            self.offset += TLOG_TIMESTAMP.size + len(packet)
+            self.packets += 1
+
+    def flush(self):
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.flush()
+                self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.log_file is None:
+                return
+            self.log_file.close()
+            self.index_file.close()
+            self.log_file = None
+            self.index_file = None
+        logger.info(f"Telemetry log {self.path} closed with {self.packets} packets.")
+
+
+def build_index(log_path):
+    # Recreate the sidecar index for a tlog recorded elsewhere (or without one)
+    index_path = index_path_for(log_path)
+    with open(log_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            with open(index_path, "wb") as index_file:
+                index_file.write(INDEX_MAGIC)
+            return index_path
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with open(index_path, "wb", buffering=1 << 20) as index_file:
+                index_file.write(INDEX_MAGIC)
+                position = 0
+                while position + TLOG_TIMESTAMP.size + 2 < size:
+                    packet_start = position + TLOG_TIMESTAMP.size
+                    length = packet_length(buffer, packet_start)
+                    if length is None or packet_start + length > size:
+                        # Corrupt or truncated tail, stop at the last whole record
+                        break
+                    time_us, = TLOG_TIMESTAMP.unpack_from(buffer, position)
+                    index_file.write(struct.pack("<QQI", time_us, position, packet_msgid(buffer, packet_start)))
+                    position = packet_start + length
+        finally:
+            buffer.close()
+    return index_path
+
+
+class TelemetryLogReader:
+    def __init__(self, path):
+        self.path = path
+        index_path = index_path_for(path)
+        if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path) - 1:
+            build_index(path)
+
+        with open(index_path, "rb") as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"{index_path} is not a telemetry log index.")
+        record_count = (os.path.getsize(index_path) - len(INDEX_MAGIC)) // INDEX_DTYPE.itemsize
+
+        # Neither file is loaded into memory, pages are faulted in as they are touched
+        self.log_file = open(path, "rb")
+        self.log_size = os.fstat(self.log_file.fileno()).st_size
+        self.buffer = mmap.mmap(self.log_file.fileno(), 0, access=mmap.ACCESS_READ) if self.log_size else b""
+        if record_count:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", offset=len(INDEX_MAGIC),
+                                   shape=(record_count,))
+            # A log still being recorded may have index entries ahead of the flushed packets
+            self.index = self.index[:self.complete_records()]
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        # msgid -> positions in the index, built once per type on first use
+        self.type_positions = {}
+        self.dialect = mavlink2_dialect()
+        self.mav = self.dialect.MAVLink(None)
+        self.mav.robust_parsing = True
+
+    def complete_records(self):
+        count = int(np.searchsorted(self.index["offset"], max(0, self.log_size - TLOG_TIMESTAMP.size - 2)))
+        while count:
+            start = int(self.index["offset"][count - 1]) + TLOG_TIMESTAMP.size
+            length = packet_length(self.buffer, start)
+            if length is not None and start + length <= self.log_size:
+                break
+            count -= 1
+        return count
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.log_file.close()
+
+    @property
+    def start_time(self):
+        return self.index["time_us"][0] / 1e6 if len(self.index) else None
+
+    @property
+    def end_time(self):
+        return self.index["time_us"][-1] / 1e6 if len(self.index) else None
+
+    def msgid_for(self, message_type):
+        msgid = getattr(self.dialect, f"MAVLINK_MSG_ID_{message_type}", None)
+        if msgid is None:
+            raise ValueError(f"Unknown MAVLink message type: {message_type}")
+        return msgid
+
+    def positions_for(self, message_type):
+        msgid = self.msgid_for(message_type)
+        if msgid not in self.type_positions:
+            self.type_positions[msgid] = np.flatnonzero(self.index["msgid"] == msgid)
+        return self.type_positions[msgid]
+
+    def seek(self, timestamp, message_type=None):
+        # Index position of the first record at or after timestamp, O(log n)
+        time_us = int(timestamp * 1e6)
+        if message_type is None:
+            return int(np.searchsorted(self.index["time_us"], time_us))
+        positions = self.positions_for(message_type)
+        times = self.index["time_us"][positions]
+        found = int(np.searchsorted(times, time_us))
+        return int(positions[found]) if found < len(positions) else len(self.index)
+
+    def packet_at(self, position):
+        record = self.index[position]
+        start = int(record["offset"]) + TLOG_TIMESTAMP.size
+        length = packet_length(self.buffer, start)
+        return record["time_us"] / 1e6, bytes(self.buffer[start:start + length])
+
+    def decode_at(self, position):
+        timestamp, packet = self.packet_at(position)
+        msg = self.mav.decode(bytearray(packet))
+        msg._timestamp = timestamp
+        return msg
+
+    def messages(self, start_time=None, end_time=None, message_types=None):
+        # Lazily decode records in time order, optionally limited to a window and some types
+        first = 0 if start_time is None else self.seek(start_time)
+        last = len(self.index) if end_time is None else self.seek(end_time)
+        wanted = None
+        if message_types is not None:
+            wanted = [self.msgid_for(message_type) for message_type in message_types]
+
+        # Filtered a chunk of the index at a time, so memory stays bounded however large the log
+        for chunk_start in range(first, last, MESSAGE_CHUNK):
+            chunk_end = min(chunk_start + MESSAGE_CHUNK, last)
+            if wanted is None:
+                positions = range(chunk_start, chunk_end)
+            else:
+                selected = np.isin(self.index["msgid"][chunk_start:chunk_end], wanted)
+                positions = (chunk_start + np.flatnonzero(selected)).tolist()
+            for position in positions:
+                try:
+                    yield self.decode_at(position)
+                except Exception as e:
+                    log_rate_limited(f"undecodable:{self.path}", logging.WARNING,
+                                     f"Skipping undecodable record {position} in {self.path}: {e}")
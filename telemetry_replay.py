@@ -0,0 +1,257 @@
+import logging, socket, threading, time
+from collections import deque
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+from logger import logger, log_rate_limited
+
+# connection string of a recorded flight: replay:<path to .tlog>
+REPLAY_PREFIX = "replay:"
+MIN_SPEED = 0.25
+MAX_SPEED = 50.0
+# Speed 0 replays as fast as the consumers keep up, for headless batch processing
+AS_FAST_AS_POSSIBLE = 0.0
+# Decoded messages waiting for the I/O thread; the player refills once it has taken them all
+MAX_QUEUED = 1024
+# After this many messages the player waits until the GUI thread has dispatched everything sent so far,
+# so a fast replay is held back by the slowest consumer instead of piling up in the event queue
+CHECKPOINT_MESSAGES = 2048
+# Longest the player sleeps at once, so pause, seek and speed changes apply promptly
+MAX_SLEEP = 0.05
+# Replay position updates for the controls
+POSITION_INTERVAL = 0.1
+
+def replay_path(connection_string):
+    # The log path of a replay connection string, None for a live one
+    if connection_string.startswith(REPLAY_PREFIX):
+        return connection_string[len(REPLAY_PREFIX):]
+    return None
+
+
+class ReplayLink(QObject):
+    # Stands in for MavlinkLink: the I/O thread reads it through fileno() and connection.recv_msg(), so the
+    # hub and pages handle a recorded flight exactly like a live one. Messages keep their recorded receive
+    # time in _timestamp; a player thread releases them on the log's own timing, scaled by the speed.
+    position_changed = pyqtSignal(float)
+    finished = pyqtSignal()
+    checkpoint = pyqtSignal()
+
+    def __init__(self, connection_string, speed=1.0, parent=None):
+        super().__init__(parent)
+        self.connection_string = connection_string
+        # Imported here so pages can use this module without loading pymavlink at startup
+        from link_quality import LinkStatistics
+        from mavlink_frames import mavlink2_dialect
+        from telemetry_log import TelemetryLogReader
+        # May raise, callers report the error to the user
+        self.reader = TelemetryLogReader(replay_path(connection_string))
+        if not len(self.reader):
+            self.reader.close()
+            raise ValueError(f"{self.reader.path} holds no telemetry.")
+        self.times = self.reader.index["time_us"]
+        # The I/O thread calls connection.recv_msg() like on a pymavlink connection, and pages encode
+        # their commands with connection.mav, whose packets write() drops
+        self.connection = self
+        self.mav = mavlink2_dialect().MAVLink(self)
+        # No raw bytes to parse, messages arrive decoded
+        self.parser = None
+        self.eof = False
+        self.message_count = 0
+        # Loss and rates of the recorded link, measured on the log's clock
+        self.statistics = LinkStatistics(lambda: self.last_time)
+
+        # Wakes the I/O thread's selector whenever messages are queued
+        self.notify_reader, self.notify_writer = socket.socketpair()
+        self.notify_reader.setblocking(False)
+        self.queue = deque()
+
+        # Guards everything below; the player waits on it for a state change or free queue space
+        self.condition = threading.Condition()
+        self.speed = self.checked_speed(speed)
+        self.paused = False
+        self.stopping = False
+        self.position = 0
+        # Bumped on every seek so messages decoded before it are thrown away
+        self.generation = 0
+        # (wall clock, log time in us) the current pace is measured from
+        self.anchor = (time.monotonic(), int(self.times[0]))
+        self.last_time = self.start_time
+        self.finished_sent = False
+
+        # The checkpoint is queued to this object's thread, the GUI thread, behind the messages before it
+        self.checkpoint_reached = threading.Event()
+        self.checkpoint.connect(self.checkpoint_reached.set)
+        self.thread = threading.Thread(target=self.run, name="ReplayPlayer", daemon=True)
+        self.thread.start()
+        logger.info(f"Replaying {self.reader.path}: {len(self.reader)} packets over "
+                    f"{self.end_time - self.start_time:.0f} s")
+
+    @property
+    def start_time(self):
+        return self.reader.start_time
+
+    @property
+    def end_time(self):
+        return self.reader.end_time
+
+    def checked_speed(self, speed):
+        if speed != AS_FAST_AS_POSSIBLE and not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"Replay speed must be between {MIN_SPEED}x and {MAX_SPEED:.0f}x.")
+        return float(speed)
+
+    def fileno(self):
+        return self.notify_reader.fileno()
+
+    def send(self, msg):
+        # A recorded vehicle cannot be commanded; pages that send just get no answer, as from a silent link
+        log_rate_limited(f"replay-send:{self.connection_string}", logging.INFO,
+                         f"Not sending {msg.get_type()} to replayed telemetry.")
+
+    def write(self, packet):
+        pass
+
+    def recv_msg(self):
+        # Called on the I/O thread until it returns None
+        try:
+            msg = self.queue.popleft()
+        except IndexError:
+            msg = None
+        if msg is None:
+            # Drain the wakeup bytes before looking again, so a message queued meanwhile still wakes us
+            try:
+                while self.notify_reader.recv(4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+            try:
+                msg = self.queue.popleft()
+            except IndexError:
+                with self.condition:
+                    self.condition.notify_all()
+                return None
+        self.last_time = msg._timestamp
+        return msg
+
+    def current_time(self):
+        # Log time of the next message to play
+        return int(self.times[self.position]) if self.position < len(self.times) else int(self.times[-1])
+
+    def reanchor(self):
+        self.anchor = (time.monotonic(), self.current_time())
+
+    def set_speed(self, speed):
+        speed = self.checked_speed(speed)
+        with self.condition:
+            self.speed = speed
+            self.reanchor()
+            self.condition.notify_all()
+
+    def pause(self):
+        with self.condition:
+            self.paused = True
+            self.condition.notify_all()
+
+    def resume(self):
+        with self.condition:
+            self.paused = False
+            self.reanchor()
+            self.condition.notify_all()
+
+    def seek(self, timestamp):
+        # Jump to the first message at or after timestamp (log time in seconds)
+        with self.condition:
+            self.position = self.reader.seek(timestamp)
+            self.generation += 1
+            self.queue.clear()
+            self.finished_sent = False
+            self.last_time = self.current_time() / 1e6
+            # Sequence numbers and rates start over from the new position
+            self.statistics.reset()
+            self.reanchor()
+            self.condition.notify_all()
+
+    def at_end(self):
+        return self.position >= len(self.times) and not self.queue
+
+    def run(self):
+        sent = 0
+        last_position_update = 0.0
+        while True:
+            with self.condition:
+                while not self.stopping and (self.paused or self.position >= len(self.times) or
+                                             len(self.queue) >= MAX_QUEUED):
+                    if self.position >= len(self.times) and not self.queue and not self.finished_sent:
+                        self.finished_sent = True
+                        self.position_changed.emit(self.end_time)
+                        self.finished.emit()
+                    self.condition.wait(MAX_SLEEP)
+                if self.stopping:
+                    return
+
+                first = self.position
+                last = min(len(self.times), first + MAX_QUEUED - len(self.queue), first + CHECKPOINT_MESSAGES - sent)
+                if self.speed != AS_FAST_AS_POSSIBLE:
+                    # Everything due by now on the log's clock
+                    wall_anchor, log_anchor = self.anchor
+                    now_us = log_anchor + (time.monotonic() - wall_anchor) * self.speed * 1e6
+                    due = int(np.searchsorted(self.times[first:last], now_us, side="right"))
+                    if due == 0:
+                        wait = (int(self.times[first]) - now_us) / 1e6 / self.speed
+                        self.condition.wait(min(max(wait, 0.0), MAX_SLEEP))
+                        continue
+                    last = first + due
+                self.position = last
+                generation = self.generation
+
+            # Decoding happens outside the lock; only this thread uses the reader's parser
+            messages = []
+            for position in range(first, last):
+                try:
+                    msg = self.reader.decode_at(position)
+                except Exception as e:
+                    log_rate_limited(f"undecodable:{self.reader.path}", logging.WARNING,
+                                     f"Skipping undecodable record {position} in {self.reader.path}: {e}")
+                    continue
+                messages.append(msg)
+
+            with self.condition:
+                if generation != self.generation or self.stopping:
+                    continue
+                self.queue.extend(messages)
+            try:
+                self.notify_writer.send(b"\0")
+            except OSError:
+                pass
+            sent += last - first
+
+            now = time.monotonic()
+            if now - last_position_update >= POSITION_INTERVAL:
+                last_position_update = now
+                self.position_changed.emit(self.last_time)
+            if sent >= CHECKPOINT_MESSAGES:
+                sent = 0
+                self.wait_for_consumers()
+
+    def wait_for_consumers(self):
+        # Until the I/O thread took everything queued and the GUI thread got through what it emitted
+        with self.condition:
+            while self.queue and not self.stopping:
+                self.condition.wait(MAX_SLEEP)
+        self.checkpoint_reached.clear()
+        self.checkpoint.emit()
+        while not self.stopping and not self.checkpoint_reached.wait(MAX_SLEEP):
+            pass
+
+    def close(self):
+        # From the I/O thread when the link is removed, or the GUI thread when it is lost; runs once
+        with self.condition:
+            if self.stopping:
+                return
+            self.stopping = True
+            self.condition.notify_all()
+        self.checkpoint_reached.set()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        self.queue.clear()
+        self.reader.close()
+        self.notify_reader.close()
+        self.notify_writer.close()
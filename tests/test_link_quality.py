@@ -0,0 +1,17 @@
+from link_quality import REORDER_WINDOW, SequenceTracker
+
+def feed(sequence):
+    tracker = SequenceTracker(sequence[0] & 0xFF)
+    for seq in sequence[1:]:
+        tracker.update(seq & 0xFF)
+    return tracker.summary()
+
+def test_gap_reorder_and_duplicate():
+    summary = feed([250, 251, 253, 252, 252, 255, 256, 259, 257])
+    assert (summary["lost"], summary["duplicates"], summary["reordered"]) == (2, 1, 2)
+
+def test_long_gaps_count_as_loss():
+    for gap in (REORDER_WINDOW, 127, 150, 200, 256 - REORDER_WINDOW - 1):
+        summary = feed(list(range(100)) + list(range(100 + gap, 400 + gap)))
+        assert summary["lost"] == gap, gap
+        assert summary["duplicates"] == 0 and summary["reordered"] == 0, gap
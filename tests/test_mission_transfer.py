@@ -0,0 +1,57 @@
+import threading
+import numpy as np
+from pymavlink import mavutil
+from mission_transfer import MissionTransferEngine
+from sim_vehicle import SimulatedVehicle
+from waypoint_store import make_waypoints
+
+PORT = 14620
+
+def pump(connection, engine, stop):
+    # Stands in for the telemetry hub's receive thread
+    while not stop.is_set():
+        msg = connection.recv_match(blocking=True, timeout=0.1)
+        if msg is not None:
+            engine.handle_message(msg)
+
+def transfer(loss, port):
+    vehicle = SimulatedVehicle(f"udpout:127.0.0.1:{port}", loss=loss, seed=7)
+    gcs = mavutil.mavlink_connection(f"udpin:127.0.0.1:{port}", source_system=255)
+    vehicle.start()
+    stop = threading.Event()
+    reader = None
+    try:
+        assert gcs.wait_heartbeat(timeout=5) is not None
+        send_lock = threading.Lock()
+
+        def send(msg):
+            with send_lock:
+                gcs.mav.send(msg)
+
+        engine = MissionTransferEngine(gcs.mav, gcs.target_system, gcs.target_component, timeout=0.2,
+                                       max_retries=20, send=send)
+        reader = threading.Thread(target=pump, args=(gcs, engine, stop), daemon=True)
+        reader.start()
+
+        steps = np.arange(40) * 1e-5
+        items = make_waypoints(45.0 + steps, -75.0 + steps, np.round(50.3 + np.arange(40) * 0.7, 1))
+        assert engine.upload(items) == len(items)
+        return items, engine.download()
+    finally:
+        stop.set()
+        if reader is not None:
+            reader.join()
+        vehicle.stop()
+        gcs.close()
+
+def test_upload_and_download_round_trip():
+    items, downloaded = transfer(0.0, PORT)
+    assert np.allclose(items["latitude"], downloaded["latitude"], atol=1e-7)
+    assert np.allclose(items["longitude"], downloaded["longitude"], atol=1e-7)
+    assert np.array_equal(items["altitude"], downloaded["altitude"])
+    assert np.array_equal(items["command"], downloaded["command"])
+
+def test_round_trip_survives_packet_loss():
+    items, downloaded = transfer(0.1, PORT + 1)
+    assert len(downloaded) == len(items)
+    assert np.array_equal(items["command"], downloaded["command"])
@@ -0,0 +1,300 @@
+import argparse, json, math, os, sqlite3, threading, time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+from logger import logger
+
+TILE_CACHE_PATH = os.path.join("cache", "tiles.mbtiles")
+UPSTREAM_TILE_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+TILE_ATTRIBUTION = "&copy; OpenStreetMap contributors"
+# OSM's tile policy asks for an identifying User-Agent
+USER_AGENT = "BlackBird Ground Station"
+
+LRU_TILES = 2048
+UPSTREAM_TIMEOUT = 5.0
+# After an upstream failure, serve only cached tiles for this long instead of waiting on every request
+UPSTREAM_BACKOFF = 30.0
+MAX_ZOOM = 19
+# Seeding is a bulk download, refuse anything larger than this
+MAX_SEED_TILES = 20000
+
+def tile_for(latitude, longitude, zoom):
+    # Web Mercator slippy map tile containing the point
+    n = 1 << zoom
+    latitude = max(-85.0511, min(85.0511, latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_for_bbox(south, west, north, east, min_zoom, max_zoom):
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_min, y_min = tile_for(north, west, zoom)
+        x_max, y_max = tile_for(south, east, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+def count_tiles_for_bbox(south, west, north, east, min_zoom, max_zoom):
+    count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_min, y_min = tile_for(north, west, zoom)
+        x_max, y_max = tile_for(south, east, zoom)
+        count += (x_max - x_min + 1) * (y_max - y_min + 1)
+    return count
+
+
+class MBTilesStore:
+    # MBTiles 1.3 file: one SQLite table of PNG blobs, rows numbered bottom-up (TMS)
+    def __init__(self, path=TILE_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                        "tile_row INTEGER, tile_data BLOB)")
+        self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        if self.db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0] == 0:
+            self.db.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                [("name", "BlackBird tile cache"), ("format", "png"), ("type", "baselayer")])
+        self.db.commit()
+
+    def get(self, zoom, x, y):
+        with self.lock:
+            row = self.db.execute("SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                                  (zoom, x, (1 << zoom) - 1 - y)).fetchone()
+        return row[0] if row else None
+
+    def contains(self, zoom, x, y):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                                   (zoom, x, (1 << zoom) - 1 - y)).fetchone() is not None
+
+    def put(self, zoom, x, y, data):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, (1 << zoom) - 1 - y, data))
+            self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class DirectoryTileStore:
+    # z/x/y.png files, the layout most tile download tools produce
+    def __init__(self, root):
+        self.root = root
+
+    def tile_path(self, zoom, x, y):
+        return os.path.join(self.root, str(zoom), str(x), f"{y}.png")
+
+    def get(self, zoom, x, y):
+        try:
+            with open(self.tile_path(zoom, x, y), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def contains(self, zoom, x, y):
+        return os.path.exists(self.tile_path(zoom, x, y))
+
+    def put(self, zoom, x, y, data):
+        path = self.tile_path(zoom, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return sum(len(files) for _, _, files in os.walk(self.root))
+
+    def close(self):
+        pass
+
+def open_tile_store(path=TILE_CACHE_PATH):
+    if os.path.isdir(path):
+        return DirectoryTileStore(path)
+    return MBTilesStore(path)
+
+
+class TileCache:
+    # Memory LRU in front of the on-disk store, with the upstream server as the last resort
+    def __init__(self, store, upstream_url=UPSTREAM_TILE_URL, lru_size=LRU_TILES, offline=False,
+                 timeout=UPSTREAM_TIMEOUT):
+        self.store = store
+        self.upstream_url = upstream_url
+        self.lru_size = lru_size
+        self.offline = offline
+        self.timeout = timeout
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.upstream_retry_at = 0.0
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def remember(self, key, data):
+        with self.lock:
+            self.lru[key] = data
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+    def fetch_upstream(self, zoom, x, y):
+        request = Request(self.upstream_url.format(z=zoom, x=x, y=y), headers={"User-Agent": USER_AGENT})
+        with urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def get_tile(self, zoom, x, y):
+        key = (zoom, x, y)
+        with self.lock:
+            data = self.lru.get(key)
+            if data is not None:
+                self.lru.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        data = self.store.get(zoom, x, y)
+        if data is not None:
+            with self.lock:
+                self.store_hits += 1
+            self.remember(key, data)
+            return data
+
+        with self.lock:
+            self.misses += 1
+            if self.offline or time.monotonic() < self.upstream_retry_at:
+                return None
+        try:
+            data = self.fetch_upstream(zoom, x, y)
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+                self.upstream_retry_at = time.monotonic() + UPSTREAM_BACKOFF
+            logger.warning(f"Tile {zoom}/{x}/{y} unavailable, serving cached tiles only for {UPSTREAM_BACKOFF:.0f} s: {e}")
+            return None
+        self.store.put(zoom, x, y, data)
+        self.remember(key, data)
+        return data
+
+    def stats(self):
+        with self.lock:
+            requests = self.memory_hits + self.store_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "hit_rate": (self.memory_hits + self.store_hits) / requests if requests else 0.0,
+                "lru_tiles": len(self.lru),
+            }
+
+    def seed(self, south, west, north, east, min_zoom, max_zoom, progress=None):
+        # Download every missing tile of a bounding box ahead of a mission
+        total = count_tiles_for_bbox(south, west, north, east, min_zoom, max_zoom)
+        if total > MAX_SEED_TILES:
+            raise ValueError(f"Seeding {total} tiles exceeds the limit of {MAX_SEED_TILES}, "
+                             f"shrink the area or zoom range.")
+        fetched = failed = 0
+        for done, (zoom, x, y) in enumerate(tiles_for_bbox(south, west, north, east, min_zoom, max_zoom), 1):
+            if not self.store.contains(zoom, x, y):
+                try:
+                    self.store.put(zoom, x, y, self.fetch_upstream(zoom, x, y))
+                    fetched += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Seeding tile {zoom}/{x}/{y} failed: {e}")
+            if progress is not None:
+                progress(done, total)
+        return fetched, failed
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["stats"]:
+            self.send_body(json.dumps(self.server.cache.stats()).encode(), "application/json")
+            return
+        try:
+            if parts[0] != "tiles" or len(parts) != 4:
+                raise ValueError(self.path)
+            zoom, x, y = int(parts[1]), int(parts[2]), int(parts[3].split(".")[0])
+        except ValueError:
+            self.send_error(404)
+            return
+        data = self.server.cache.get_tile(zoom, x, y)
+        if data is None:
+            self.send_error(404)
+        else:
+            self.send_body(data, "image/png")
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Tile requests are far too frequent for the application log
+        pass
+
+
+class TileServer:
+    # Serves the cache on localhost so the Leaflet page never talks to the tile server directly
+    def __init__(self, cache, host="127.0.0.1", port=0):
+        self.cache = cache
+        self.server = ThreadingHTTPServer((host, port), TileRequestHandler)
+        self.server.daemon_threads = True
+        self.server.cache = cache
+        self.thread = None
+
+    @property
+    def url_template(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.png"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="TileServer", daemon=True)
+        self.thread.start()
+        logger.info(f"Tile server listening on {self.url_template}")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread = None
+        logger.info(f"Tile server stopped, cache stats: {self.cache.stats()}")
+
+
+if __name__ == "__main__":
+    # python tile_cache.py seed SOUTH WEST NORTH EAST MIN_ZOOM MAX_ZOOM
+    parser = argparse.ArgumentParser(description="Offline map tile cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed", help="download a bounding box ahead of a mission")
+    seed_parser.add_argument("south", type=float)
+    seed_parser.add_argument("west", type=float)
+    seed_parser.add_argument("north", type=float)
+    seed_parser.add_argument("east", type=float)
+    seed_parser.add_argument("min_zoom", type=int)
+    seed_parser.add_argument("max_zoom", type=int)
+    seed_parser.add_argument("--store", default=TILE_CACHE_PATH, help="MBTiles file or z/x/y tile directory")
+    seed_parser.add_argument("--url", default=UPSTREAM_TILE_URL)
+    args = parser.parse_args()
+
+    store = open_tile_store(args.store)
+    cache = TileCache(store, args.url)
+    fetched, failed = cache.seed(args.south, args.west, args.north, args.east, args.min_zoom, args.max_zoom,
+                                 lambda done, total: print(f"\r{done}/{total} tiles", end="", flush=True))
+    print(f"\nfetched {fetched} new tiles, {failed} failed, {len(store)} tiles in {args.store}")
+    store.close()
@@ -0,0 +1,81 @@
+import numpy as np
+
+class RingBuffer:
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive.")
+
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        # Index of the next write and number of valid samples
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def append(self, time, value):
+        self.times[self.head] = time
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        count = len(times)
+        if count >= self.capacity:
+            # Only the newest samples survive
+            self.times[:] = times[-self.capacity:]
+            self.values[:] = values[-self.capacity:]
+            self.head = 0
+            self.size = self.capacity
+            return
+
+        # Write in at most two contiguous slices around the wrap point
+        first = min(count, self.capacity - self.head)
+        self.times[self.head:self.head + first] = times[:first]
+        self.values[self.head:self.head + first] = values[:first]
+        self.times[:count - first] = times[first:]
+        self.values[:count - first] = values[first:]
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def data(self):
+        # Samples oldest first; cost is bounded by the capacity, not the flight time
+        if self.size < self.capacity:
+            return self.times[:self.size], self.values[:self.size]
+        return (np.concatenate((self.times[self.head:], self.times[:self.head])),
+                np.concatenate((self.values[self.head:], self.values[:self.head])))
+
+    def last(self):
+        if self.size == 0:
+            return None
+        idx = (self.head - 1) % self.capacity
+        return self.times[idx], self.values[idx]
+
+
+class TimeSeries:
+    def __init__(self, name, message_type, field, capacity, scale=1.0):
+        self.name = name
+        self.message_type = message_type
+        self.field = field
+        self.scale = scale
+        self.buffer = RingBuffer(capacity)
+        # Set when new samples arrived since the last redraw
+        self.dirty = False
+
+    def add_message(self, time, message):
+        # Samples must stay in time order for the plot's window lookup; time_boot_ms going backwards means
+        # the vehicle rebooted, so its history starts over
+        last = self.buffer.last()
+        if last is not None and time < last[0]:
+            self.buffer.clear()
+        self.buffer.append(time, getattr(message, self.field) * self.scale)
+        self.dirty = True
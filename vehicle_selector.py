@@ -0,0 +1,43 @@
+from PyQt6.QtWidgets import QComboBox
+
+class VehicleSelector(QComboBox):
+    # Picks the vehicle pages display; every selector follows the hub's selection
+    def __init__(self, telemetry_hub, parent=None):
+        super().__init__(parent)
+
+        self.telemetry_hub = telemetry_hub
+        self.setPlaceholderText("No vehicle")
+        self.setSizeAdjustPolicy(QComboBox.SizeAdjustPolicy.AdjustToContents)
+
+        for system_id in sorted(telemetry_hub.vehicles):
+            self.add_vehicle(system_id)
+        self.show_selected(telemetry_hub.selected_system or 0)
+
+        telemetry_hub.vehicle_added.connect(self.add_vehicle)
+        telemetry_hub.vehicle_removed.connect(self.remove_vehicle)
+        telemetry_hub.selected_vehicle_changed.connect(self.show_selected)
+        self.activated.connect(self.on_activated)
+
+    def add_vehicle(self, system_id):
+        vehicle = self.telemetry_hub.vehicle(system_id)
+        if vehicle is None or self.findData(system_id) >= 0:
+            return
+        label = f"{vehicle.name} ({vehicle.link.connection_string})"
+        # Keep the list ordered by system id
+        row = 0
+        while row < self.count() and self.itemData(row) < system_id:
+            row += 1
+        self.insertItem(row, label, system_id)
+
+    def remove_vehicle(self, system_id):
+        row = self.findData(system_id)
+        if row >= 0:
+            self.removeItem(row)
+
+    def show_selected(self, system_id):
+        self.blockSignals(True)
+        self.setCurrentIndex(self.findData(system_id) if system_id else -1)
+        self.blockSignals(False)
+
+    def on_activated(self, row):
+        self.telemetry_hub.select_vehicle(self.itemData(row))
@@ -0,0 +1,134 @@
+import queue, threading, time
+import cv2
+from logger import logger
+
+# Display name -> (fourcc, container extension)
+RECORDING_CODECS = {
+    "MJPG (.avi)": ("MJPG", ".avi"),
+    "XVID (.avi)": ("XVID", ".avi"),
+    "MPEG-4 (.mp4)": ("mp4v", ".mp4"),
+    "H.264 (.mp4)": ("avc1", ".mp4"),
+}
+DEFAULT_CODEC = "MJPG (.avi)"
+
+# What to do when the encoder falls behind and the queue is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+# Memory the frames waiting for the encoder may hold, whatever the resolution; the queue takes as many
+# BGR frames as fit, at least MIN_QUEUE_FRAMES and at most the recorder's queue_size
+QUEUE_BYTES = 256 * 1024 * 1024
+MIN_QUEUE_FRAMES = 2
+
+# Used when neither the stream nor the measurement gives a usable frame rate
+FALLBACK_FPS = 30.0
+
+class VideoRecorder:
+    def __init__(self, base_path, frame_size, fps, codec=DEFAULT_CODEC, queue_size=64, drop_policy=DROP_OLDEST,
+                 queue_bytes=QUEUE_BYTES):
+        if codec not in RECORDING_CODECS:
+            raise ValueError(f"Unknown recording codec: {codec}")
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+
+        fourcc, extension = RECORDING_CODECS[codec]
+        self.video_path = base_path + extension
+        # Per-frame capture timestamps for syncing footage with telemetry
+        self.timestamps_path = base_path + ".frames.csv"
+        self.frame_size = frame_size
+        self.fps = fps if fps and fps > 0 else FALLBACK_FPS
+        self.fourcc = fourcc
+        self.drop_policy = drop_policy
+
+        frame_bytes = frame_size[0] * frame_size[1] * 3
+        self.frames = queue.Queue(maxsize=max(MIN_QUEUE_FRAMES, min(queue_size, queue_bytes // frame_bytes)))
+        self.thread = None
+        # Optional callable(frame) -> frame run on the encoder thread before writing, e.g. the display adjustments
+        self.frame_filter = None
+        self.submitted_frames = 0
+        self.written_frames = 0
+        self.dropped_frames = 0
+        self.error = None
+
+    def start(self):
+        writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.frame_size)
+        if not writer.isOpened():
+            raise RuntimeError(f"Could not open {self.video_path} for writing with codec {self.fourcc}.")
+
+        self.thread = threading.Thread(target=self.encode_loop, args=(writer,), name="VideoRecorder", daemon=True)
+        self.thread.start()
+        logger.info(f"Recording to {self.video_path} at {self.fps:.2f} FPS ({self.fourcc}).")
+
+    def submit(self, frame, timestamp):
+        # Never blocks the caller; the drop policy decides which frame is lost when full
+        self.submitted_frames += 1
+        try:
+            self.frames.put_nowait((frame, timestamp))
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy == DROP_NEWEST:
+            self.dropped_frames += 1
+            return False
+
+        try:
+            self.frames.get_nowait()
+            self.dropped_frames += 1
+        except queue.Empty:
+            pass
+        try:
+            self.frames.put_nowait((frame, timestamp))
+            return True
+        except queue.Full:
+            self.dropped_frames += 1
+            return False
+
+    def encode_loop(self, writer):
+        try:
+            with open(self.timestamps_path, "w") as timestamps_file:
+                timestamps_file.write("frame,capture_monotonic_s,wall_clock_s\n")
+                # Offset to turn monotonic capture times into wall clock times
+                wall_offset = time.time() - time.monotonic()
+                while True:
+                    item = self.frames.get()
+                    if item is None:
+                        break
+                    frame, timestamp = item
+                    frame_filter = self.frame_filter
+                    if frame_filter is not None:
+                        frame = frame_filter(frame)
+                    if (frame.shape[1], frame.shape[0]) != self.frame_size:
+                        frame = cv2.resize(frame, self.frame_size)
+                    writer.write(frame)
+                    timestamps_file.write(f"{self.written_frames},{timestamp:.6f},{timestamp + wall_offset:.6f}\n")
+                    self.written_frames += 1
+        except Exception as e:
+            self.error = str(e)
+            logger.exception(f"Recording to {self.video_path} failed: {e}")
+        finally:
+            writer.release()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        # Queue the end marker behind the frames still waiting to be encoded,
+        # without hanging if the encoder thread already died
+        while self.thread.is_alive():
+            try:
+                self.frames.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        self.thread = None
+        logger.info(f"Recording stopped: {self.written_frames} frames written, "
+                    f"{self.dropped_frames} dropped, saved to {self.video_path}.")
+
+def choose_recording_fps(declared_fps, measured_fps):
+    # Prefer what the stream declares, else what we actually measure
+    if declared_fps and 1.0 <= declared_fps <= 240.0:
+        return declared_fps
+    if measured_fps and measured_fps >= 1.0:
+        return measured_fps
+    return FALLBACK_FPS
@@ -0,0 +1,265 @@
+import json, math
+import numpy as np
+from pymavlink import mavutil
+
+mavlink = mavutil.mavlink
+
+WAYPOINT_DTYPE = np.dtype([
+    ("latitude", np.float64),
+    ("longitude", np.float64),
+    ("altitude", np.float64),
+    ("command", np.uint16),
+    ("frame", np.uint8),
+    ("autocontinue", np.uint8),
+    ("param1", np.float64),
+    ("param2", np.float64),
+    ("param3", np.float64),
+    ("param4", np.float64),
+])
+
+# Mission page types <-> MAVLink navigation commands
+MISSION_TYPE_COMMANDS = {
+    "Takeoff": mavlink.MAV_CMD_NAV_TAKEOFF,
+    "Flight": mavlink.MAV_CMD_NAV_WAYPOINT,
+    "Land": mavlink.MAV_CMD_NAV_LAND,
+}
+COMMAND_MISSION_TYPES = {command: mission_type for mission_type, command in MISSION_TYPE_COMMANDS.items()}
+
+DEFAULT_FRAME = mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT
+
+QGC_WPL_HEADER = "QGC WPL 110"
+
+def mavlink_float(value):
+    # MAVLink floats are 32-bit: the shortest decimal that round-trips, so 50.3 stays 50.3 instead of
+    # 50.29999923706055 in the table and exported files
+    return float(str(np.float32(value)))
+
+EARTH_RADIUS_M = 6371008.8
+
+def make_waypoints(latitudes, longitudes, altitudes, commands=mavlink.MAV_CMD_NAV_WAYPOINT, frame=DEFAULT_FRAME,
+                   param1=0.0, param2=0.0, param3=0.0, param4=0.0, autocontinue=1):
+    # Build a structured block from columns; scalars are broadcast to every row
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    records = np.zeros(latitudes.shape[0], dtype=WAYPOINT_DTYPE)
+    records["latitude"] = latitudes
+    records["longitude"] = longitudes
+    records["altitude"] = altitudes
+    records["command"] = commands
+    records["frame"] = frame
+    records["autocontinue"] = autocontinue
+    records["param1"] = param1
+    records["param2"] = param2
+    records["param3"] = param3
+    records["param4"] = param4
+    return records
+
+def make_waypoint(latitude, longitude, altitude, mission_type):
+    return make_waypoints([latitude], [longitude], [altitude], MISSION_TYPE_COMMANDS[mission_type])
+
+def mission_type_name(command):
+    # Commands the mission page does not model are shown by number
+    return COMMAND_MISSION_TYPES.get(int(command), f"Command {int(command)}")
+
+
+class WaypointStore:
+    def __init__(self, records=None, capacity=64):
+        count = 0 if records is None else len(records)
+        self.records = np.zeros(max(capacity, count), dtype=WAYPOINT_DTYPE)
+        self.size = 0
+        if count:
+            self.records[:count] = records
+            self.size = count
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def data(self):
+        # View of the valid rows; column access like store.data["altitude"] is free
+        return self.records[:self.size]
+
+    def copy(self):
+        return WaypointStore(self.data.copy())
+
+    def reserve(self, count):
+        if count <= len(self.records):
+            return
+        # Grow geometrically so repeated appends stay amortised O(1)
+        grown = np.zeros(max(count, len(self.records) * 2), dtype=WAYPOINT_DTYPE)
+        grown[:self.size] = self.data
+        self.records = grown
+
+    def clear(self):
+        self.size = 0
+
+    def insert(self, row, records):
+        records = np.asarray(records, dtype=WAYPOINT_DTYPE)
+        count = len(records)
+        if count == 0:
+            return
+        if not 0 <= row <= self.size:
+            raise IndexError(f"Insert position {row} out of range.")
+        self.reserve(self.size + count)
+        # Shift the tail once, then drop the block in
+        self.records[row + count:self.size + count] = self.records[row:self.size]
+        self.records[row:row + count] = records
+        self.size += count
+
+    def append(self, records):
+        self.insert(self.size, records)
+
+    def delete(self, rows):
+        if isinstance(rows, range) and rows.step == 1:
+            # A contiguous block: shift the rows below it up in one copy instead of masking the whole store
+            first, stop = max(rows.start, 0), min(rows.stop, self.size)
+            if stop > first:
+                self.records[first:self.size - (stop - first)] = self.records[stop:self.size]
+                self.size -= stop - first
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[np.asarray(rows, dtype=np.intp)] = False
+        remaining = self.data[keep]
+        self.records[:len(remaining)] = remaining
+        self.size = len(remaining)
+
+    def move(self, first, last, destination):
+        # Move rows first..last so the block starts at destination
+        block = self.records[first:last + 1].copy()
+        rest = np.delete(self.data, np.arange(first, last + 1))
+        self.records[:self.size] = np.concatenate((rest[:destination], block, rest[destination:]))
+
+    def reorder(self, order):
+        # New row order as a permutation of the current rows
+        self.records[:self.size] = self.data[np.asarray(order, dtype=np.intp)]
+
+    def set_row(self, row, **fields):
+        if not 0 <= row < self.size:
+            raise IndexError(f"Waypoint {row} out of range.")
+        for name, value in fields.items():
+            self.records[name][row] = value
+
+    def row_slice(self, rows):
+        return slice(0, self.size) if rows is None else rows
+
+    def invalid_rows(self):
+        # Vectorised range checks over every row at once
+        data = self.data
+        bad = ((data["latitude"] < -90.0) | (data["latitude"] > 90.0)
+               | (data["longitude"] < -180.0) | (data["longitude"] > 180.0)
+               | ~np.isfinite(data["latitude"]) | ~np.isfinite(data["longitude"])
+               | ~np.isfinite(data["altitude"]))
+        return np.flatnonzero(bad)
+
+    def validate(self):
+        bad = self.invalid_rows()
+        if len(bad):
+            shown = ", ".join(str(row + 1) for row in bad[:10])
+            more = "" if len(bad) <= 10 else f" and {len(bad) - 10} more"
+            raise ValueError(f"Invalid coordinates in waypoint(s) {shown}{more}.")
+
+    def offset_altitude(self, delta, rows=None):
+        self.records["altitude"][self.row_slice(rows)] += delta
+
+    def translate(self, north_m, east_m, rows=None):
+        # Shift by a fixed distance on the ground; east offsets scale with latitude
+        selected = self.row_slice(rows)
+        latitudes = self.records["latitude"][selected]
+        self.records["longitude"][selected] += np.degrees(east_m / (EARTH_RADIUS_M * np.cos(np.radians(latitudes))))
+        self.records["latitude"][selected] += math.degrees(north_m / EARTH_RADIUS_M)
+
+    def reverse(self, first=0, last=None):
+        last = self.size - 1 if last is None else last
+        self.records[first:last + 1] = self.records[first:last + 1][::-1].copy()
+
+
+# QGC WPL 110: header line, then one tab separated line per item:
+# index current frame command param1 param2 param3 param4 x y z autocontinue
+def read_qgc_wpl(path):
+    with open(path) as f:
+        header = f.readline().strip()
+        if not header.startswith("QGC WPL"):
+            raise ValueError(f"{path} is not a QGC WPL mission file.")
+        table = np.loadtxt(f, dtype=np.float64, ndmin=2)
+    if table.size == 0:
+        return WaypointStore()
+    if table.shape[1] != 12:
+        raise ValueError(f"{path} has {table.shape[1]} columns per item, expected 12.")
+    records = make_waypoints(table[:, 8], table[:, 9], table[:, 10], table[:, 3].astype(np.uint16),
+                             table[:, 2].astype(np.uint8), table[:, 4], table[:, 5], table[:, 6], table[:, 7],
+                             table[:, 11].astype(np.uint8))
+    return WaypointStore(records)
+
+def write_qgc_wpl(store, path):
+    data = store.data
+    with open(path, "w") as f:
+        f.write(QGC_WPL_HEADER + "\n")
+        # Written line by line so huge missions are never held as one string; altitude and params at full
+        # precision (shortest round-trip repr) so the file reads back exactly what was entered
+        for seq, row in enumerate(data.tolist()):
+            latitude, longitude, altitude, command, frame, autocontinue, param1, param2, param3, param4 = row
+            f.write(f"{seq}\t{1 if seq == 0 else 0}\t{frame}\t{command}\t"
+                    f"{param1!r}\t{param2!r}\t{param3!r}\t{param4!r}\t"
+                    f"{latitude:.8f}\t{longitude:.8f}\t{altitude!r}\t{autocontinue}\n")
+
+# QGroundControl .plan JSON, simple items only
+def read_plan(path):
+    with open(path) as f:
+        plan = json.load(f)
+    if plan.get("fileType") != "Plan":
+        raise ValueError(f"{path} is not a QGroundControl plan file.")
+
+    items = [item for item in plan.get("mission", {}).get("items", []) if item.get("type") == "SimpleItem"]
+    if not items:
+        return WaypointStore()
+    params = np.array([[float("nan") if value is None else value for value in item["params"]] for item in items],
+                      dtype=np.float64)
+    records = make_waypoints(params[:, 4], params[:, 5], params[:, 6],
+                             [item["command"] for item in items], [item["frame"] for item in items],
+                             params[:, 0], params[:, 1], params[:, 2], params[:, 3],
+                             [1 if item.get("autoContinue", True) else 0 for item in items])
+    return WaypointStore(records)
+
+def plan_number(value):
+    # QGroundControl writes unset parameters as null rather than NaN
+    value = float(value)
+    return None if math.isnan(value) else value
+
+def write_plan(store, path, home=None):
+    data = store.data
+    if home is None:
+        home = [float(data["latitude"][0]), float(data["longitude"][0]), 0] if len(data) else [0, 0, 0]
+
+    with open(path, "w") as f:
+        f.write('{"fileType": "Plan", "groundStation": "BlackBird Ground Station", "version": 1,\n')
+        f.write(' "geoFence": {"circles": [], "polygons": [], "version": 2},\n')
+        f.write(' "rallyPoints": {"points": [], "version": 2},\n')
+        f.write(' "mission": {"version": 2, "firmwareType": 0, "vehicleType": 2, "cruiseSpeed": 15,'
+                ' "hoverSpeed": 5, "plannedHomePosition": ' + json.dumps(home) + ', "items": [\n')
+        # Items are streamed one per line instead of building the whole document in memory
+        for seq, row in enumerate(data.tolist()):
+            latitude, longitude, altitude, command, frame, autocontinue, param1, param2, param3, param4 = row
+            item = {
+                "type": "SimpleItem",
+                "autoContinue": bool(autocontinue),
+                "command": command,
+                "doJumpId": seq + 1,
+                "frame": frame,
+                "params": [plan_number(value) for value in
+                           (param1, param2, param3, param4, latitude, longitude, altitude)],
+                "Altitude": altitude,
+                "AltitudeMode": 1,
+                "AMSLAltAboveTerrain": None,
+            }
+            f.write("  " + json.dumps(item) + (",\n" if seq < len(data) - 1 else "\n"))
+        f.write(" ]}}\n")
+
+def load_mission_file(path):
+    if path.lower().endswith(".plan"):
+        return read_plan(path)
+    return read_qgc_wpl(path)
+
+def save_mission_file(store, path):
+    if path.lower().endswith(".plan"):
+        write_plan(store, path)
+    else:
+        write_qgc_wpl(store, path)